@@ -0,0 +1,140 @@
+# bench_copy.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Benchmark copying a directory tree with `copy_tree` against `shutil.copytree`.
+
+Run with `python -m hyperplane.devel.bench_copy`.
+Pass `--dir` to create the tree on a specific file system, such as btrfs or XFS,
+where files are cloned instead of copied.
+Before that, it checks that copies the kernel stops partway are finished
+correctly by the next way of copying.
+"""
+import argparse
+import errno
+import os
+import random
+import shutil
+import tempfile
+from pathlib import Path
+from time import perf_counter
+from unittest import mock
+
+from hyperplane.utils import fast_copy
+from hyperplane.utils.fast_copy import copy_file, copy_tree
+
+# Bytes copy_file_range copies before stopping in `check_partial_copies`
+PARTIAL_SIZE = 1000
+
+
+def build_tree(
+    root: Path, n_files: int, size: int, n_large: int, rng: random.Random
+) -> None:
+    """Creates `n_files` small files of about `size` bytes and `n_large` 64 MiB ones."""
+    for index in range(n_files):
+        directory = root / f"album {index // 100}"
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"photo {index}.jpg").write_bytes(
+            rng.randbytes(rng.randint(size // 2, size * 3 // 2))
+        )
+
+    for index in range(n_large):
+        (root / f"video {index}.mp4").write_bytes(os.urandom(64 * 1024 * 1024))
+
+    (root / "latest").symlink_to(root / "album 0")
+
+
+def check_partial_copies(root: Path) -> None:
+    """Checks copies where copy_file_range stops early, with and without sendfile."""
+    src = root / "partial"
+    src.write_bytes(os.urandom(PARTIAL_SIZE * 5))
+
+    copy_file_range = os.copy_file_range
+
+    def stop_early(*args: int) -> int:
+        # Offsets are the last two arguments
+        return copy_file_range(*args) if args[-1] < PARTIAL_SIZE else 0
+
+    def fail_early(*args: int) -> int:
+        if args[-1] < PARTIAL_SIZE:
+            return copy_file_range(*args)
+
+        raise OSError(errno.EINVAL, os.strerror(errno.EINVAL))
+
+    def no_sendfile(*_args: int) -> int:
+        raise OSError(errno.ENOSYS, os.strerror(errno.ENOSYS))
+
+    for name, partial, sendfile in (
+        ("stop", stop_early, os.sendfile),
+        ("fail", fail_early, os.sendfile),
+        ("stop-no-sendfile", stop_early, no_sendfile),
+    ):
+        dst = root / f"partial-{name}"
+
+        with (
+            mock.patch.object(fast_copy, "FICLONE", 0),
+            mock.patch.object(
+                os,
+                "copy_file_range",
+                # Stop after the first chunk either way
+                lambda src_fd, dst_fd, count, src_off, dst_off: partial(
+                    src_fd, dst_fd, min(count, PARTIAL_SIZE), src_off, dst_off
+                ),
+            ),
+            mock.patch.object(os, "sendfile", sendfile),
+        ):
+            copy_file(src, dst)
+
+        assert dst.read_bytes() == src.read_bytes(), f"Partial copy {name} is wrong"
+
+    print("Partial copies are finished correctly\n")
+
+
+def main() -> None:
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=256 * 1024)
+    parser.add_argument("--large", type=int, default=2)
+    parser.add_argument("--dir", type=Path, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        root = Path(tmp)
+        check_partial_copies(root)
+
+        build_tree(
+            root / "src", args.files, args.size, args.large, random.Random(args.seed)
+        )
+
+        start = perf_counter()
+        shutil.copytree(root / "src", root / "shutil", symlinks=True)
+        shutil_time = perf_counter() - start
+
+        start = perf_counter()
+        copy_tree(root / "src", root / "fast")
+        fast_time = perf_counter() - start
+
+        print(f"{'shutil':>9} {'fast':>9}")
+        print(f"{shutil_time * 1000:>7.1f}ms {fast_time * 1000:>7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
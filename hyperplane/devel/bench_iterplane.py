@@ -0,0 +1,166 @@
+# bench_iterplane.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Benchmark the bitset tag walk against the previous dictionary-based one.
+
+Run with `python -m hyperplane.devel.bench_iterplane`.
+"""
+import argparse
+import random
+import tempfile
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Generator, Iterable
+
+from hyperplane.utils.tag_masks import walk_planes
+
+
+def legacy_iterplane(
+    root: Path, all_tags: list[str], filter_tags: Iterable[str]
+) -> Generator:
+    """The walk `iterplane` used before tags were interned to bits."""
+    tags = {tag: tag in filter_tags for tag in all_tags}
+
+    yield from __legacy_walk(root, tags)
+
+
+def __legacy_walk(node: Path, tags: dict[str, bool]) -> Generator:
+    if tags.get(node.name):
+        tags.pop(node.name)
+
+    if not sum(tags.values()):
+        yield node
+
+    for child in node.iterdir():
+        if not child.is_dir():
+            continue
+        new_tags = tags.copy()
+        for tag, value in tags.copy().items():
+            if not value:
+                if child.name == tag:
+                    new_tags[tag] = True
+                    yield from __legacy_walk(child, new_tags.copy())
+            else:
+                if child.name == tag:
+                    yield from __legacy_walk(child, new_tags.copy())
+                else:
+                    break
+
+
+def build_tree(
+    root: Path, n_dirs: int, tags: list[str], rng: random.Random
+) -> list[tuple[str, ...]]:
+    """
+    Creates `n_dirs` directories below `root`, most of them named after tags.
+
+    Returns the tags of each directory named after a tag.
+    """
+    queue = [(root, ())]
+    tagged = []
+    created = 0
+
+    while queue and created < n_dirs:
+        node, parts = queue.pop(0)
+
+        for _ in range(rng.randint(1, 6)):
+            if created >= n_dirs:
+                break
+
+            # Some directories are not tags at all
+            if rng.random() < 0.1:
+                (node / f"folder {created}").mkdir()
+                created += 1
+                continue
+
+            # Most directories are named after a handful of popular tags
+            name = tags[min(int(rng.expovariate(0.2)), len(tags) - 1)]
+            if name in parts or (child := node / name).exists():
+                continue
+
+            child.mkdir()
+            created += 1
+            queue.append((child, parts + (name,)))
+            tagged.append(parts + (name,))
+
+        if not queue:
+            queue.append((root, ()))
+
+    return tagged
+
+
+def measure(func: Callable, repeat: int) -> tuple[float, list[Path]]:
+    """Returns the best time out of `repeat` runs and the result of `func`."""
+    best = float("inf")
+    result = []
+
+    for _ in range(repeat):
+        start = perf_counter()
+        result = list(func())
+        best = min(best, perf_counter() - start)
+
+    return best, result
+
+
+def main() -> None:
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=(1000, 10000, 100000))
+    parser.add_argument("--tags", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    tags = [f"Tag {index}" for index in range(args.tags)]
+
+    print(f"{'directories':>12} {'filter':>16} {'planes':>7} {'dict':>9} {'bitset':>9}")
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            tagged = build_tree(root, size, tags, rng)
+
+            for n_filter_tags in (1, 2, 3):
+                # Filter for tags that are actually used together
+                filter_tags = rng.sample(
+                    rng.choice(
+                        tuple(parts for parts in tagged if len(parts) >= n_filter_tags)
+                    ),
+                    n_filter_tags,
+                )
+
+                legacy_time, legacy_planes = measure(
+                    lambda: legacy_iterplane(root, tags, filter_tags), args.repeat
+                )
+                bitset_time, bitset_planes = measure(
+                    lambda: walk_planes(root, tags, filter_tags), args.repeat
+                )
+
+                if legacy_planes != bitset_planes:
+                    raise AssertionError(f"Results differ for {filter_tags}")
+
+                print(
+                    f"{size:>12} {n_filter_tags:>9} tag(s) {len(bitset_planes):>7} "
+                    f"{legacy_time * 1000:>7.1f}ms {bitset_time * 1000:>7.1f}ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# bench_name_index.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Benchmark searching the name index against scanning every name.
+
+Run with `python -m hyperplane.devel.bench_name_index`.
+Like in the app, the index stops at `--limit` results while the scan doesn't.
+"""
+import argparse
+import random
+import string
+from time import perf_counter
+
+from hyperplane.utils.name_blocks import BLOCK_SIZE, NameBlock, search_blocks
+
+QUERIES = ("report", "2023", "IMG_", "abc", "notes.txt", "qzx")
+
+
+def build_dirs(n_names: int, rng: random.Random) -> list[tuple[str, int, list[str]]]:
+    """Creates directories with `n_names` names in total, like in a home directory."""
+    words = ("report", "notes", "IMG_", "draft", "invoice", "backup", "2023", "song")
+    extensions = (".txt", ".jpg", ".pdf", ".odt", ".flac", "")
+    dirs = []
+
+    while n_names > 0:
+        names = [
+            rng.choice(words)
+            + "".join(rng.choices(string.ascii_letters + string.digits, k=8))
+            + rng.choice(extensions)
+            for _index in range(min(n_names, rng.randint(1, 200)))
+        ]
+        dirs.append((f"dir {len(dirs) // 100}/sub {len(dirs)}", 0, names))
+        n_names -= len(names)
+
+    return dirs
+
+
+def main() -> None:
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--names", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    dirs = build_dirs(args.names, random.Random(args.seed))
+
+    start = perf_counter()
+    blocks = []
+    batch = []
+    for directory in dirs:
+        batch.append(directory)
+
+        if sum(len(names) for _path, _mtime, names in batch) >= BLOCK_SIZE:
+            blocks.append(NameBlock(batch))
+            batch = []
+
+    if batch:
+        blocks.append(NameBlock(batch))
+
+    print(f"Built {len(blocks)} blocks in {perf_counter() - start:.1f}s\n")
+
+    print(f"{'query':>10} {'results':>8} {'scan':>9} {'index':>9}")
+    for query in QUERIES:
+        start = perf_counter()
+        scanned = [
+            (path, name)
+            for path, _mtime, names in dirs
+            for name in names
+            if query.lower() in name.lower()
+        ]
+        scan_time = perf_counter() - start
+
+        start = perf_counter()
+        found = search_blocks(blocks, query, "", args.limit)
+        index_time = perf_counter() - start
+
+        assert len(found) == min(len(scanned), args.limit)
+        assert set(found) <= set(scanned)
+
+        print(
+            f"{query:>10} {len(found):>8} "
+            f"{scan_time * 1000:>7.1f}ms {index_time * 1000:>7.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
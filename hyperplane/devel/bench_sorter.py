@@ -0,0 +1,261 @@
+# bench_sorter.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+"""
+Benchmark sorting with cached sort keys against the previous comparison for every sort mode.
+
+Run with `python -m hyperplane.devel.bench_sorter`.
+"""
+import argparse
+import random
+from locale import strcoll
+from time import perf_counter
+from typing import Optional
+
+from gi.repository import Gio, GLib, Gtk
+
+from hyperplane import shared
+from hyperplane.item_sorter import HypItemSorter
+from hyperplane.utils.item_keys import ItemKeyStore
+
+SORT_MODES = ("a-z", "modified", "created", "size", "type")
+CONTENT_TYPES = (
+    "inode/directory",
+    "text/plain",
+    "image/png",
+    "image/jpeg",
+    "audio/mpeg",
+    "application/pdf",
+)
+
+
+class LegacyItemSorter(Gtk.Sorter):
+    """The sorter from before sort keys were cached."""
+
+    __gtype_name__ = "HypBenchLegacyItemSorter"
+
+    def do_compare(
+        self,
+        file_info1: Optional[Gio.FileInfo] = None,
+        file_info2: Optional[Gio.FileInfo] = None,
+    ) -> int:
+        """The comparison `HypItemSorter` did before sort keys were cached."""
+        if (not file_info1) or (not file_info2):
+            return Gtk.Ordering.EQUAL
+
+        # Always sort trashed items by deletion date
+        if (
+            (
+                gfile1 := file_info1.get_attribute_object("standard::file")
+            ).get_uri_scheme()
+            == "trash"
+            # Only if the trashed file is at the toplevel of the trash
+            and gfile1.get_uri().count("/") < 4
+        ):
+            if (not (deletion_date1 := file_info1.get_deletion_date())) or (
+                not (deletion_date2 := file_info2.get_deletion_date())
+            ):
+                return Gtk.Ordering.EQUAL
+
+            return self.__ordering_from_cmpfunc(
+                GLib.DateTime.compare(deletion_date2, deletion_date1)
+            )
+
+        # Always sort recent items by date
+        if (
+            file_info1.get_attribute_object("standard::file").get_uri_scheme()
+            == "recent"
+        ):
+            try:
+                recent_info1 = shared.recent_manager.lookup_item(
+                    file_info1.get_attribute_string(
+                        Gio.FILE_ATTRIBUTE_STANDARD_TARGET_URI
+                    )
+                )
+                recent_info2 = shared.recent_manager.lookup_item(
+                    file_info2.get_attribute_string(
+                        Gio.FILE_ATTRIBUTE_STANDARD_TARGET_URI
+                    )
+                )
+            except GLib.Error:
+                pass
+            else:
+                return self.__ordering_from_cmpfunc(
+                    GLib.DateTime.compare(
+                        recent_info2.get_modified(), recent_info1.get_modified()
+                    )
+                )
+
+        if shared.schema.get_boolean("folders-before-files"):
+            if folders := self.__sort_folders_before_files(file_info1, file_info2):
+                return folders
+
+        name1 = file_info1.get_display_name()
+        name2 = file_info2.get_display_name()
+
+        # Sort dot-prefixed files last
+        if name1.startswith("."):
+            if not name2.startswith("."):
+                return Gtk.Ordering.LARGER
+        elif name2.startswith("."):
+            return Gtk.Ordering.SMALLER
+
+        match shared.sort_by:
+            case "a-z":
+                return self.__ordering_from_cmpfunc(strcoll(name1, name2))
+
+            case "modified":
+                mod1 = file_info1.get_modification_date_time()
+                mod2 = file_info2.get_modification_date_time()
+
+                if mod1 and mod2:
+                    return self.__ordering_from_cmpfunc(mod2.compare(mod1))
+
+            case "created":
+                created1 = file_info1.get_creation_date_time()
+                created2 = file_info2.get_creation_date_time()
+
+                if created1 and created2:
+                    return self.__ordering_from_cmpfunc(created2.compare(created1))
+
+            case "size":
+                # No fast way to calculate size for folders so assume they're always bigger
+                if folders := self.__sort_folders_before_files(file_info1, file_info2):
+                    return folders
+
+                size1 = file_info1.get_size()
+                size2 = file_info2.get_size()
+
+                if size2 and size1:
+                    if size1 == size2:
+                        return Gtk.Ordering.EQUAL
+
+                    return self.__ordering_from_cmpfunc((int(size1 < size2) * 2) - 1)
+
+            case "type":
+                type1 = file_info1.get_content_type()
+                type2 = file_info2.get_content_type()
+
+                if type1 and type2:
+                    return self.__ordering_from_cmpfunc(strcoll(type2, type1))
+
+        # Fall back to A-Z
+        return self.__ordering_from_cmpfunc(strcoll(name1, name2))
+
+    def __ordering_from_cmpfunc(self, cmpfunc_result: int) -> Gtk.Ordering:
+        # https://gitlab.gnome.org/GNOME/gtk/-/issues/6298
+        return Gtk.Ordering(
+            ((cmpfunc_result > 0) - (cmpfunc_result < 0))
+            * (-1 if shared.sort_reversed else 1)
+        )
+
+    def __sort_folders_before_files(
+        self, file_info1: Gio.FileInfo, file_info2: Gio.FileInfo
+    ) -> Gtk.Ordering:
+        dir1 = file_info1.get_content_type() == "inode/directory"
+        dir2 = file_info2.get_content_type() == "inode/directory"
+
+        if dir1:
+            if not dir2:
+                return Gtk.Ordering.SMALLER
+        elif dir2:
+            return Gtk.Ordering.LARGER
+
+        return None
+
+
+def build_infos(n_items: int, rng: random.Random) -> Gio.ListStore:
+    """Creates a list store of `n_items` file infos with random attributes."""
+    store = Gio.ListStore.new(Gio.FileInfo)
+    parent = Gio.File.new_for_path(str(shared.home_path))
+    now = int(GLib.DateTime.new_now_utc().to_unix())
+
+    infos = []
+    for index in range(n_items):
+        name = (
+            f"{'.' if rng.random() < 0.05 else ''}file {rng.randrange(n_items)} {index}"
+        )
+
+        file_info = Gio.FileInfo.new()
+        file_info.set_display_name(name)
+        file_info.set_content_type(rng.choice(CONTENT_TYPES))
+        file_info.set_size(rng.randrange(1 << 30))
+        file_info.set_attribute_object("standard::file", parent.get_child(name))
+        file_info.set_modification_date_time(
+            GLib.DateTime.new_from_unix_utc(now - rng.randrange(1 << 25))
+        )
+        file_info.set_attribute_uint64(
+            Gio.FILE_ATTRIBUTE_TIME_CREATED, now - rng.randrange(1 << 25)
+        )
+        infos.append(file_info)
+
+    store.splice(0, 0, infos)
+    return store
+
+
+def measure(store: Gio.ListStore, sorter: Gtk.Sorter) -> float:
+    """Returns the time it takes `sorter` to sort `store` twice, cold then warm."""
+    start = perf_counter()
+
+    sort_list = Gtk.SortListModel.new(store, sorter)
+    sort_list.get_item(0)
+
+    # A second pass, like after toggling reverse order
+    sorter.changed(Gtk.SorterChange.INVERTED)
+    sort_list.get_item(0)
+
+    return perf_counter() - start
+
+
+def main() -> None:
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, nargs="+", default=(10000, 200000))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    sort_by = shared.sort_by
+
+    print(f"{'items':>8} {'sort by':>9} {'legacy':>10} {'cached':>10}")
+
+    try:
+        for n_items in args.items:
+            store = build_infos(n_items, rng)
+
+            for mode in SORT_MODES:
+                shared.sort_by = mode
+
+                legacy_time = measure(store, LegacyItemSorter())
+
+                item_keys = ItemKeyStore()
+                item_keys.set_model(store)
+                cached_time = measure(store, HypItemSorter(item_keys))
+
+                print(
+                    f"{n_items:>8} {mode:>9} "
+                    f"{legacy_time * 1000:>8.0f}ms {cached_time * 1000:>8.0f}ms"
+                )
+    finally:
+        shared.sort_by = sort_by
+
+
+if __name__ == "__main__":
+    main()
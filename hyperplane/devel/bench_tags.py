@@ -0,0 +1,102 @@
+# bench_tags.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Benchmark the cost of `path_represents_tags` over a filter pass of a large directory.
+
+Run with `python -m hyperplane.devel.bench_tags`.
+"""
+import argparse
+import random
+from os import PathLike
+from pathlib import Path
+from time import perf_counter
+from typing import Callable
+
+from hyperplane import shared
+from hyperplane.utils.tags import path_represents_tags, tag_registry
+
+
+def legacy_path_represents_tags(path: PathLike | str) -> bool:
+    """The check `path_represents_tags` did before tags were cached."""
+    path = Path(path)
+
+    if path == shared.home_path:
+        return False
+
+    if not path.is_relative_to(shared.home_path):
+        return False
+
+    return all(part in shared.tags for part in path.relative_to(shared.home_path).parts)
+
+
+def filter_pass(func: Callable[[str], bool], paths: list[str]) -> float:
+    """Returns the time it takes to call `func` for every path in `paths`."""
+    start = perf_counter()
+
+    for path in paths:
+        func(path)
+
+    return perf_counter() - start
+
+
+def main() -> None:
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=50000)
+    parser.add_argument("--tags", type=int, default=300)
+    parser.add_argument("--passes", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    shared.tags = [f"Tag {index}" for index in range(args.tags)]
+    tag_registry.invalidate()
+
+    # A directory inside a tag with one entry in 10 named after a tag
+    parent = shared.home_path / shared.tags[0] / shared.tags[1]
+    paths = [
+        str(
+            parent
+            / (rng.choice(shared.tags[2:]) if rng.random() < 0.1 else f"file {index}")
+        )
+        for index in range(args.entries)
+    ]
+
+    if [legacy_path_represents_tags(path) for path in paths] != [
+        path_represents_tags(path) for path in paths
+    ]:
+        raise AssertionError("Results differ")
+
+    tag_registry.invalidate()
+
+    print(f"{'pass':>6} {'legacy':>9} {'cached':>9}")
+
+    for index in range(args.passes):
+        legacy_time = filter_pass(legacy_path_represents_tags, paths)
+        cached_time = filter_pass(path_represents_tags, paths)
+
+        print(
+            f"{index + 1:>6} {legacy_time * 1000:>7.1f}ms {cached_time * 1000:>7.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
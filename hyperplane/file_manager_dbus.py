@@ -26,6 +26,7 @@ from gi.repository import Gio, GLib
 
 from hyperplane import shared
 from hyperplane.properties import HypPropertiesDialog
+from hyperplane.utils.recursive_search import search_tags
 
 INTERFACE_DESC = """
 <node xmlns:doc="http://www.freedesktop.org/standards/dbus/1.0/introspect.dtd">
@@ -52,8 +53,33 @@ INTERFACE_DESC = """
 """
 
 
+# Searching tags, exported next to the file manager interface
+SEARCH_INTERFACE_DESC = """
+<node xmlns:doc="http://www.freedesktop.org/standards/dbus/1.0/introspect.dtd">
+  <interface name="org.freedesktop.DBus.Introspectable">
+    <method name="Introspect">
+      <arg name="data" direction="out" type="s"/>
+    </method>
+  </interface>
+  <interface name='page.kramo.Hyperplane.Search'>
+    <method name='SearchTags'>
+      <arg type='as' name='Tags' direction='in'/>
+      <arg type='s' name='Query' direction='in'/>
+      <arg type='b' name='Recursive' direction='in'/>
+      <arg type='as' name='URIs' direction='out'/>
+    </method>
+  </interface>
+</node>
+"""
+
 NAME = "org.freedesktop.FileManager1"
 PATH = "/org/freedesktop/FileManager1"
+SEARCH_PATH = "/page/kramo/Hyperplane/Search"
+# The interfaces exported at each object path
+INTERFACE_DESCS = {
+    PATH: INTERFACE_DESC,
+    SEARCH_PATH: SEARCH_INTERFACE_DESC,
+}
 
 
 class FileManagerDBusServer:
@@ -73,22 +99,23 @@ class FileManagerDBusServer:
         Gio.bus_unown_name(self._name_id)
 
     def __on_bus_acquired(self, connection: Gio.DBusConnection, _):
-        for interface in Gio.DBusNodeInfo.new_for_xml(INTERFACE_DESC).interfaces:
-            try:
-                connection.register_object(
-                    object_path=PATH,
-                    interface_info=interface,
-                    method_call_closure=self.__on_method_call,
-                )
-            except Exception:  # pylint: disable=broad-exception-caught
-                #  Another instance already exported at this path
-                return
+        for path, desc in INTERFACE_DESCS.items():
+            for interface in Gio.DBusNodeInfo.new_for_xml(desc).interfaces:
+                try:
+                    connection.register_object(
+                        object_path=path,
+                        interface_info=interface,
+                        method_call_closure=self.__on_method_call,
+                    )
+                except Exception:  # pylint: disable=broad-exception-caught
+                    #  Another instance already exported at this path
+                    return
 
     def __on_method_call(
         self,
         _connection: Gio.DBusConnection,
         _sender: str,
-        _object_path: str,
+        object_path: str,
         interface_name: str,
         method_name: str,
         parameters: GLib.Variant,
@@ -125,8 +152,14 @@ class FileManagerDBusServer:
                     properties = HypPropertiesDialog(gfile)
                     properties.present(win)
 
+            case "SearchTags":
+                self.__search_tags(invocation, *args)
+                return
+
             case "Introspect":
-                variant = GLib.Variant("(s)", (INTERFACE_DESC,))
+                variant = GLib.Variant(
+                    "(s)", (INTERFACE_DESCS.get(object_path, INTERFACE_DESC),)
+                )
                 invocation.return_value(variant)
                 return
 
@@ -137,3 +170,38 @@ class FileManagerDBusServer:
                 )
 
         invocation.return_value(None)
+
+    def __search_tags(
+        self,
+        invocation: Gio.DBusMethodInvocation,
+        tags: list[str],
+        query: str,
+        recursive: bool,
+    ) -> None:
+        if not (tags := [tag for tag in tags if tag in shared.tags]):
+            invocation.return_dbus_error(
+                "page.kramo.Hyperplane.Search.Error.NoSuchTags", "No such tags"
+            )
+            return
+
+        uris = []
+
+        def add_results(file_infos: list[Gio.FileInfo]) -> None:
+            uris.extend(
+                file_info.get_attribute_object("standard::file").get_uri()
+                for file_info in file_infos
+            )
+
+        def searched() -> None:
+            invocation.return_value(GLib.Variant("(as)", (uris,)))
+
+        # Nothing but the file is needed for the URIs
+        search_tags(
+            tags,
+            query,
+            Gio.FILE_ATTRIBUTE_STANDARD_NAME,
+            add_results,
+            searched,
+            shared.show_hidden,
+            recursive,
+        )
@@ -28,9 +28,16 @@ from gi.repository.GLib import idle_add
 from hyperplane import shared
 from hyperplane.file_properties import DOT_IS_NOT_EXTENSION
 from hyperplane.hover_page_opener import HypHoverPageOpener
+from hyperplane.utils.detail_loader import PENDING_DETAILS
 from hyperplane.utils.files import rm
+from hyperplane.utils.folder_previews import FolderPreview, folder_previews
 from hyperplane.utils.symbolics import get_color_for_symbolic, get_symbolic
-from hyperplane.utils.thumbnail import generate_thumbnail
+from hyperplane.utils.thumbnail import (
+    get_texture_size,
+    load_thumbnail,
+    texture_cache,
+    thumbnail_scheduler,
+)
 
 
 @Gtk.Template(resource_path=shared.PREFIX + "/gtk/item.ui")
@@ -69,6 +76,10 @@ class HypItem(Adw.Bin, HypHoverPageOpener):
     dragged_gfiles: dict[Gio.File, Gio.FileInfo] = {}
 
     gfile: Gio.File
+    cancellable: Optional[Gio.Cancellable] = None
+    # The sizes to decode thumbnails at for the current zoom level
+    texture_size: Optional[int] = None
+    dir_texture_size: Optional[int] = None
     is_dir: bool
     content_type: str
     extension: str
@@ -107,6 +118,7 @@ class HypItem(Adw.Bin, HypHoverPageOpener):
             "zoom", lambda _obj, zoom_level: self.__zoom(zoom_level)
         )
         shared.postmaster.connect("cut-uris-changed", self.__cut_uris_changed)
+        self.connect("notify::scale-factor", self.__update_texture_sizes)
 
         # Left-click
         def set_rubberband(*_args: Any) -> None:
@@ -194,6 +206,9 @@ class HypItem(Adw.Bin, HypHoverPageOpener):
         self.file_info = self.item.get_item()
         self.gfile = self.file_info.get_attribute_object("standard::file")
 
+        # Cancelled on unbind so work for the previous item doesn't reach this one
+        self.cancellable = Gio.Cancellable.new()
+
         self.__cut_uris_changed()
 
         self.gicon = get_symbolic(self.file_info.get_symbolic_icon())
@@ -227,23 +242,6 @@ class HypItem(Adw.Bin, HypHoverPageOpener):
             self.stem = self.full_name
             self.extension = None
             self.picture.set_content_fit(Gtk.ContentFit.FILL)
-
-            self.gfile.enumerate_children_async(
-                ",".join(
-                    (
-                        Gio.FILE_ATTRIBUTE_STANDARD_SYMBOLIC_ICON,
-                        Gio.FILE_ATTRIBUTE_STANDARD_CONTENT_TYPE,
-                        Gio.FILE_ATTRIBUTE_THUMBNAIL_PATH,
-                        Gio.FILE_ATTRIBUTE_STANDARD_NAME,
-                        Gio.FILE_ATTRIBUTE_STANDARD_IS_HIDDEN,
-                    )
-                ),
-                Gio.FileQueryInfoFlags.NONE,
-                GLib.PRIORITY_DEFAULT,
-                None,
-                self.__dir_children_cb,
-            )
-
         else:
             # Blacklist some MIME types from getting extension badges
             if self.content_type in DOT_IS_NOT_EXTENSION:
@@ -254,36 +252,62 @@ class HypItem(Adw.Bin, HypHoverPageOpener):
                 self.extension = Path(self.full_name).suffix[1:].upper()
             self.picture.set_content_fit(Gtk.ContentFit.COVER)
 
-            if thumbnail_path := self.file_info.get_attribute_byte_string(
-                Gio.FILE_ATTRIBUTE_THUMBNAIL_PATH
-            ):
-                try:
-                    texture = Gdk.Texture.new_from_filename(thumbnail_path)
-                except GLib.Error:
-                    texture = None
-
-                self.__thumbnail_cb(texture)
-            elif (
-                self.file_info.get_attribute_uint32(
-                    Gio.FILE_ATTRIBUTE_FILESYSTEM_USE_PREVIEW
-                )
-                != Gio.FilesystemPreviewType.NEVER
-            ):
-                GLib.Thread.new(
-                    None,
-                    generate_thumbnail,
-                    self.gfile,
-                    self.content_type,
-                    self.__thumbnail_cb,
-                )
-            else:
-                self.__thumbnail_cb()
+        self.__request_thumbnail()
 
         self.display_name = self.stem if self.zoom_level else self.full_name
         self.extension_label.set_visible(bool(self.extension))
 
     def unbind(self) -> None:
         """Cleanup after the object has been unbound from its item."""
+        if self.cancellable:
+            self.cancellable.cancel()
+            self.cancellable = None
+
+    def __request_thumbnail(self) -> None:
+        # Details of items on network shares come later and rebind the item
+        if self.file_info.get_attribute_boolean(PENDING_DETAILS):
+            self.__thumbnail_cb()
+            return
+
+        mtime = (
+            self.file_info.get_attribute_uint64(Gio.FILE_ATTRIBUTE_TIME_MODIFIED)
+            or None
+        )
+
+        if self.is_dir:
+            folder_previews.request(
+                self.gfile, mtime, self.__dir_previews_cb, self.cancellable
+            )
+            return
+
+        if thumbnail_path := self.file_info.get_attribute_byte_string(
+            Gio.FILE_ATTRIBUTE_THUMBNAIL_PATH
+        ):
+            self.__thumbnail_cb(
+                load_thumbnail(
+                    thumbnail_path, self.gfile.get_uri(), mtime, self.texture_size
+                )
+            )
+        elif texture := texture_cache.get(
+            (self.gfile.get_uri(), mtime, self.texture_size)
+        ):
+            self.__thumbnail_cb(texture)
+        elif (
+            self.file_info.get_attribute_uint32(
+                Gio.FILE_ATTRIBUTE_FILESYSTEM_USE_PREVIEW
+            )
+            != Gio.FilesystemPreviewType.NEVER
+        ):
+            thumbnail_scheduler.request(
+                self.gfile,
+                self.content_type,
+                self.__thumbnail_cb,
+                cancellable=self.cancellable,
+                mtime=mtime,
+                size=self.texture_size,
+            )
+        else:
+            self.__thumbnail_cb()
 
     def __drag_prepare(self, _src: Gtk.DragSource, _x: float, _y: float) -> None:
         self.__select_self(unselect_rest=False)
@@ -365,64 +389,29 @@ class HypItem(Adw.Bin, HypHoverPageOpener):
     ) -> None:
         self.page.view.set_enable_rubberband(True)
 
-    def __dir_children_cb(self, gfile: Gio.File, result: Gio.AsyncResult) -> None:
-        try:
-            files = gfile.enumerate_children_finish(result)
-        except GLib.Error:
+    def __dir_previews_cb(self, previews: Optional[list[FolderPreview]]) -> None:
+        if previews is None:
             self.__thumbnail_cb()
             return
 
-        def done(index) -> None:
-            for thumbnail_index in range(1, 4):
-                getattr(self, f"dir_thumbnail_{thumbnail_index}").set_visible(
-                    index + 1 >= thumbnail_index
-                )
-
-            self.__thumbnail_cb(open_folder=bool(index))
-
-        def next_files_cb(
-            enumerator: Gio.FileEnumerator, result: Gio.AsyncResult, index: int
-        ) -> None:
-            if index == 3:
-                done(index - 1)
-                return
+        for index in range(1, 4):
+            thumbnail = getattr(self, f"dir_thumbnail_{index}")
+            picture = getattr(self, f"dir_picture_{index}")
 
-            picture = getattr(self, f"dir_picture_{index + 1}")
+            # One more thumbnail than there are previews is shown, but at most 3
+            thumbnail.set_visible(min(len(previews), 2) + 1 >= index)
 
             try:
-                files_list = enumerator.next_files_finish(result)
-            except GLib.Error:
-                self.__dir_thumbnail_cb(None, picture)
-                done(index)
-                return
-
-            try:
-                file_info = files_list[0]
+                preview = previews[index - 1]
             except IndexError:
                 self.__dir_thumbnail_cb(None, picture)
-                done(index)
-                return
-
-            if not (content_type := file_info.get_content_type()):
-                self.__dir_thumbnail_cb(None, picture)
-                done(index)
-                return
-
-            if (not shared.show_hidden) and file_info.get_is_hidden():
-                self.__dir_thumbnail_cb(None, picture)
-                done(index)
-                return
-
-            thumbnail = getattr(self, f"dir_thumbnail_{index + 1}")
+                continue
 
-            index += 1
-            files.next_files_async(1, GLib.PRIORITY_DEFAULT, None, next_files_cb, index)
-
-            gicon = get_symbolic(file_info.get_symbolic_icon())
+            gicon = get_symbolic(preview.gicon)
 
             thumbnail.get_child().set_from_gicon(gicon)
 
-            if content_type == "inode/directory":
+            if preview.content_type == "inode/directory":
                 thumbnail.set_css_classes(
                     self.dir_thumb_init_classes
                     + ["light-blue-background", "white-icon"]
@@ -432,39 +421,46 @@ class HypItem(Adw.Bin, HypHoverPageOpener):
                     self.dir_icon_init_classes,
                 )
                 self.__dir_thumbnail_cb(None, picture)
-                return
+                continue
 
             thumbnail.set_css_classes(
                 self.dir_thumb_init_classes + ["white-background"]
             )
 
-            color = get_color_for_symbolic(content_type, gicon)
+            color = get_color_for_symbolic(preview.content_type, gicon)
 
             thumbnail.get_child().set_css_classes(
                 self.dir_icon_init_classes + [f"{color}-icon-light-only"]
             )
 
-            if thumbnail_path := file_info.get_attribute_byte_string(
-                Gio.FILE_ATTRIBUTE_THUMBNAIL_PATH
-            ):
+            uri = preview.gfile.get_uri()
+
+            if preview.thumbnail_path:
                 self.__dir_thumbnail_cb(
-                    Gdk.Texture.new_from_filename(thumbnail_path), picture
+                    load_thumbnail(
+                        preview.thumbnail_path,
+                        uri,
+                        preview.mtime,
+                        self.dir_texture_size,
+                    ),
+                    picture,
+                )
+            elif texture := texture_cache.get(
+                (uri, preview.mtime, self.dir_texture_size)
+            ):
+                self.__dir_thumbnail_cb(texture, picture)
+            else:
+                thumbnail_scheduler.request(
+                    preview.gfile,
+                    preview.content_type,
+                    self.__dir_thumbnail_cb,
+                    picture,
+                    cancellable=self.cancellable,
+                    mtime=preview.mtime,
+                    size=self.dir_texture_size,
                 )
-                return
-
-            child_gfile = gfile.get_child(file_info.get_name())
-
-            GLib.Thread.new(
-                None,
-                generate_thumbnail,
-                child_gfile,
-                content_type,
-                self.__dir_thumbnail_cb,
-                picture,
-            )
 
-        # TODO: Could be optimized if I called next_files with 3 the first time
-        files.next_files_async(1, GLib.PRIORITY_DEFAULT, None, next_files_cb, 0)
+        self.__thumbnail_cb(open_folder=bool(previews))
 
     def __dir_thumbnail_cb(
         self,
@@ -639,6 +635,28 @@ class HypItem(Adw.Bin, HypHoverPageOpener):
         else:
             self.icon.set_pixel_size(32)
 
+        self.__update_texture_sizes()
+
+    def __update_texture_sizes(self, *_args: Any) -> None:
+        scale = self.get_scale_factor()
+        texture_sizes = (
+            get_texture_size(max(self.thumbnail_overlay.get_size_request()) * scale),
+            get_texture_size(max(self.dir_thumbnail_1.get_size_request()) * scale),
+        )
+
+        if texture_sizes == (self.texture_size, self.dir_texture_size):
+            return
+
+        self.texture_size, self.dir_texture_size = texture_sizes
+
+        # Reload the thumbnails of bound items at the new size
+        if not self.cancellable:
+            return
+
+        self.cancellable.cancel()
+        self.cancellable = Gio.Cancellable.new()
+        self.__request_thumbnail()
+
     def __view_setup(self, *_args: Any) -> None:
         if shared.grid_view:
             self.box.set_orientation(Gtk.Orientation.VERTICAL)
@@ -17,70 +17,114 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+
 """Main filter for HypItemsPage."""
 from typing import Optional
 
-from gi.repository import Gio, GLib, Gtk
+from gi.repository import Gio, Gtk
 
 from hyperplane import shared
-from hyperplane.utils.tags import path_represents_tags
+from hyperplane.utils.item_keys import ItemKey, ItemKeyStore
+from hyperplane.utils.tags import path_represents_tags, tag_registry
 
 
 class HypItemFilter(Gtk.Filter):
-    """Main filter for HypItemsPage."""
+    """
+    Main filter for HypItemsPage.
+
+    Matching works on the `ItemKey`s of `item_keys`, and searches are evaluated
+    for all items at once when the search changes instead of item by item.
+    """
 
     __gtype_name__ = "HypItemFilter"
 
-    def __tag_filter(self, file_info: Gio.FileInfo) -> bool:
-        if not shared.tags:
-            return True
+    item_keys: ItemKeyStore
 
-        if file_info.get_content_type() != "inode/directory":
-            return True
+    # The search the items were last filtered for, set with `set_search`
+    query: str = ""
+
+    # The search `found` is for and the serial of the newest key it covers
+    search: str = ""
+    found: set[ItemKey]
+    found_serial: int = -1
+
+    def __init__(self, item_keys: Optional[ItemKeyStore] = None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.item_keys = item_keys or ItemKeyStore()
+        self.found = set()
+
+    def set_search(self, search: str) -> None:
+        """
+        Filters the items again after `shared.search` was set to `search`.
+
+        Only the items that can change are tested again,
+        compared to the search this filter was last set to.
+        """
+        old = self.query
+        new = self.query = search.lower()
 
-        if not (path := file_info.get_attribute_object("standard::file").get_path()):
+        if old == new:
+            return
+
+        # Only retest the items that are visible when typing more,
+        # or the ones that are hidden when deleting
+        if old in new:
+            change = Gtk.FilterChange.MORE_STRICT
+        elif new in old:
+            change = Gtk.FilterChange.LESS_STRICT
+        else:
+            change = Gtk.FilterChange.DIFFERENT
+
+        self.changed(change)
+
+    def __tag_filter(self, key: ItemKey) -> bool:
+        if not shared.tags:
             return True
 
-        if not path_represents_tags(path):
+        if not key.path:
             return True
 
-        return False
+        if key.tags is not (tags := tag_registry.tags):
+            key.tags = tags
+            key.tagged = path_represents_tags(key.path)
+
+        return not key.tagged
 
-    def __search_filter(self, file_info: Gio.FileInfo) -> bool:
+    def __search_filter(self, key: ItemKey) -> bool:
         if not shared.search:
             return True
 
-        search = shared.search.lower()
+        if (search := shared.search.lower()) != self.search:
+            self.__update_search(search)
 
-        if search in file_info.get_display_name().lower():
-            return True
+        # Keys newer than the last batch and ones not in the model are checked one by one
+        if 0 <= key.serial <= self.found_serial:
+            return key in self.found
 
-        return False
+        return search in key.name
 
-    def __hidden_filter(self, file_info: Gio.FileInfo) -> bool:
-        if shared.show_hidden:
-            return True
+    def __update_search(self, search: str) -> None:
+        # Narrowing the search can only ever remove items
+        if self.search and self.search in search:
+            self.found = self.item_keys.search(search, self.found)
+        else:
+            self.found = self.item_keys.search(search)
+            self.found_serial = self.item_keys.get_serial()
 
-        # Always show trashed hidden files
-        if file_info.get_deletion_date():
-            return True
+        self.search = search
 
-        try:
-            if file_info.get_is_hidden():
-                return False
-        except GLib.Error:
-            pass
-        return True
+    def __hidden_filter(self, key: ItemKey) -> bool:
+        return shared.show_hidden or not key.hidden
 
     def do_match(self, file_info: Optional[Gio.FileInfo] = None) -> bool:
         """Checks if the given `item` is matched by the filter or not."""
         if not file_info:
             return False
 
-        return all(
-            (
-                self.__search_filter(file_info),
-                self.__hidden_filter(file_info),
-                self.__tag_filter(file_info),
-            )
+        key = self.item_keys.get(file_info)
+
+        return (
+            self.__hidden_filter(key)
+            and self.__search_filter(key)
+            and self.__tag_filter(key)
         )
@@ -17,26 +17,60 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+
 """Main sorter for HypItemsPage."""
-from locale import strcoll
-from typing import Optional
+import re
+from locale import strxfrm
+from typing import Any, Optional
 
 from gi.repository import Gio, GLib, Gtk
 
 from hyperplane import shared
+from hyperplane.utils.item_keys import ItemKey, ItemKeyStore
+
+# Splits names into alternating runs of text and digits, always starting with text
+NUMBERS = re.compile(r"(\d+)")
+
+
+class Descending:
+    """Wraps `value` so it sorts in the opposite order."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+    def __eq__(self, other: Any) -> bool:
+        return self.value == other.value
+
+    def __lt__(self, other: Any) -> bool:
+        return other.value < self.value
+
+    def __gt__(self, other: Any) -> bool:
+        return other.value > self.value
 
 
 class HypItemSorter(Gtk.Sorter):
-    """Main sorter for HypItemsPage."""
+    """
+    Main sorter for HypItemsPage.
+
+    A sort key is computed once for each item and kept in its `ItemKey`
+    until the sort order changes, so comparing two items doesn't call into GObject.
+    """
 
     __gtype_name__ = "HypItemSorter"
 
-    def __init__(self, **kwargs) -> None:
+    item_keys: ItemKeyStore
+
+    # Incremented whenever the sort order changes, invalidating all sort keys
+    sort_serial: int = 0
+    folders_before_files: Optional[bool] = None
+
+    def __init__(self, item_keys: Optional[ItemKeyStore] = None, **kwargs) -> None:
         super().__init__(**kwargs)
+        self.item_keys = item_keys or ItemKeyStore()
 
-        shared.postmaster.connect(
-            "sort-changed", lambda *_: self.changed(Gtk.SorterChange.DIFFERENT)
-        )
+        shared.postmaster.connect("sort-changed", self.__sort_changed)
 
     def do_compare(
         self,
@@ -58,104 +92,117 @@ class HypItemSorter(Gtk.Sorter):
         if (not file_info1) or (not file_info2):
             return Gtk.Ordering.EQUAL
 
+        fixed1, value1 = self.__get_sort_key(file_info1)
+        fixed2, value2 = self.__get_sort_key(file_info2)
+
+        # Folders first and dot-prefixed files last are not affected by reversing
+        if fixed1 != fixed2:
+            return Gtk.Ordering.SMALLER if fixed1 < fixed2 else Gtk.Ordering.LARGER
+
+        return self.__ordering_from_cmpfunc((value1 > value2) - (value1 < value2))
+
+    def __sort_changed(self, *_args: Any) -> None:
+        self.sort_serial += 1
+        self.folders_before_files = None
+
+        self.changed(Gtk.SorterChange.DIFFERENT)
+
+    def __get_sort_key(self, file_info: Gio.FileInfo) -> tuple[tuple, tuple]:
+        key = self.item_keys.get(file_info)
+
+        if key.sort_serial != self.sort_serial:
+            key.sort_key = self.__make_sort_key(file_info, key)
+            key.sort_serial = self.sort_serial
+
+        return key.sort_key
+
+    def __make_sort_key(
+        self, file_info: Gio.FileInfo, key: ItemKey
+    ) -> tuple[tuple, tuple]:
+        gfile = file_info.get_attribute_object("standard::file")
+        display_name = file_info.get_display_name()
+        name = strxfrm(display_name)
+
         # Always sort trashed items by deletion date
         if (
-            (
-                gfile1 := file_info1.get_attribute_object("standard::file")
-            ).get_uri_scheme()
-            == "trash"
+            gfile.get_uri_scheme() == "trash"
             # Only if the trashed file is at the toplevel of the trash
-            and gfile1.get_uri().count("/") < 4
+            and gfile.get_uri().count("/") < 4
         ):
-            if (not (deletion_date1 := file_info1.get_deletion_date())) or (
-                not (deletion_date2 := file_info2.get_deletion_date())
-            ):
-                return Gtk.Ordering.EQUAL
-
-            return self.__ordering_from_cmpfunc(
-                GLib.DateTime.compare(deletion_date2, deletion_date1)
-            )
+            return (0,), (self.__get_date_key(file_info.get_deletion_date()), name)
 
         # Always sort recent items by date
-        if (
-            file_info1.get_attribute_object("standard::file").get_uri_scheme()
-            == "recent"
-        ):
+        if gfile.get_uri_scheme() == "recent":
             try:
-                recent_info1 = shared.recent_manager.lookup_item(
-                    file_info1.get_attribute_string(
-                        Gio.FILE_ATTRIBUTE_STANDARD_TARGET_URI
-                    )
-                )
-                recent_info2 = shared.recent_manager.lookup_item(
-                    file_info2.get_attribute_string(
+                recent_info = shared.recent_manager.lookup_item(
+                    file_info.get_attribute_string(
                         Gio.FILE_ATTRIBUTE_STANDARD_TARGET_URI
                     )
                 )
             except GLib.Error:
                 pass
             else:
-                return self.__ordering_from_cmpfunc(
-                    GLib.DateTime.compare(
-                        recent_info2.get_modified(), recent_info1.get_modified()
-                    )
-                )
+                return (0,), (self.__get_date_key(recent_info.get_modified()), name)
 
-        if shared.schema.get_boolean("folders-before-files"):
-            if folders := self.__sort_folders_before_files(file_info1, file_info2):
-                return folders
+        if self.folders_before_files is None:
+            self.folders_before_files = shared.schema.get_boolean(
+                "folders-before-files"
+            )
 
-        name1 = file_info1.get_display_name()
-        name2 = file_info2.get_display_name()
+        is_dir = file_info.get_content_type() == "inode/directory"
 
-        # Sort dot-prefixed files last
-        if name1.startswith("."):
-            if not name2.startswith("."):
-                return Gtk.Ordering.LARGER
-        elif name2.startswith("."):
-            return Gtk.Ordering.SMALLER
+        fixed = (
+            1,
+            self.folders_before_files and not is_dir,
+            # Sort dot-prefixed files last
+            display_name.startswith("."),
+            # No fast way to calculate size for folders so assume they're always bigger
+            shared.sort_by == "size" and not is_dir,
+        )
 
         match shared.sort_by:
-            case "a-z":
-                return self.__ordering_from_cmpfunc(strcoll(name1, name2))
-
             case "modified":
-                mod1 = file_info1.get_modification_date_time()
-                mod2 = file_info2.get_modification_date_time()
-
-                if mod1 and mod2:
-                    return self.__ordering_from_cmpfunc(mod2.compare(mod1))
+                primary = self.__get_date_key(file_info.get_modification_date_time())
 
             case "created":
-                created1 = file_info1.get_creation_date_time()
-                created2 = file_info2.get_creation_date_time()
-
-                if created1 and created2:
-                    return self.__ordering_from_cmpfunc(created2.compare(created1))
+                primary = self.__get_date_key(file_info.get_creation_date_time())
 
             case "size":
-                # No fast way to calculate size for folders so assume they're always bigger
-                if folders := self.__sort_folders_before_files(file_info1, file_info2):
-                    return folders
+                primary = (0, -size) if (size := file_info.get_size()) else (1,)
 
-                size1 = file_info1.get_size()
-                size2 = file_info2.get_size()
-
-                if size2 and size1:
-                    if size1 == size2:
-                        return Gtk.Ordering.EQUAL
+            case "type":
+                primary = (
+                    (0, Descending(strxfrm(content_type)))
+                    if (content_type := file_info.get_content_type())
+                    else (1,)
+                )
 
-                    return self.__ordering_from_cmpfunc((int(size1 < size2) * 2) - 1)
+            case "natural":
+                if key.natural_key is None:
+                    key.natural_key = self.__get_natural_key(display_name)
 
-            case "type":
-                type1 = file_info1.get_content_type()
-                type2 = file_info2.get_content_type()
+                primary = key.natural_key
 
-                if type1 and type2:
-                    return self.__ordering_from_cmpfunc(strcoll(type2, type1))
+            case _:
+                primary = ()
 
         # Fall back to A-Z
-        return self.__ordering_from_cmpfunc(strcoll(name1, name2))
+        return fixed, (primary, name)
+
+    def __get_natural_key(self, name: str) -> tuple:
+        # So "file2" comes before "file10"
+        parts = NUMBERS.split(name)
+        parts[::2] = (strxfrm(text) for text in parts[::2])
+        parts[1::2] = (int(number) for number in parts[1::2])
+
+        return tuple(parts)
+
+    def __get_date_key(self, date: Optional[GLib.DateTime]) -> tuple:
+        # Newest first, items without a date last
+        if not date:
+            return (1,)
+
+        return (0, -(date.to_unix() * 1000000 + date.get_microsecond()))
 
     def __ordering_from_cmpfunc(self, cmpfunc_result: int) -> Gtk.Ordering:
         # https://gitlab.gnome.org/GNOME/gtk/-/issues/6298
@@ -163,17 +210,3 @@ class HypItemSorter(Gtk.Sorter):
             ((cmpfunc_result > 0) - (cmpfunc_result < 0))
             * (-1 if shared.sort_reversed else 1)
         )
-
-    def __sort_folders_before_files(
-        self, file_info1: Gio.FileInfo, file_info2: Gio.FileInfo
-    ) -> Gtk.Ordering:
-        dir1 = file_info1.get_content_type() == "inode/directory"
-        dir2 = file_info2.get_content_type() == "inode/directory"
-
-        if dir1:
-            if not dir2:
-                return Gtk.Ordering.SMALLER
-        elif dir2:
-            return Gtk.Ordering.LARGER
-
-        return None
@@ -36,6 +36,8 @@ from hyperplane.item_sorter import HypItemSorter
 from hyperplane.new_file_dialog import HypNewFileDialog
 from hyperplane.utils.create_alert_dialog import create_alert_dialog
 from hyperplane.utils.dates import relative_date
+from hyperplane.utils.detail_loader import is_remote
+from hyperplane.utils.directory_cache import directory_cache
 from hyperplane.utils.files import (
     YouAreStupid,
     copy,
@@ -48,7 +50,12 @@ from hyperplane.utils.files import (
     rm,
     validate_name,
 )
-from hyperplane.utils.iterplane import iterplane
+from hyperplane.utils.item_keys import ItemKeyStore
+from hyperplane.utils.iterplane import iterplane_async
+from hyperplane.utils.name_index import name_index
+from hyperplane.utils.plane_loader import PlaneLoader
+from hyperplane.utils.recursive_search import RecursiveSearch, search_tags
+from hyperplane.utils.thumbnail_prefetch import ThumbnailPrefetcher
 from hyperplane.utils.undo import undo
 
 
@@ -74,15 +81,25 @@ class HypItemsPage(Adw.NavigationPage):
         self,
         gfile: Optional[Gio.File] = None,
         tags: Optional[list[str]] = None,
+        search: Optional[str] = None,
         **kwargs,
     ) -> None:
         super().__init__(**kwargs)
         self.gfile = gfile
         self.tags = tags
+        # Search pages show matches from anywhere under `gfile` or the planes of `tags`
+        self.search = search
         self.items = {}
         self.list_items = {}
-
-        if self.gfile:
+        self.plane_loader: Optional[PlaneLoader] = None
+        self.discovering = False
+        self.recursive_search: Optional[RecursiveSearch] = None
+        self.searching = False
+        self.loading_handler: Optional[int] = None
+
+        if self.search:
+            self.set_title(_("Search for “{}”").format(self.search))
+        elif self.gfile:
             if self.gfile.get_path() == str(shared.home_path):
                 self.set_title(_("Home"))
             else:
@@ -100,36 +117,49 @@ class HypItemsPage(Adw.NavigationPage):
         shared.postmaster.connect("tags-changed", self.__tags_changed)
         shared.postmaster.connect("toggle-hidden", self.__toggle_hidden)
 
-        self.file_attrs = ",".join(
+        # Listed first on network shares, where the others are loaded later
+        self.name_attrs = ",".join(
             (
+                Gio.FILE_ATTRIBUTE_STANDARD_TYPE,
+                Gio.FILE_ATTRIBUTE_STANDARD_FAST_CONTENT_TYPE,
                 Gio.FILE_ATTRIBUTE_STANDARD_SYMBOLIC_ICON,
-                Gio.FILE_ATTRIBUTE_STANDARD_CONTENT_TYPE,
-                Gio.FILE_ATTRIBUTE_THUMBNAIL_PATH,
                 Gio.FILE_ATTRIBUTE_STANDARD_IS_HIDDEN,
                 Gio.FILE_ATTRIBUTE_STANDARD_DISPLAY_NAME,
                 Gio.FILE_ATTRIBUTE_STANDARD_EDIT_NAME,
                 Gio.FILE_ATTRIBUTE_STANDARD_TARGET_URI,  # For Recent
                 Gio.FILE_ATTRIBUTE_TRASH_DELETION_DATE,  # For Trash
-                Gio.FILE_ATTRIBUTE_FILESYSTEM_USE_PREVIEW,
-                Gio.FILE_ATTRIBUTE_ACCESS_CAN_EXECUTE,
-                # For list view
+                # For list view and sorting, listed along with names by most backends
                 Gio.FILE_ATTRIBUTE_STANDARD_SIZE,
                 Gio.FILE_ATTRIBUTE_TIME_MODIFIED,
                 Gio.FILE_ATTRIBUTE_TIME_CREATED,
             )
         )
+        self.detail_attrs = ",".join(
+            (
+                Gio.FILE_ATTRIBUTE_STANDARD_CONTENT_TYPE,
+                Gio.FILE_ATTRIBUTE_THUMBNAIL_PATH,
+                Gio.FILE_ATTRIBUTE_FILESYSTEM_USE_PREVIEW,
+                Gio.FILE_ATTRIBUTE_ACCESS_CAN_EXECUTE,
+            )
+        )
+        self.file_attrs = f"{self.name_attrs},{self.detail_attrs}"
 
         self.dir_list = self.__get_list(self.gfile, self.tags)
 
         # Filtering
-        self.item_filter = HypItemFilter()
+        self.item_keys = ItemKeyStore()
+        self.item_keys.set_model(self.dir_list)
+        self.item_filter = HypItemFilter(self.item_keys)
         self.filter_list = Gtk.FilterListModel.new(self.dir_list, self.item_filter)
         self.filter_list.connect("items-changed", self.__items_changed)
 
         # Sorting
-        self.sorter = HypItemSorter()
+        self.sorter = HypItemSorter(self.item_keys)
         self.sort_list = Gtk.SortListModel.new(self.filter_list, self.sorter)
 
+        # Thumbnails of items about to be scrolled into view
+        self.prefetcher = ThumbnailPrefetcher(self.scrolled_window, self.sort_list)
+
         # Selection
         self.multi_selection = Gtk.MultiSelection.new(self.sort_list)
 
@@ -150,6 +180,10 @@ class HypItemsPage(Adw.NavigationPage):
         self.__items_changed()
         shared.postmaster.connect("tag-location-created", self.__tag_location_created)
 
+        # Planes of pages that are not visible are loaded last
+        self.connect("shown", self.__shown)
+        self.connect("hidden", self.__hidden)
+
         # Set up the `page` action group
         self.shortcut_controller = Gtk.ShortcutController.new()
         self.add_controller(self.shortcut_controller)
@@ -186,7 +220,10 @@ class HypItemsPage(Adw.NavigationPage):
         self.scrolled_window.add_controller(self.scroll)
 
         # What page to show if there are no items
-        if self.gfile:
+        if self.search:
+            self.no_items_page = self.no_results
+
+        elif self.gfile:
             if self.gfile.get_uri() == SpecialUris.trash_uri:
                 self.no_items_page = self.empty_trash
 
@@ -201,6 +238,10 @@ class HypItemsPage(Adw.NavigationPage):
 
     def reload(self) -> None:
         """Refresh the view."""
+        if self.search:
+            self.set_search(self.search)
+            return
+
         if isinstance(self.dir_list, Gtk.DirectoryList):
             self.dir_list.set_monitored(False)
             self.dir_list.set_monitored(True)
@@ -208,8 +249,50 @@ class HypItemsPage(Adw.NavigationPage):
 
         if isinstance(self.dir_list, Gtk.FlattenListModel):
             self.dir_list = self.__get_list(tags=self.tags)
+            self.item_keys.set_model(self.dir_list)
             self.filter_list.set_model(self.dir_list)
 
+    def set_search(self, search: str) -> None:
+        """Searches for `search` instead on a search page, cancelling the previous search."""
+        self.search = search
+        self.set_title(_("Search for “{}”").format(search))
+
+        self.dir_list = self.__get_list(self.gfile, self.tags)
+        self.item_keys.set_model(self.dir_list)
+        self.filter_list.set_model(self.dir_list)
+
+    def cancel_loading(self) -> None:
+        """
+        Stop discovering and loading the planes of a tag page
+        or searching on a search page.
+
+        They are loaded again if the page is shown later.
+        """
+        if self.searching:
+            self.recursive_search.cancel()
+
+        if self.plane_loader and (self.discovering or self.plane_loader.is_loading()):
+            self.plane_loader.cancel()
+
+    def close(self) -> None:
+        """Stops loading and releases the directory list once the page is discarded."""
+        self.cancel_loading()
+
+        if self.loading_handler:
+            self.dir_list.disconnect(self.loading_handler)
+            self.loading_handler = None
+
+            directory_cache.release(self.dir_list)
+
+    def reopen(self) -> None:
+        """Gets the directory list released by `close` again when the page is restored."""
+        if self.loading_handler or not isinstance(self.dir_list, Gtk.DirectoryList):
+            return
+
+        self.dir_list = self.__get_list(self.gfile, self.tags)
+        self.item_keys.set_model(self.dir_list)
+        self.filter_list.set_model(self.dir_list)
+
     def get_selected_positions(self) -> list[int]:
         """Gets the list of positions for selected items in the view."""
         not_empty, bitset_iter, position = Gtk.BitsetIter.init_first(
@@ -370,24 +453,116 @@ class HypItemsPage(Adw.NavigationPage):
 
     def __get_list(
         self, gfile: Optional[Gio.File] = None, tags: Optional[list[str]] = None
-    ) -> Gtk.DirectoryList | Gtk.FlattenListModel:
+    ) -> Gtk.DirectoryList | Gtk.FlattenListModel | Gio.ListStore:
+        if self.search:
+            return self.__get_search_list(gfile, tags)
+
         if gfile:
-            dir_list = Gtk.DirectoryList.new(self.file_attrs, gfile)
-            dir_list.connect("notify::loading", lambda *_: self.__items_changed())
+            # Shared with other pages of the same directory
+            dir_list = (
+                # Show names right away where details take long to load
+                directory_cache.acquire(gfile, self.name_attrs, self.detail_attrs)
+                if is_remote(gfile)
+                else directory_cache.acquire(gfile, self.file_attrs)
+            )
+            self.loading_handler = dir_list.connect(
+                "notify::loading", lambda *_: self.__items_changed()
+            )
 
             return dir_list
 
+        if self.plane_loader:
+            self.plane_loader.cancel()
+
         list_store = Gio.ListStore.new(Gtk.DirectoryList)
-        for plane_path in iterplane(tags):
-            list_store.append(
-                dir_list := Gtk.DirectoryList.new(
-                    self.file_attrs, Gio.File.new_for_path(str(plane_path))
-                )
+        plane_loader = self.plane_loader = PlaneLoader(
+            list_store, self.file_attrs, self.__items_changed
+        )
+        self.discovering = True
+
+        def add_planes(planes: list[Path]) -> None:
+            plane_loader.add(
+                [Gio.File.new_for_path(str(plane_path)) for plane_path in planes]
             )
-            dir_list.connect("notify::loading", lambda *_: self.__items_changed())
+
+        def discovered() -> None:
+            self.discovering = False
+            self.__items_changed()
+
+        # Planes are streamed in as they are found so deep trees don't block the UI
+        iterplane_async(tags, add_planes, discovered, plane_loader.cancellable)
 
         return Gtk.FlattenListModel.new(list_store)
 
+    def __get_search_list(
+        self, gfile: Optional[Gio.File] = None, tags: Optional[list[str]] = None
+    ) -> Gio.ListStore:
+        if self.recursive_search:
+            self.recursive_search.cancel()
+
+        list_store = Gio.ListStore.new(Gio.FileInfo)
+
+        def add_results(file_infos: list[Gio.FileInfo]) -> None:
+            # Emit a single `items-changed` for the whole batch
+            list_store.splice(list_store.get_n_items(), 0, file_infos)
+
+        def searched() -> None:
+            self.searching = False
+            self.__items_changed()
+
+        self.searching = True
+
+        if tags:
+            # Search pages cover subfolders of planes too
+            self.recursive_search = search_tags(
+                tags,
+                self.search,
+                self.file_attrs,
+                add_results,
+                searched,
+                shared.show_hidden,
+                recursive=True,
+            )
+            return list_store
+
+        recursive_search = self.recursive_search = RecursiveSearch(
+            self.search, self.file_attrs, add_results, searched, shared.show_hidden
+        )
+
+        # Only local directories can be walked
+        if gfile and (path := gfile.get_path()):
+            # The index answers in milliseconds what a walk can take minutes for
+            if (matches := name_index.search(self.search, path)) is not None:
+                recursive_search.add_matches(matches)
+            else:
+                recursive_search.add((path,))
+
+        recursive_search.close()
+        return list_store
+
+    def __shown(self, *_args: Any) -> None:
+        self.prefetcher.set_active(True)
+
+        # The search was stopped when the page was left
+        if self.recursive_search and self.recursive_search.is_cancelled():
+            self.reload()
+            return
+
+        if not self.plane_loader:
+            return
+
+        if self.plane_loader.cancellable.is_cancelled():
+            self.reload()
+            return
+
+        self.plane_loader.set_visible(True)
+
+    def __hidden(self, *_args: Any) -> None:
+        self.prefetcher.set_active(False)
+
+        if self.plane_loader:
+            self.plane_loader.set_visible(False)
+
     def __tag_location_created(
         self, _obj: Any, string_list: Gtk.StringList, new_location: Gio.File
     ):
@@ -401,10 +576,16 @@ class HypItemsPage(Adw.NavigationPage):
 
             tags.add(string.get_string())
 
-        if all(tag in self.tags for tag in tags):
-            self.dir_list.get_model().append(
-                Gtk.DirectoryList.new(self.file_attrs, new_location)
-            )
+        if not all(tag in self.tags for tag in tags):
+            return
+
+        # Search pages have no planes of their own, search them again instead
+        if self.search:
+            self.set_search(self.search)
+            return
+
+        if self.plane_loader:
+            self.plane_loader.add([new_location])
 
     def __items_changed(
         self,
@@ -430,6 +611,15 @@ class HypItemsPage(Adw.NavigationPage):
                 self.scrolled_window.set_child(self.no_results)
                 return
 
+            if self.search:
+                if self.searching:
+                    self.loading.get_child().start()
+                    self.scrolled_window.set_child(self.loading)
+                    return
+
+                self.scrolled_window.set_child(self.no_items_page)
+                return
+
             if self.gfile:
                 if self.dir_list.is_loading():
                     self.loading.get_child().start()
@@ -439,9 +629,12 @@ class HypItemsPage(Adw.NavigationPage):
                 self.scrolled_window.set_child(self.no_items_page)
 
             if self.tags:
-                # No idea why this works 🤷
-                if not self.dir_list.get_model().get_item(0):
-                    self.scrolled_window.set_child(self.no_matching_items)
+                if self.discovering or self.plane_loader.is_loading():
+                    self.loading.get_child().start()
+                    self.scrolled_window.set_child(self.loading)
+                    return
+
+                self.scrolled_window.set_child(self.no_matching_items)
 
     def __item_setup(
         self, _factory: Gtk.SignalListItemFactory, list_item: Gtk.ListItem
@@ -454,6 +647,9 @@ class HypItemsPage(Adw.NavigationPage):
         list_item.get_child().bind()
         pos = list_item.get_position()
 
+        # Prefetch thumbnails at the size the items show them at
+        self.prefetcher.texture_size = list_item.get_child().texture_size
+
         self.items[pos] = list_item.get_child()
 
         # For the org.freedesktop.FileManager1 DBus service's ShowItems
@@ -39,6 +39,9 @@ from hyperplane.file_manager_dbus import FileManagerDBusServer
 from hyperplane.guide import HypGuide
 from hyperplane.logging.logging_config import logging_config
 from hyperplane.preferences import HypPreferencesDialog
+from hyperplane.utils.name_index import name_index
+from hyperplane.utils.plane_index import plane_index
+from hyperplane.utils.thumbnail import thumbnail_failures
 from hyperplane.window import HypWindow
 
 
@@ -123,6 +126,22 @@ class HypApplication(Adw.Application):
             ("<primary>2",),
         )
 
+    def do_startup(self) -> None:
+        """Sets up the primary instance of the application."""
+        Adw.Application.do_startup(self)
+
+        # Index tags in the background so tag pages can open instantly
+        plane_index.load()
+
+        # Only indexes file names if it is enabled in preferences
+        name_index.load()
+
+    def do_shutdown(self) -> None:
+        """Writes what is still pending before quitting."""
+        thumbnail_failures.flush()
+
+        Adw.Application.do_shutdown(self)
+
     def do_open(self, gfiles: Sequence[Gio.File], _n_files: int, _hint: str) -> None:
         """Opens the given files."""
         for gfile in gfiles:
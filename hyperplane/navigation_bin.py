@@ -68,13 +68,30 @@ class HypNavigationBin(Adw.Bin):
         gfile: Optional[Gio.File] = None,
         tag: Optional[str] = None,
         tags: Optional[Iterable[str]] = None,
+        search: Optional[str] = None,
     ) -> None:
-        """Push a new page with the given file or tag to the navigation stack."""
+        """
+        Push a new page with the given file or tag to the navigation stack.
+
+        If `search` is given, the page shows the items matching it
+        anywhere under `gfile` or in the planes of `tags` instead.
+        """
         page = self.view.get_visible_page()
         next_page = self.next_pages[-1] if self.next_pages else None
 
-        if gfile:
-            if page.gfile and page.gfile.get_uri() == gfile.get_uri():
+        # Search pages are never the same as the pages of their location
+        if page.search:
+            page = None
+
+        if next_page and next_page.search:
+            next_page = None
+
+        if search:
+            page = HypItemsPage(
+                gfile=gfile, tags=list(tags) if tags else None, search=search
+            )
+        elif gfile:
+            if page and page.gfile and page.gfile.get_uri() == gfile.get_uri():
                 return
 
             if (
@@ -90,7 +107,7 @@ class HypNavigationBin(Adw.Bin):
         elif tags:
             tags = list(tags)
 
-            if page.tags == tags:
+            if page and page.tags == tags:
                 return
 
             if next_page and next_page.tags == tags:
@@ -99,7 +116,7 @@ class HypNavigationBin(Adw.Bin):
 
             page = HypItemsPage(tags=tags)
         elif tag:
-            if page.tags:
+            if page and page.tags:
                 if tag in page.tags:
                     return
 
@@ -120,6 +137,23 @@ class HypNavigationBin(Adw.Bin):
         self.view.add(page)
         self.view.push(page)
 
+    def close(self) -> None:
+        """Releases the directory lists of every page once the tab is closed."""
+        for page in self.__get_pages():
+            page.close()
+
+    def reopen(self) -> None:
+        """Gets the directory lists released by `close` again."""
+        for page in self.__get_pages():
+            page.reopen()
+
+    def __get_pages(self) -> list[HypItemsPage]:
+        stack = self.view.get_navigation_stack()
+
+        return [
+            stack.get_item(index) for index in range(stack.get_n_items())
+        ] + self.next_pages
+
     def __pushed(self, *_args: Any) -> None:
         page = self.view.get_visible_page()
 
@@ -134,6 +168,7 @@ class HypNavigationBin(Adw.Bin):
         else:
             for next_page in self.next_pages:
                 self.view.remove(next_page)
+                next_page.close()
 
             self.next_pages = []
 
@@ -144,6 +179,9 @@ class HypNavigationBin(Adw.Bin):
     ) -> None:
         self.next_pages.append(page)
 
+        # Don't keep loading planes for a page that may never be seen again
+        page.cancel_loading()
+
         self.get_root().set_focus(self.view.get_visible_page().scrolled_window)
 
     def __next_page(self, *_args: Any) -> None:
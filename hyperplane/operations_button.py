@@ -0,0 +1,159 @@
+# operations_button.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+"""A button in the header bar showing the file operations that are running."""
+from typing import Any
+
+from gi.repository import GLib, Gtk, Pango
+
+from hyperplane.utils.file_operations import (
+    FileOperationType,
+    HypFileOperation,
+    file_operations,
+)
+from hyperplane.utils.files import get_gfile_display_name
+
+
+class HypOperationsButton(Gtk.MenuButton):
+    """
+    A button in the header bar showing the file operations that are running.
+
+    It is only visible while there are any, and its popover shows the progress
+    of each with a button to cancel it.
+    """
+
+    __gtype_name__ = "HypOperationsButton"
+
+    list_box: Gtk.ListBox
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(
+            icon_name="emblem-synchronizing-symbolic",
+            tooltip_text=_("File Operations"),
+            **kwargs,
+        )
+
+        self.list_box = Gtk.ListBox(selection_mode=Gtk.SelectionMode.NONE)
+        self.list_box.add_css_class("boxed-list")
+        self.list_box.bind_model(file_operations.operations, self.__create_row)
+
+        self.set_popover(
+            Gtk.Popover(
+                child=Gtk.ScrolledWindow(
+                    child=self.list_box,
+                    hscrollbar_policy=Gtk.PolicyType.NEVER,
+                    propagate_natural_height=True,
+                    max_content_height=400,
+                    width_request=320,
+                )
+            )
+        )
+
+        file_operations.operations.connect("items-changed", self.__items_changed)
+        self.__items_changed(file_operations.operations)
+
+    def __items_changed(self, operations: Any, *_args: Any) -> None:
+        if operations.get_n_items():
+            self.set_visible(True)
+            return
+
+        self.popdown()
+        self.set_visible(False)
+
+    def __create_row(self, operation: HypFileOperation) -> Gtk.Widget:
+        name = get_gfile_display_name(operation.src)
+
+        match operation.kind:
+            case FileOperationType.COPY:
+                title = _("Copying “{}”").format(name)
+            case FileOperationType.MOVE:
+                title = _("Moving “{}”").format(name)
+            case _:
+                title = _("Deleting “{}”").format(name)
+
+        box = Gtk.Box(
+            orientation=Gtk.Orientation.VERTICAL,
+            spacing=6,
+            margin_top=9,
+            margin_bottom=9,
+            margin_start=12,
+            margin_end=6,
+            hexpand=True,
+        )
+        box.append(Gtk.Label(label=title, xalign=0, ellipsize=Pango.EllipsizeMode.END))
+        box.append(progress_bar := Gtk.ProgressBar())
+        box.append(status := Gtk.Label(xalign=0, ellipsize=Pango.EllipsizeMode.END))
+        status.add_css_class("caption")
+        status.add_css_class("dim-label")
+
+        cancel_button = Gtk.Button(
+            icon_name="process-stop-symbolic",
+            tooltip_text=_("Cancel"),
+            valign=Gtk.Align.CENTER,
+            margin_end=6,
+        )
+        cancel_button.add_css_class("flat")
+        cancel_button.add_css_class("circular")
+        cancel_button.connect("clicked", lambda *_: operation.cancel())
+
+        row_box = Gtk.Box(spacing=6)
+        row_box.append(box)
+        row_box.append(cancel_button)
+
+        def update(*_args: Any) -> None:
+            with operation.lock:
+                done_bytes, total_bytes = operation.done_bytes, operation.total_bytes
+                done_files, total_files = operation.done_files, operation.total_files
+
+            if total_bytes:
+                progress_bar.set_fraction(min(1, done_bytes / total_bytes))
+                text = _("{} of {}").format(
+                    GLib.format_size(done_bytes), GLib.format_size(total_bytes)
+                )
+            elif total_files:
+                progress_bar.set_fraction(min(1, done_files / total_files))
+                text = _("{} of {} files").format(done_files, total_files)
+            else:
+                progress_bar.pulse()
+                text = _("Preparing…") if operation.started else _("Waiting…")
+
+            if (eta := operation.get_eta()) is not None:
+                text = _("{}, {} left").format(text, self.__format_duration(eta))
+
+            status.set_label(text)
+
+        def finished(*_args: Any) -> None:
+            operation.disconnect(progress_handler)
+            operation.disconnect(finished_handler)
+
+        progress_handler = operation.connect("progress", update)
+        finished_handler = operation.connect("finished", finished)
+        update()
+
+        return Gtk.ListBoxRow(child=row_box, activatable=False)
+
+    def __format_duration(self, seconds: float) -> str:
+        if seconds < 60:
+            return _("{} s").format(round(seconds))
+
+        if seconds < 60 * 60:
+            return _("{} min").format(round(seconds / 60))
+
+        return _("{} h {} min").format(int(seconds // 3600), int(seconds % 3600 // 60))
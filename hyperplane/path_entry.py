@@ -157,18 +157,21 @@ class HypPathEntry(Gtk.Entry):
         text = entry.get_text().strip()
 
         if text.startswith("//"):
-            tags = list(
-                tag
-                for tag in shared.tags
-                if tag in text.lstrip("/").rstrip("/").split("//")
+            parts = text.lstrip("/").rstrip("/").split("//")
+
+            # Text after the last tag, like in "//Pictures//2024//beach", is searched for
+            search = (
+                None if text.endswith("//") or parts[-1] in shared.tags else parts.pop()
             )
 
+            tags = list(tag for tag in shared.tags if tag in parts)
+
             if not tags:
                 self.get_root().send_toast(_("No such tags"))
                 return
 
             self.emit("hide-entry")
-            self.get_root().new_page(tags=tags)
+            self.get_root().new_page(tags=tags, search=search)
             return
 
         if "://" in text:
@@ -31,6 +31,7 @@ class HypPreferencesDialog(Adw.PreferencesDialog):
 
     folders_switch_row = Gtk.Template.Child()
     single_click_open_switch_row = Gtk.Template.Child()
+    name_index_switch_row = Gtk.Template.Child()
 
     is_open = False
 
@@ -55,6 +56,13 @@ class HypPreferencesDialog(Adw.PreferencesDialog):
             Gio.SettingsBindFlags.DEFAULT,
         )
 
+        shared.schema.bind(
+            "name-index",
+            self.name_index_switch_row,
+            "active",
+            Gio.SettingsBindFlags.DEFAULT,
+        )
+
         self.folders_switch_row.connect(
             "notify::active", lambda *_: shared.postmaster.emit("sort-changed")
         )
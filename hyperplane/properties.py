@@ -18,13 +18,13 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 """The item properties dialog."""
-import logging
 from stat import S_IEXEC
 from typing import Any
 
 from gi.repository import Adw, Gio, GLib, Gtk, Pango
 
 from hyperplane import shared
+from hyperplane.utils.dir_usage import dir_usage
 from hyperplane.utils.files import clear_recent_files, empty_trash, get_gfile_path
 from hyperplane.utils.symbolics import get_color_for_symbolic, get_symbolic
 from hyperplane.utils.tags import path_represents_tags
@@ -100,7 +100,7 @@ class HypPropertiesDialog(Adw.Dialog):
         self.set_child(navigation_view)
 
         # Stop threads after the dialog is closed
-        self.stop = False
+        self.cancellable = Gio.Cancellable.new()
         self.connect("closed", self.__stop)
 
         if gicon or thumbnail_path:
@@ -188,78 +188,16 @@ class HypPropertiesDialog(Adw.Dialog):
                     )
                     title_group.add(folder_size_box)
 
-                    size = 0
+                    def update_size(size: int, done: bool) -> None:
+                        if size:
+                            folder_size_label.set_label(GLib.format_size(size))
 
-                    def add_to_size(enumerator, enumerator_gfile) -> None:
-                        nonlocal size
-
-                        if self.stop:
-                            return
-
-                        while file_info := enumerator.next_file():
-                            basename = file_info.get_name()
-
-                            child_gfile = enumerator_gfile.get_child(basename)
-
-                            if file_info.get_file_type() == Gio.FileType.DIRECTORY:
-                                try:
-                                    child_enumerator = child_gfile.enumerate_children(
-                                        ",".join(
-                                            (
-                                                Gio.FILE_ATTRIBUTE_STANDARD_NAME,
-                                                Gio.FILE_ATTRIBUTE_STANDARD_SIZE,
-                                                Gio.FILE_ATTRIBUTE_STANDARD_TYPE,
-                                            )
-                                        ),
-                                        Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS,
-                                    )
-                                except GLib.Error:
-                                    pass
-                                else:
-                                    add_to_size(child_enumerator, child_gfile)
-
-                            if not (next_size := file_info.get_size()):
-                                continue
-
-                            size += next_size
-
-                            GLib.idle_add(
-                                folder_size_label.set_label, GLib.format_size(size)
-                            )
-
-                    try:
-                        enumerator = gfile.enumerate_children(
-                            ",".join(
-                                (
-                                    Gio.FILE_ATTRIBUTE_STANDARD_NAME,
-                                    Gio.FILE_ATTRIBUTE_STANDARD_SIZE,
-                                    Gio.FILE_ATTRIBUTE_STANDARD_TYPE,
-                                )
-                            ),
-                            Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS,
-                        )
-                    except GLib.Error as error:
-                        logging.error(
-                            'Cannot query properties size info about file "%s": %s',
-                            gfile.get_uri(),
-                            error,
-                        )
-                    else:
-
-                        def stop_loading(thread: GLib.Thread):
-                            nonlocal folder_size_spinner
-                            thread.join()
+                        if done:
                             folder_size_spinner.stop()
                             folder_size_spinner.set_visible(False)
 
-                        # The way I'm doing this is slow but at least
-                        # I don't reach the file descriptor limit
-                        folder_size_spinner.start()
-                        GLib.Thread.new(
-                            None,
-                            stop_loading,
-                            GLib.Thread.new(None, add_to_size, enumerator, gfile),
-                        )
+                    folder_size_spinner.start()
+                    dir_usage.measure(gfile.get_path(), update_size, self.cancellable)
 
             if gfile.get_uri() == "trash:///":
                 page.add(trash_group := Adw.PreferencesGroup())
@@ -495,4 +433,4 @@ class HypPropertiesDialog(Adw.Dialog):
                     exec_row.connect("notify::active", set_executable)
 
     def __stop(self, *_args: Any) -> None:
-        self.stop = True
+        self.cancellable.cancel()
@@ -0,0 +1,329 @@
+# detail_loader.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Loading of expensive attributes for directory lists that only list cheap ones.
+
+Sniffing content types and checking permissions of every file can take
+tens of seconds on network shares, so directory lists there only list names,
+sizes and times with a content type guessed from the names,
+and can be shown right away.
+Once they are done, the directory is enumerated again with the expensive
+attributes in the background, and items are updated in place in batches.
+"""
+import logging
+import os
+import re
+from typing import Any, Iterable, Optional
+
+from gi.repository import Gio, GLib, Gtk
+
+# Items updated at once on the main thread
+DETAIL_BATCH = 512
+# Set on items whose details are not loaded yet
+PENDING_DETAILS = "hyperplane::pending-details"
+# Locations on this computer, others are served by backends like smb://
+LOCAL_SCHEMES = {"file", "trash", "recent", "burn", "admin"}
+# File systems in the mount table that are network shares
+REMOTE_FS_TYPES = {
+    "9p",
+    "afs",
+    "ceph",
+    "cifs",
+    "davfs",
+    "fuse.gvfsd-fuse",
+    "fuse.rclone",
+    "fuse.sshfs",
+    "glusterfs",
+    "ncpfs",
+    "nfs",
+    "nfs4",
+    "smb3",
+    "smbfs",
+    "sshfs",
+}
+
+# How to get and set each type of attribute
+ATTRIBUTE_TYPES = {
+    Gio.FileAttributeType.STRING: "string",
+    Gio.FileAttributeType.BYTE_STRING: "byte_string",
+    Gio.FileAttributeType.BOOLEAN: "boolean",
+    Gio.FileAttributeType.UINT32: "uint32",
+    Gio.FileAttributeType.INT32: "int32",
+    Gio.FileAttributeType.UINT64: "uint64",
+    Gio.FileAttributeType.INT64: "int64",
+    Gio.FileAttributeType.OBJECT: "object",
+    Gio.FileAttributeType.STRINGV: "stringv",
+}
+
+
+def copy_attributes(src: Gio.FileInfo, dst: Gio.FileInfo) -> None:
+    """Sets every attribute of `src` on `dst`, keeping the ones `src` doesn't have."""
+    for attribute in src.list_attributes(None):
+        if not (kind := ATTRIBUTE_TYPES.get(src.get_attribute_type(attribute))):
+            continue
+
+        getattr(dst, f"set_attribute_{kind}")(
+            attribute, getattr(src, f"get_attribute_{kind}")(attribute)
+        )
+
+
+def is_remote(gfile: Gio.File) -> bool:
+    """
+    Whether `gfile` is on a network share, where details take long to load.
+
+    Only its URI and the mount table are looked at,
+    so this doesn't block on shares that stopped responding.
+    """
+    if gfile.get_uri_scheme() not in LOCAL_SCHEMES:
+        return True
+
+    if not (path := gfile.get_path()):
+        return False
+
+    return __get_fs_type(os.path.abspath(path)) in REMOTE_FS_TYPES
+
+
+def __get_fs_type(path: str) -> Optional[str]:
+    fs_type = None
+    longest = -1
+
+    try:
+        with open("/proc/self/mounts", "r", encoding="utf-8") as mounts:
+            for line in mounts:
+                try:
+                    _device, mount_path, mount_fs_type = line.split(" ", 3)[:3]
+                except ValueError:
+                    continue
+
+                # Spaces and such are escaped as octal
+                mount_path = re.sub(
+                    r"\\([0-7]{3})", lambda match: chr(int(match[1], 8)), mount_path
+                )
+
+                if len(mount_path) <= longest or not (
+                    path == mount_path or path.startswith(mount_path.rstrip("/") + "/")
+                ):
+                    continue
+
+                fs_type = mount_fs_type
+                longest = len(mount_path)
+    except OSError as error:
+        logging.debug("Cannot read the mount table: %s", error)
+
+    return fs_type
+
+
+class DetailLoader:
+    """
+    Loads `attributes` for the items of `dir_list`, which should be listed
+    with `Gio.FILE_ATTRIBUTE_STANDARD_FAST_CONTENT_TYPE` in place of
+    `Gio.FILE_ATTRIBUTE_STANDARD_CONTENT_TYPE`.
+
+    Create the loader before connecting anything else to `dir_list`
+    so items have a content type by the time others see them.
+    Updated items are removed and added back with `items-changed`.
+    """
+
+    dir_list: Gtk.DirectoryList
+    attributes: str
+    cancellable: Gio.Cancellable
+
+    # Mirrors the items of `dir_list`
+    infos: list[Gio.FileInfo]
+    detailed: set[Gio.FileInfo]
+    # Whether the directory was enumerated again since it was last loaded
+    enumerated: bool = False
+
+    def __init__(self, dir_list: Gtk.DirectoryList, attributes: str) -> None:
+        self.dir_list = dir_list
+        self.attributes = attributes
+        self.cancellable = Gio.Cancellable.new()
+
+        self.infos = []
+        self.detailed = set()
+
+        self.__positions: Optional[dict[Gio.FileInfo, int]] = None
+        self.__names: Optional[dict[str, Gio.FileInfo]] = None
+        self.__emitting = False
+
+        dir_list.connect("items-changed", self.__items_changed)
+        dir_list.connect("notify::loading", self.__loading_changed)
+
+    def cancel(self) -> None:
+        """Stops loading attributes."""
+        self.cancellable.cancel()
+
+    def __items_changed(
+        self, dir_list: Gtk.DirectoryList, position: int, removed: int, added: int
+    ) -> None:
+        # Items being updated by the loader itself
+        if self.__emitting:
+            return
+
+        for file_info in self.infos[position : position + removed]:
+            self.detailed.discard(file_info)
+
+        new_infos = [
+            dir_list.get_item(index) for index in range(position, position + added)
+        ]
+
+        for file_info in new_infos:
+            file_info.set_attribute_boolean(PENDING_DETAILS, True)
+            file_info.set_content_type(
+                file_info.get_attribute_string(
+                    Gio.FILE_ATTRIBUTE_STANDARD_FAST_CONTENT_TYPE
+                )
+                or (
+                    "inode/directory"
+                    if file_info.get_file_type() == Gio.FileType.DIRECTORY
+                    else "application/octet-stream"
+                )
+            )
+
+        self.infos[position : position + removed] = new_infos
+        self.__positions = self.__names = None
+
+        # Files created after the directory was enumerated again
+        if self.enumerated and new_infos:
+            self.__query(new_infos)
+
+    def __loading_changed(self, dir_list: Gtk.DirectoryList, *_args: Any) -> None:
+        # Start over if the directory is loaded again
+        self.cancellable.cancel()
+        self.cancellable = Gio.Cancellable.new()
+        self.enumerated = False
+
+        if dir_list.is_loading() or not (gfile := dir_list.get_file()):
+            return
+
+        GLib.Thread.new(None, self.__enumerate, gfile, self.cancellable)
+
+    def __enumerate(self, gfile: Gio.File, cancellable: Gio.Cancellable) -> None:
+        enumerated = True
+
+        try:
+            enumerator = gfile.enumerate_children(
+                f"{Gio.FILE_ATTRIBUTE_STANDARD_NAME},{self.attributes}",
+                Gio.FileQueryInfoFlags.NONE,
+                cancellable,
+            )
+
+            while details := enumerator.next_files(DETAIL_BATCH, cancellable):
+                GLib.idle_add(self.__apply_by_name, details, cancellable)
+        except GLib.Error as error:
+            logging.debug('Cannot load details of "%s": %s', gfile.get_uri(), error)
+            enumerated = False
+
+        # Runs after the last batch
+        GLib.idle_add(self.__enumerated, cancellable, enumerated)
+
+    def __enumerated(self, cancellable: Gio.Cancellable, enumerated: bool) -> None:
+        if cancellable.is_cancelled():
+            return
+
+        self.enumerated = True
+
+        # Querying files one by one would fail the same way
+        if not enumerated:
+            return
+
+        # Files created while the directory was enumerated again
+        if missing := [
+            file_info for file_info in self.infos if file_info not in self.detailed
+        ]:
+            self.__query(missing)
+
+    def __query(self, file_infos: Iterable[Gio.FileInfo]) -> None:
+        gfiles = [
+            file_info.get_attribute_object("standard::file") for file_info in file_infos
+        ]
+        cancellable = self.cancellable
+
+        def run() -> None:
+            details = []
+
+            for gfile in gfiles:
+                try:
+                    details.append(
+                        gfile.query_info(
+                            f"{Gio.FILE_ATTRIBUTE_STANDARD_NAME},{self.attributes}",
+                            Gio.FileQueryInfoFlags.NONE,
+                            cancellable,
+                        )
+                    )
+                except GLib.Error as error:
+                    logging.debug(
+                        'Cannot load details of "%s": %s', gfile.get_uri(), error
+                    )
+
+                if len(details) >= DETAIL_BATCH:
+                    GLib.idle_add(self.__apply_by_name, details, cancellable)
+                    details = []
+
+            if details:
+                GLib.idle_add(self.__apply_by_name, details, cancellable)
+
+        GLib.Thread.new(None, run)
+
+    def __apply_by_name(
+        self, details: list[Gio.FileInfo], cancellable: Gio.Cancellable
+    ) -> None:
+        if cancellable.is_cancelled():
+            return
+
+        if self.__names is None:
+            self.__names = {file_info.get_name(): file_info for file_info in self.infos}
+
+        if self.__positions is None:
+            self.__positions = {
+                file_info: position for position, file_info in enumerate(self.infos)
+            }
+
+        positions = []
+
+        for detail in details:
+            # The file may have been deleted since
+            if not (file_info := self.__names.get(detail.get_name())):
+                continue
+
+            copy_attributes(detail, file_info)
+            file_info.remove_attribute(PENDING_DETAILS)
+            self.detailed.add(file_info)
+            positions.append(self.__positions[file_info])
+
+        positions.sort()
+
+        # Notify about each run of consecutive items at once
+        self.__emitting = True
+
+        try:
+            start = end = None
+            for position in positions + [None]:
+                if position is not None and end is not None and position == end + 1:
+                    end = position
+                    continue
+
+                if start is not None:
+                    n_items = end - start + 1
+                    self.dir_list.items_changed(start, n_items, n_items)
+
+                start = end = position
+        finally:
+            self.__emitting = False
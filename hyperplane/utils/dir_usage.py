@@ -0,0 +1,264 @@
+# dir_usage.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Calculation of the total size of directories.
+
+The names found directly inside each directory are cached along with
+the modification and change times of the directory, so walking a tree again
+only lists the directories whose entries changed since.
+Files changing size in place don't update the times of their directory,
+so entries are still looked up again on every walk, but the total from the
+sizes found last time is shown right away while that happens.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from os import PathLike, cpu_count, fspath, lstat, scandir, stat
+from os.path import join
+from threading import Condition, Lock
+from typing import Callable, NamedTuple, Optional
+
+from gi.repository import Gio, GLib
+
+# Milliseconds between two updates of the size shown to the user
+UPDATE_INTERVAL = 100
+# The cache is dropped when it grows past this many directories
+MAX_CACHED_DIRS = 500000
+MAX_WORKERS = min(16, (cpu_count() or 1) * 2)
+
+
+class DirRecord(NamedTuple):
+    """The names of the entries found directly inside a directory."""
+
+    mtime: int
+    ctime: int
+    files: tuple[str, ...]
+    subdirs: tuple[str, ...]
+
+
+class DirSize(NamedTuple):
+    """The size of the entries directly inside a directory."""
+
+    # Sizes of files with a single link and of subdirectories themselves
+    size: int
+    # (device, inode, size) of files with more than one link
+    links: tuple[tuple[int, int, int], ...]
+
+
+class DirUsage:
+    """Calculates the total size of directories on a pool of threads."""
+
+    cache: dict[str, DirRecord]
+    # The sizes found in each directory by the last walk
+    sizes: dict[str, DirSize]
+    executor: Optional[ThreadPoolExecutor] = None
+
+    def __init__(self) -> None:
+        self.cache = {}
+        self.sizes = {}
+
+    def measure(
+        self,
+        path: PathLike | str,
+        callback: Callable[[int, bool], None],
+        cancellable: Optional[Gio.Cancellable] = None,
+    ) -> None:
+        """
+        Calculates the apparent size of everything under `path` in the background.
+
+        `callback` is called on the main thread with the size found so far
+        at most every `UPDATE_INTERVAL` milliseconds and whether it is final.
+        If everything under `path` was measured before, the size found then
+        is passed until the new one is final instead.
+        Files with multiple hard links are only counted once and symlinks
+        are not followed.
+        """
+        if not self.executor:
+            self.executor = ThreadPoolExecutor(MAX_WORKERS, "hyperplane-usage")
+
+        if len(self.cache) > MAX_CACHED_DIRS:
+            self.cache = {}
+            self.sizes = {}
+
+        path = fspath(path)
+        size = 0
+        done = False
+        estimating = True
+        estimate = None
+        lock = Lock()
+
+        def update() -> bool:
+            if cancellable and cancellable.is_cancelled():
+                return False
+
+            with lock:
+                if estimating:
+                    return True
+
+                finished = done
+                current_size = size if done or estimate is None else estimate
+
+            callback(current_size, finished)
+
+            return not finished
+
+        def add(record: DirSize, links: set[tuple[int, int]]) -> None:
+            nonlocal size
+
+            with lock:
+                size += record.size
+
+                for device, inode, link_size in record.links:
+                    if (device, inode) not in links:
+                        links.add((device, inode))
+                        size += link_size
+
+        def walk() -> None:
+            nonlocal done, estimating, estimate
+
+            found = self.__estimate(path)
+
+            with lock:
+                estimate = found
+                estimating = False
+
+            self.__walk(path, add, cancellable)
+
+            with lock:
+                done = True
+
+        GLib.timeout_add(UPDATE_INTERVAL, update)
+        GLib.Thread.new(None, walk)
+
+    def __walk(
+        self,
+        root: str,
+        add: Callable[[DirSize, set[tuple[int, int]]], None],
+        cancellable: Optional[Gio.Cancellable] = None,
+    ) -> None:
+        links = set()
+        pending = 1
+        condition = Condition()
+
+        def visit(path: str) -> None:
+            nonlocal pending
+
+            subdirs = ()
+
+            try:
+                if not (cancellable and cancellable.is_cancelled()):
+                    record = self.__get_record(path)
+                    self.sizes[path] = dir_size = self.__get_size(path, record)
+                    add(dir_size, links)
+                    subdirs = record.subdirs
+            except OSError as error:
+                logging.debug('Cannot get the size of "%s": %s', path, error)
+            finally:
+                with condition:
+                    pending += len(subdirs) - 1
+
+                    if not pending:
+                        condition.notify_all()
+
+            for name in subdirs:
+                self.executor.submit(visit, join(path, name))
+
+        self.executor.submit(visit, root)
+
+        with condition:
+            condition.wait_for(lambda: not pending)
+
+    def __estimate(self, root: str) -> Optional[int]:
+        # What the last walk found, if it got to every directory under `root`
+        size = 0
+        links = set()
+        paths = [root]
+
+        while paths:
+            path = paths.pop()
+
+            if not (
+                (record := self.cache.get(path)) and (dir_size := self.sizes.get(path))
+            ):
+                return None
+
+            size += dir_size.size
+
+            for device, inode, link_size in dir_size.links:
+                if (device, inode) not in links:
+                    links.add((device, inode))
+                    size += link_size
+
+            paths.extend(join(path, name) for name in record.subdirs)
+
+        return size
+
+    def __get_record(self, path: str) -> DirRecord:
+        dir_stat = stat(path)
+        mtime, ctime = dir_stat.st_mtime_ns, dir_stat.st_ctime_ns
+
+        if (
+            (record := self.cache.get(path))
+            and record.mtime == mtime
+            and record.ctime == ctime
+        ):
+            return record
+
+        files = []
+        subdirs = []
+
+        with scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+
+                (subdirs if is_dir else files).append(entry.name)
+
+        self.cache[path] = record = DirRecord(
+            mtime, ctime, tuple(files), tuple(subdirs)
+        )
+        return record
+
+    def __get_size(self, path: str, record: DirRecord) -> DirSize:
+        size = 0
+        links = []
+
+        for name in record.subdirs:
+            try:
+                size += lstat(join(path, name)).st_size
+            except OSError:
+                continue
+
+        for name in record.files:
+            try:
+                file_stat = lstat(join(path, name))
+            except OSError:
+                continue
+
+            if file_stat.st_nlink > 1:
+                links.append((file_stat.st_dev, file_stat.st_ino, file_stat.st_size))
+            else:
+                size += file_stat.st_size
+
+        return DirSize(size, tuple(links))
+
+
+dir_usage = DirUsage()
@@ -0,0 +1,147 @@
+# directory_cache.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Directory lists shared by every page showing the same directory.
+
+Each `Gtk.DirectoryList` enumerates its directory once and monitors it after,
+so pages opened on a directory that is already listed show its items at once
+and no directory is monitored twice.
+"""
+from collections import OrderedDict
+from time import monotonic
+from typing import Optional
+
+from gi.repository import Gio, GLib, Gtk
+
+from hyperplane.utils.detail_loader import DetailLoader
+
+# The most lists kept without any page using them
+MAX_UNUSED = 32
+# Seconds a list is kept without any page using it
+UNUSED_TIMEOUT = 5 * 60
+# Seconds between two checks for lists unused for too long
+EVICT_INTERVAL = 30
+
+
+class DirectoryCache:
+    """
+    Directory lists by URI and attributes, counting the pages using them.
+
+    Lists that are not used anymore are kept up to date for a while
+    in case their directory is opened again.
+    """
+
+    lists: dict[tuple[str, str, Optional[str]], Gtk.DirectoryList]
+    keys: dict[Gtk.DirectoryList, tuple[str, str, Optional[str]]]
+    loaders: dict[tuple[str, str, Optional[str]], DetailLoader]
+    refs: dict[tuple[str, str, Optional[str]], int]
+    # Keys of unused lists from least to most recently released, with the time
+    unused: OrderedDict[tuple[str, str, Optional[str]], float]
+
+    def __init__(self) -> None:
+        self.lists = {}
+        self.keys = {}
+        self.loaders = {}
+        self.refs = {}
+        self.unused = OrderedDict()
+
+        self.__evict_source = None
+
+    def acquire(
+        self,
+        gfile: Gio.File,
+        attributes: str,
+        detail_attributes: Optional[str] = None,
+    ) -> Gtk.DirectoryList:
+        """
+        Gets the list of the directory at `gfile` with `attributes`,
+        creating it if it isn't listed yet.
+
+        If `detail_attributes` are given, they are loaded by a `DetailLoader`
+        after the list is done loading.
+
+        Call `release` with it once it is not used anymore.
+        """
+        key = (gfile.get_uri(), attributes, detail_attributes)
+
+        if not (dir_list := self.lists.get(key)):
+            dir_list = Gtk.DirectoryList.new(attributes, gfile)
+            self.lists[key] = dir_list
+            self.keys[dir_list] = key
+
+            if detail_attributes:
+                self.loaders[key] = DetailLoader(dir_list, detail_attributes)
+
+        self.refs[key] = self.refs.get(key, 0) + 1
+        self.unused.pop(key, None)
+
+        return dir_list
+
+    def release(self, dir_list: Gtk.DirectoryList) -> None:
+        """Releases `dir_list` acquired with `acquire`."""
+        if not (key := self.keys.get(dir_list)):
+            return
+
+        self.refs[key] -= 1
+        if self.refs[key]:
+            return
+
+        # Try again next time
+        if dir_list.get_error():
+            self.__remove(key)
+            return
+
+        self.unused[key] = monotonic()
+
+        while len(self.unused) > MAX_UNUSED:
+            self.__remove(next(iter(self.unused)))
+
+        if not self.__evict_source:
+            self.__evict_source = GLib.timeout_add_seconds(EVICT_INTERVAL, self.__evict)
+
+    def __evict(self) -> bool:
+        now = monotonic()
+
+        while self.unused:
+            key, released = next(iter(self.unused.items()))
+
+            if now - released < UNUSED_TIMEOUT:
+                return True
+
+            self.__remove(key)
+
+        self.__evict_source = None
+        return False
+
+    def __remove(self, key: tuple[str, str, Optional[str]]) -> None:
+        self.unused.pop(key, None)
+        self.refs.pop(key, None)
+
+        dir_list = self.lists.pop(key)
+        self.keys.pop(dir_list)
+
+        if loader := self.loaders.pop(key, None):
+            loader.cancel()
+
+        # Stop monitoring even if the list is still referenced somewhere
+        dir_list.set_file(None)
+
+
+directory_cache = DirectoryCache()
@@ -0,0 +1,353 @@
+# fast_copy.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Copying and moving of local files without passing their contents through Python.
+
+Files are cloned if the file system supports reflinks, which shares their blocks
+until either copy is modified. Otherwise the kernel copies them
+with `copy_file_range`, or with `sendfile` on older kernels.
+Files of a directory are copied on a pool of threads
+since copying many small files is mostly waiting for the file system.
+
+Moves are renames unless they cross file systems, in which case
+each file is deleted as soon as it is copied.
+"""
+import errno
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from fcntl import ioctl
+from os import PathLike, fspath
+from os.path import join
+from stat import S_IMODE
+from threading import BoundedSemaphore, Lock
+from typing import Callable, Optional
+
+from gi.repository import Gio
+
+# _IOW(0x94, 9, int) from linux/fs.h
+FICLONE = 0x40049409
+# Bytes copied by the kernel between two checks for cancellation
+CHUNK_SIZE = 64 * 1024 * 1024
+MAX_WORKERS = 8
+# Files queued for the pool at once, so huge trees don't fill the memory
+MAX_QUEUED = MAX_WORKERS * 4
+
+# Errors meaning a way of copying is not available for the files at hand
+UNSUPPORTED = {
+    errno.EBADF,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTSUP,
+    errno.ENOTTY,
+    errno.EOPNOTSUPP,
+    errno.EPERM,
+    errno.EXDEV,
+}
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def measure_tree(path: PathLike | str) -> tuple[int, int]:
+    """Gets the number of files and their total size under `path`, not following symlinks."""
+    path = fspath(path)
+    stat = os.lstat(path)
+
+    if not os.path.isdir(path) or os.path.islink(path):
+        return 1, stat.st_size
+
+    n_files = 0
+    n_bytes = 0
+
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                child_files, child_bytes = measure_tree(entry.path)
+                n_files += child_files
+                n_bytes += child_bytes
+            else:
+                n_files += 1
+                n_bytes += entry.stat(follow_symlinks=False).st_size
+
+    return n_files, n_bytes
+
+
+def copy_file(
+    src: PathLike | str,
+    dst: PathLike | str,
+    cancellable: Optional[Gio.Cancellable] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> None:
+    """
+    Copies the file at `src` to `dst` along with its permissions and times.
+
+    Symlinks are copied as symlinks. `dst` must not exist.
+    `progress` is called with the number of bytes copied since the last call.
+    """
+    src = fspath(src)
+    dst = fspath(dst)
+
+    if cancellable:
+        cancellable.set_error_if_cancelled()
+
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+        shutil.copystat(src, dst, follow_symlinks=False)
+        return
+
+    with open(src, "rb") as src_file:
+        src_fd = src_file.fileno()
+        stat = os.fstat(src_fd)
+
+        dst_fd = os.open(
+            dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, S_IMODE(stat.st_mode)
+        )
+
+        try:
+            __copy_contents(src_fd, dst_fd, stat.st_size, cancellable, progress)
+        except BaseException:
+            os.unlink(dst)
+            raise
+        finally:
+            os.close(dst_fd)
+
+    shutil.copystat(src, dst)
+
+
+def rename(src: PathLike | str, dst: PathLike | str) -> bool:
+    """
+    Renames `src` to `dst` if they are on the same file system.
+
+    Returns whether it did. Raises FileExistsError if `dst` exists.
+    """
+    if os.path.lexists(dst):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), fspath(dst))
+
+    try:
+        os.rename(src, dst)
+    except OSError as error:
+        # EBUSY if `src` is a mount point
+        if error.errno not in (errno.EXDEV, errno.EBUSY):
+            raise
+
+        return False
+
+    return True
+
+
+def copy_tree(
+    src: PathLike | str,
+    dst: PathLike | str,
+    cancellable: Optional[Gio.Cancellable] = None,
+    progress: Optional[Callable[[int], None]] = None,
+    file_done: Optional[Callable[[], None]] = None,
+    remove_src: bool = False,
+) -> None:
+    """
+    Copies the file or directory at `src` to `dst` recursively,
+    copying symlinks as symlinks. `dst` must not exist.
+
+    `progress` is called with the number of bytes copied since the last call
+    and `file_done` after each file, from multiple threads.
+    The first error stops the copy and is raised.
+
+    If `remove_src` is true, the copy is a move across file systems:
+    each file is removed as soon as it is copied and each directory once emptied,
+    entries already on the file system of `dst` are renamed instead,
+    and directories that exist in `dst` are merged into.
+    """
+    global _executor  # pylint: disable=global-statement
+
+    src = fspath(src)
+    dst = fspath(dst)
+
+    if os.path.islink(src) or not os.path.isdir(src):
+        copy_file(src, dst, cancellable, progress)
+
+        if remove_src:
+            os.unlink(src)
+
+        if file_done:
+            file_done()
+        return
+
+    if not _executor:
+        _executor = ThreadPoolExecutor(MAX_WORKERS, "hyperplane-copy")
+
+    queued = BoundedSemaphore(MAX_QUEUED)
+    lock = Lock()
+    errors = []
+    futures = []
+    dirs = []
+
+    def copy(src_path: str, dst_path: str) -> None:
+        try:
+            if not errors:
+                copy_file(src_path, dst_path, cancellable, progress)
+
+                if remove_src:
+                    os.unlink(src_path)
+
+                if file_done:
+                    file_done()
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            with lock:
+                errors.append(error)
+        finally:
+            queued.release()
+
+    def walk(src_path: str, dst_path: str) -> None:
+        try:
+            os.mkdir(dst_path)
+        except FileExistsError:
+            if not (remove_src and os.path.isdir(dst_path)):
+                raise
+
+        dirs.append((src_path, dst_path))
+
+        with os.scandir(src_path) as entries:
+            for entry in entries:
+                if errors:
+                    return
+
+                if cancellable:
+                    cancellable.set_error_if_cancelled()
+
+                child_dst = join(dst_path, entry.name)
+
+                # Parts of the tree can be mounted from the file system of `dst`
+                if (
+                    remove_src
+                    and entry.stat(follow_symlinks=False).st_dev == dst_device
+                    and not os.path.lexists(child_dst)
+                ):
+                    try:
+                        os.rename(entry.path, child_dst)
+                        continue
+                    except OSError as error:
+                        # Mount points themselves cannot be renamed, copy them instead
+                        if error.errno not in (errno.EXDEV, errno.EBUSY):
+                            raise
+
+                if entry.is_dir(follow_symlinks=False):
+                    walk(entry.path, child_dst)
+                    continue
+
+                queued.acquire()  # pylint: disable=consider-using-with
+                futures.append(_executor.submit(copy, entry.path, child_dst))
+
+    dst_device = os.stat(os.path.dirname(dst) or ".").st_dev
+
+    try:
+        walk(src, dst)
+    finally:
+        for future in futures:
+            future.result()
+
+    if errors:
+        raise errors[0]
+
+    # After the contents so copying them doesn't change the times
+    for src_path, dst_path in reversed(dirs):
+        shutil.copystat(src_path, dst_path, follow_symlinks=False)
+
+        if remove_src:
+            try:
+                os.rmdir(src_path)
+            except OSError as error:
+                # Mount points are left behind empty
+                if error.errno != errno.EBUSY:
+                    raise
+
+
+def __copy_contents(
+    src_fd: int,
+    dst_fd: int,
+    size: int,
+    cancellable: Optional[Gio.Cancellable],
+    progress: Optional[Callable[[int], None]],
+) -> None:
+    try:
+        ioctl(dst_fd, FICLONE, src_fd)
+    except OSError as error:
+        if error.errno not in UNSUPPORTED:
+            raise
+    else:
+        if progress:
+            progress(size)
+        return
+
+    copied = 0
+
+    for func in (getattr(os, "copy_file_range", None), os.sendfile):
+        if not func:
+            continue
+
+        # sendfile writes at the position of `dst_fd`, which copy_file_range
+        # doesn't move since it is given offsets
+        if func is os.sendfile:
+            os.lseek(dst_fd, copied, os.SEEK_SET)
+
+        try:
+            while True:
+                if cancellable:
+                    cancellable.set_error_if_cancelled()
+
+                if func is os.sendfile:
+                    sent = func(dst_fd, src_fd, copied, CHUNK_SIZE)
+                else:
+                    sent = func(src_fd, dst_fd, CHUNK_SIZE, copied, copied)
+
+                if not sent:
+                    break
+
+                copied += sent
+
+                if progress:
+                    progress(sent)
+        except OSError as error:
+            # The next way of copying continues from `copied`
+            if error.errno not in UNSUPPORTED:
+                raise
+            continue
+
+        # Some file systems report no more data before the end of the file,
+        # let the next way of copying try the rest
+        if copied >= size:
+            return
+
+    # Neither is available or both stopped early, copy through userspace
+    while chunk := os.pread(src_fd, CHUNK_SIZE, copied):
+        if cancellable:
+            cancellable.set_error_if_cancelled()
+
+        view = memoryview(chunk)
+        while view:
+            written = os.pwrite(dst_fd, view, copied)
+            view = view[written:]
+            copied += written
+
+        if progress:
+            progress(len(chunk))
+
+    if copied < size:
+        raise OSError(
+            errno.EIO, f"Copied {copied} of {size} bytes before the end of the file"
+        )
@@ -0,0 +1,416 @@
+# file_operations.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+A queue of cancellable file operations reporting their progress.
+
+Each operation runs synchronous Gio calls on its own thread,
+and only a few of them run at the same time so large copies
+don't compete with each other for the disk.
+"""
+import logging
+from collections import deque
+from enum import Enum
+from threading import Lock
+from time import monotonic
+from typing import Callable, Optional
+
+from gi.repository import Gio, GLib, GObject
+
+from hyperplane.utils.fast_copy import copy_tree, measure_tree, rename
+
+# The maximum number of operations running at the same time
+MAX_RUNNING = 3
+# Milliseconds between two progress updates
+PROGRESS_INTERVAL = 250
+
+ATTRIBUTES = ",".join(
+    (
+        Gio.FILE_ATTRIBUTE_STANDARD_NAME,
+        Gio.FILE_ATTRIBUTE_STANDARD_TYPE,
+        Gio.FILE_ATTRIBUTE_STANDARD_SIZE,
+    )
+)
+
+
+class FileOperationType(Enum):
+    """The kinds of file operations."""
+
+    COPY = "copy"
+    MOVE = "move"
+    DELETE = "delete"
+
+
+class HypFileOperation(GObject.Object):
+    """
+    A file operation from `src` to `dst`, or on `src` only for deletions.
+
+    Directories are handled recursively and symlinks are never followed.
+    """
+
+    __gtype_name__ = "HypFileOperation"
+
+    kind: FileOperationType
+    src: Gio.File
+    dst: Optional[Gio.File]
+    callback: Optional[Callable[[], None]]
+    cancellable: Gio.Cancellable
+
+    # Totals are 0 until they are known
+    total_bytes: int = 0
+    total_files: int = 0
+    done_bytes: int = 0
+    done_files: int = 0
+
+    started: Optional[float] = None
+    error: Optional[Exception] = None
+
+    def __init__(
+        self,
+        kind: FileOperationType,
+        src: Gio.File,
+        dst: Optional[Gio.File] = None,
+        callback: Optional[Callable[[], None]] = None,
+    ) -> None:
+        super().__init__()
+
+        self.kind = kind
+        self.src = src
+        self.dst = dst
+        self.callback = callback
+        self.cancellable = Gio.Cancellable.new()
+        self.lock = Lock()
+
+        # Bytes done by files that are already copied
+        self.__base_bytes = 0
+
+    @GObject.Signal(name="progress")
+    def progress(self) -> None:
+        """Emitted periodically while the operation is running."""
+
+    @GObject.Signal(name="finished")
+    def finished(self, success: bool) -> None:
+        """Emitted once the operation is done, failed or was cancelled."""
+
+    def cancel(self) -> None:
+        """Cancels the operation, whether it is running or still queued."""
+        self.cancellable.cancel()
+
+    def get_throughput(self) -> float:
+        """Gets the average bytes per second since the operation started."""
+        if not self.started or not (elapsed := monotonic() - self.started):
+            return 0
+
+        return self.done_bytes / elapsed
+
+    def get_eta(self) -> Optional[float]:
+        """Gets the estimated number of seconds left, or None if it is unknown."""
+        if not self.total_bytes or not (throughput := self.get_throughput()):
+            return None
+
+        return max(0, self.total_bytes - self.done_bytes) / throughput
+
+    def run(self) -> None:
+        """Runs the operation, blocking. Call through `file_operations` instead."""
+        self.started = monotonic()
+
+        try:
+            match self.kind:
+                case FileOperationType.COPY:
+                    self.__copy_tree(self.src, self.dst)
+                case FileOperationType.MOVE:
+                    self.__move()
+                case FileOperationType.DELETE:
+                    self.__delete(self.src)
+        except (GLib.Error, OSError) as error:
+            self.error = error
+
+            if self.cancellable.is_cancelled():
+                logging.debug(
+                    'Cancelled %s of "%s"', self.kind.value, self.src.get_uri()
+                )
+            else:
+                logging.error(
+                    'Cannot %s "%s": %s', self.kind.value, self.src.get_uri(), error
+                )
+
+    def __copy_tree(
+        self,
+        src: Gio.File,
+        dst: Gio.File,
+        file_info: Optional[Gio.FileInfo] = None,
+    ) -> None:
+        # Let the kernel copy local files
+        if (src_path := src.get_path()) and (dst_path := dst.get_path()):
+            n_files, n_bytes = measure_tree(src_path)
+
+            with self.lock:
+                self.total_files += n_files
+                self.total_bytes += n_bytes
+
+            copy_tree(
+                src_path,
+                dst_path,
+                self.cancellable,
+                self.__add_bytes,
+                self.__add_file,
+            )
+            return
+
+        self.__measure(src, file_info)
+        self.__copy(src, dst, file_info)
+
+    def __add_bytes(self, n_bytes: int) -> None:
+        with self.lock:
+            self.__base_bytes += n_bytes
+            self.done_bytes = self.__base_bytes
+
+    def __add_file(self) -> None:
+        with self.lock:
+            self.done_files += 1
+
+    def __measure(self, gfile: Gio.File, file_info: Optional[Gio.FileInfo] = None):
+        if not file_info:
+            file_info = gfile.query_info(
+                ATTRIBUTES, Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS, self.cancellable
+            )
+
+        if file_info.get_file_type() != Gio.FileType.DIRECTORY:
+            with self.lock:
+                self.total_files += 1
+                self.total_bytes += file_info.get_size()
+            return
+
+        enumerator = gfile.enumerate_children(
+            ATTRIBUTES, Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS, self.cancellable
+        )
+
+        while child_info := enumerator.next_file(self.cancellable):
+            self.__measure(enumerator.get_child(child_info), child_info)
+
+    def __copy(
+        self,
+        src: Gio.File,
+        dst: Gio.File,
+        file_info: Optional[Gio.FileInfo] = None,
+    ) -> None:
+        if not file_info:
+            file_info = src.query_info(
+                ATTRIBUTES, Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS, self.cancellable
+            )
+
+        if file_info.get_file_type() != Gio.FileType.DIRECTORY:
+            src.copy(
+                dst,
+                Gio.FileCopyFlags.NOFOLLOW_SYMLINKS,
+                self.cancellable,
+                self.__copy_progress,
+            )
+
+            with self.lock:
+                self.__base_bytes += file_info.get_size()
+                self.done_bytes = self.__base_bytes
+                self.done_files += 1
+            return
+
+        dst.make_directory(self.cancellable)
+
+        enumerator = src.enumerate_children(
+            ATTRIBUTES, Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS, self.cancellable
+        )
+
+        while child_info := enumerator.next_file(self.cancellable):
+            self.__copy(
+                enumerator.get_child(child_info),
+                dst.get_child(child_info.get_name()),
+                child_info,
+            )
+
+        # Permissions and times, after the children so they don't change the times
+        src.copy_attributes(dst, Gio.FileCopyFlags.NOFOLLOW_SYMLINKS, self.cancellable)
+
+    def __copy_progress(self, current: int, _total: int, *_args) -> None:
+        with self.lock:
+            self.done_bytes = self.__base_bytes + current
+
+    def __move(self) -> None:
+        if (src_path := self.src.get_path()) and (dst_path := self.dst.get_path()):
+            self.__move_path(src_path, dst_path)
+            return
+
+        file_info = self.src.query_info(
+            ATTRIBUTES, Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS, self.cancellable
+        )
+
+        with self.lock:
+            self.total_files = 1
+
+            # Files moved across file systems are copied by Gio
+            if file_info.get_file_type() != Gio.FileType.DIRECTORY:
+                self.total_bytes = file_info.get_size()
+
+        try:
+            self.src.move(
+                self.dst,
+                Gio.FileCopyFlags.NOFOLLOW_SYMLINKS,
+                self.cancellable,
+                self.__copy_progress,
+            )
+        except GLib.Error as error:
+            if not error.matches(Gio.io_error_quark(), Gio.IOErrorEnum.WOULD_RECURSE):
+                raise
+
+            # Gio can't move directories across file systems, so copy and delete
+            with self.lock:
+                self.total_files = 0
+
+            self.__copy_tree(self.src, self.dst, file_info)
+            self.__delete(self.src, file_info)
+            return
+
+        with self.lock:
+            self.done_bytes = self.total_bytes
+            self.done_files = 1
+
+    def __move_path(self, src_path: str, dst_path: str) -> None:
+        with self.lock:
+            self.total_files = 1
+
+        if rename(src_path, dst_path):
+            with self.lock:
+                self.done_files = 1
+            return
+
+        # Across file systems, only ever have a few files copied but not yet deleted
+        n_files, n_bytes = measure_tree(src_path)
+
+        with self.lock:
+            self.total_files = n_files
+            self.total_bytes = n_bytes
+
+        copy_tree(
+            src_path,
+            dst_path,
+            self.cancellable,
+            self.__add_bytes,
+            self.__add_file,
+            remove_src=True,
+        )
+
+    def __delete(
+        self, gfile: Gio.File, file_info: Optional[Gio.FileInfo] = None
+    ) -> None:
+        if not file_info:
+            file_info = gfile.query_info(
+                ATTRIBUTES, Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS, self.cancellable
+            )
+
+        if file_info.get_file_type() == Gio.FileType.DIRECTORY:
+            enumerator = gfile.enumerate_children(
+                ATTRIBUTES, Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS, self.cancellable
+            )
+
+            while child_info := enumerator.next_file(self.cancellable):
+                self.__delete(enumerator.get_child(child_info), child_info)
+
+        gfile.delete(self.cancellable)
+
+        # Moves count the files they delete as part of the copy
+        if self.kind == FileOperationType.DELETE:
+            with self.lock:
+                self.done_files += 1
+
+
+class FileOperations:
+    """Runs file operations, at most `MAX_RUNNING` at a time."""
+
+    operations: Gio.ListStore
+    pending: deque[HypFileOperation]
+    running: set[HypFileOperation]
+
+    def __init__(self) -> None:
+        self.operations = Gio.ListStore.new(HypFileOperation)
+        self.pending = deque()
+        self.running = set()
+
+    def add(self, operation: HypFileOperation) -> HypFileOperation:
+        """
+        Queues `operation` and returns it.
+
+        `operations` lists every operation until it is finished.
+        """
+        self.operations.append(operation)
+        self.pending.append(operation)
+        self.__start()
+
+        return operation
+
+    def __start(self) -> None:
+        while self.pending and len(self.running) < MAX_RUNNING:
+            operation = self.pending.popleft()
+
+            if operation.cancellable.is_cancelled():
+                self.__finish(operation)
+                continue
+
+            self.running.add(operation)
+
+            def update(operation: HypFileOperation) -> bool:
+                if operation not in self.running:
+                    return False
+
+                operation.emit("progress")
+                return True
+
+            def run(operation: HypFileOperation) -> None:
+                try:
+                    operation.run()
+                except Exception as error:  # pylint: disable=broad-exception-caught
+                    # Still finish it so the queue keeps going
+                    operation.error = error
+                    logging.exception(
+                        'Cannot %s "%s"', operation.kind.value, operation.src.get_uri()
+                    )
+                finally:
+                    GLib.idle_add(self.__done, operation)
+
+            GLib.timeout_add(PROGRESS_INTERVAL, update, operation)
+            GLib.Thread.new(None, run, operation)
+
+    def __finish(self, operation: HypFileOperation) -> None:
+        self.running.discard(operation)
+
+        found, position = self.operations.find(operation)
+        if found:
+            self.operations.remove(position)
+
+        success = not (operation.error or operation.cancellable.is_cancelled())
+
+        operation.emit("progress")
+        operation.emit("finished", success)
+
+        if success and operation.callback:
+            operation.callback()
+
+    def __done(self, operation: HypFileOperation) -> None:
+        self.__finish(operation)
+        self.__start()
+
+
+file_operations = FileOperations()
@@ -19,9 +19,8 @@
 
 """Miscellaneous utilities for file operations."""
 import logging
-import shutil
 from itertools import count
-from os import PathLike, getenv
+from os import PathLike
 from pathlib import Path
 from typing import Callable, Optional
 from urllib.parse import quote
@@ -30,18 +29,29 @@ from gi.repository import Gio, GLib, Gtk
 
 from hyperplane import shared
 from hyperplane.file_properties import DOT_IS_NOT_EXTENSION
+from hyperplane.utils.file_operations import (
+    FileOperationType,
+    HypFileOperation,
+    file_operations,
+)
 from hyperplane.utils.tags import path_represents_tags
-
-# TODO: Make file operations cancellable
+from hyperplane.utils.trash import (
+    TrashedFile,
+    find_trashed,
+    get_trash_path,
+    trash_files,
+)
 
 
 class YouAreStupid(Exception):
     """Raised when you try to move a folder into itself."""
 
 
-def copy(src: Gio.File, dst: Gio.File, callback: Optional[Callable] = None) -> None:
+def copy(
+    src: Gio.File, dst: Gio.File, callback: Optional[Callable] = None
+) -> Optional[HypFileOperation]:
     """
-    Asynchronously copies a file or directory from `src` to `dst`.
+    Queues copying a file or directory from `src` to `dst` in `file_operations`.
 
     Directories are copied recursively.
 
@@ -49,6 +59,7 @@ def copy(src: Gio.File, dst: Gio.File, callback: Optional[Callable] = None) -> N
     FileExistsError will be raised.
 
     Calls `callback` if the operation was successful.
+    Returns the operation, which can be used to follow its progress or cancel it.
     """
 
     if dst.query_exists():
@@ -60,127 +71,65 @@ def copy(src: Gio.File, dst: Gio.File, callback: Optional[Callable] = None) -> N
         and (not parent_path.is_dir())
     )
 
-    if src.query_file_type(Gio.FileQueryInfoFlags.NONE) == Gio.FileType.REGULAR:
-
-        def g_copy_cb(gfile: Gio.File, result: Gio.AsyncResult) -> None:
-            try:
-                gfile.copy_finish(result)
-            except GLib.Error as error:
-                logging.error(
-                    'File "%s" was unsuccessfully copied: %s', gfile.get_uri(), error
-                )
-                return
-
-            if tag_location_created:
-                __emit_tags_changed(dst)
-
-            if callback:
-                callback()
-
-        src.copy_async(
-            dst,
-            Gio.FileCopyFlags.NOFOLLOW_SYMLINKS,
-            GLib.PRIORITY_DEFAULT,
-            None,
-            None,
-            g_copy_cb,
-        )
-        return
-
-    try:
-        src_path = Path(get_gfile_path(src))
-    except FileNotFoundError:
-        logging.error('Cannot copy file "%s": Source has not path.', src.get_uri())
-        return
-
-    try:
-        dst_path = Path(get_gfile_path(dst))
-    except FileNotFoundError:
-        logging.error(
-            'Cannot copy file to "%s": Destination has not path.', dst.get_uri()
-        )
-        return
-
-    def path_copy_cb(_task: Gio.Task, _res: Gio.Task) -> None:
-        # TODO: Figure out error handling here?
+    if (parent := dst.get_parent()) and not parent.query_exists():
+        try:
+            parent.make_directory_with_parents()
+        except GLib.Error as error:
+            logging.error('Cannot create parents for "%s": %s', dst.get_uri(), error)
+            return None
 
+    def copy_cb() -> None:
         if tag_location_created:
             __emit_tags_changed(dst)
 
         if callback:
             callback()
 
-    Gio.Task.new(callback=path_copy_cb).run_in_thread(
-        lambda *_: __copy_path(src_path, dst_path)
+    return file_operations.add(
+        HypFileOperation(FileOperationType.COPY, src, dst, copy_cb)
     )
 
 
-def move(src: Gio.File, dst: Gio.File) -> None:
+def move(src: Gio.File, dst: Gio.File) -> Optional[HypFileOperation]:
     """
-    Asynchronously moves a file or directory from `src` to `dst`.
+    Queues moving a file or directory from `src` to `dst` in `file_operations`.
 
     Directories are moved recursively.
 
     If a file or directory with the same name already exists at `dst`,
     FileExistsError will be raised.
+
+    Returns the operation, which can be used to follow its progress or cancel it.
     """
 
     if dst.query_exists():
         raise FileExistsError
 
     if not (parent := dst.get_parent()):
-        return
+        return None
 
     if parent.get_uri() == src.get_uri():
         raise YouAreStupid
 
+    tag_location_created = (
+        (path := dst.get_path())
+        and path_represents_tags((parent_path := Path(path).parent))
+        and (not parent_path.is_dir())
+    )
+
     if not parent.query_exists():
         try:
             parent.make_directory_with_parents()
         except GLib.Error as error:
             logging.error('Cannot create parents for "%s": %s', dst.get_uri(), error)
-            return
+            return None
 
-    def emit_tags_changed() -> None:
-        if (
-            (path := dst.get_path())
-            and path_represents_tags((path_parent := Path(path).parent))
-            and (not path_parent.is_dir())
-        ):
+    def move_cb() -> None:
+        if tag_location_created:
             __emit_tags_changed(dst)
 
-    def delete_src() -> None:
-        try:
-            rm(src)
-        except FileNotFoundError as error:
-            logging.error(
-                'Cannot remove source "%s" during copy & delete move operation: %s',
-                src.get_uri(),
-                error,
-            )
-            return
-
-    def move_cb(_gfile: Gio.File, result: Gio.Task = None):
-        if result.had_error():
-            # Try copy and delete myself as Gio doesn't support recursive copes
-            try:
-                copy(src, dst, delete_src)
-            except FileExistsError:
-                logging.debug(
-                    'Cannot move file to "%s": Destination already exists.',
-                    dst.get_uri(),
-                )
-                return
-        else:
-            emit_tags_changed()
-
-    src.move_async(
-        dst,
-        Gio.FileCopyFlags.NOFOLLOW_SYMLINKS,
-        GLib.PRIORITY_DEFAULT,
-        None,
-        None,
-        move_cb,
+    return file_operations.add(
+        HypFileOperation(FileOperationType.MOVE, src, dst, move_cb)
     )
 
 
@@ -207,23 +156,44 @@ def restore(
     path: Optional[PathLike | str] = None,
     t: Optional[int] = None,
     gfile: Optional[Gio.File] = None,
+    name: Optional[str] = None,
 ) -> None:
     """
     Tries to asynchronously restore a file or directory from the trash
     either deleted from `path` at `t` or represented by `gfile`.
+
+    `name` is the name of the file in the home trash, if it is known.
     """
 
     if path:
         path = Path(path)
 
-    def do_restore(trash_file, orig_file):
+    def do_restore(trash_file, orig_file, trashinfo=None):
         # Move the item in Trash/files back to the original location
         try:
-            move(trash_file, orig_file)
+            operation = move(trash_file, orig_file)
         except (FileExistsError, YouAreStupid) as error:
             logging.debug('Cannot restore file "%s": %s', trash_file.get_uri(), error)
             return
 
+        if not (operation and trashinfo):
+            return
+
+        def finished_cb(_operation, success):
+            if not success:
+                return
+
+            try:
+                trashinfo.delete()
+            except GLib.Error as error:
+                logging.error(
+                    'Cannot remove trashinfo for file "%s": %s',
+                    orig_file.get_uri(),
+                    error,
+                )
+
+        operation.connect("finished", finished_cb)
+
     def query_cb(gfile, result):
         try:
             file_info = gfile.query_info_finish(result)
@@ -243,6 +213,17 @@ def restore(
         )
 
     if path and t:
+        # Files in the home trash are moved back directly, without going through Gio
+        if name := find_trashed(path, t, name):
+            trash_path = get_trash_path()
+
+            do_restore(
+                Gio.File.new_for_path(str(trash_path / "files" / name)),
+                Gio.File.new_for_path(str(path)),
+                Gio.File.new_for_path(str(trash_path / "info" / f"{name}.trashinfo")),
+            )
+            return
+
         try:
             # Look up the trashed file's path and original path
             trash_file, orig_file = __trash_lookup(path, t)
@@ -286,11 +267,12 @@ def clear_recent_files() -> None:
     shared.recent_manager.purge_items()
 
 
-def rm(gfile: Gio.File) -> None:
+def rm(gfile: Gio.File) -> Optional[HypFileOperation]:
     """
-    Tries to asynchronously remove `gfile`.
+    Queues removing `gfile` in `file_operations`.
 
     Directories are removed recursively.
+    Returns the operation, which can be used to follow its progress or cancel it.
     """
     try:
         path = Path(get_gfile_path(gfile))
@@ -299,12 +281,12 @@ def rm(gfile: Gio.File) -> None:
 
     if path == shared.home_path:
         logging.debug("Someone tried to remove ~.")
-        return
+        return None
 
     if path and path.is_dir():
         # Remove the .trashinfo file if the file is in the trash
         # This needs to be done synchronously because Gio won't find the file
-        # if it is already removed by rmtree
+        # if it is already removed
         if gfile.get_uri_scheme() == "trash":
             file_info = gfile.query_info(
                 Gio.FILE_ATTRIBUTE_TRASH_ORIG_PATH, Gio.FileQueryInfoFlags.NONE
@@ -315,14 +297,14 @@ def rm(gfile: Gio.File) -> None:
                     Gio.FILE_ATTRIBUTE_TRASH_ORIG_PATH
                 )
             ):
-                return
+                return None
 
             __remove_trashinfo(gfile, orig_path)
 
-        # Gio doesn't allow for recursive deletion
-        Gio.Task.new().run_in_thread(lambda *_: shutil.rmtree(path, ignore_errors=True))
-    else:
-        gfile.delete_async(GLib.PRIORITY_DEFAULT)
+        # The trash backend doesn't allow for recursive deletion
+        gfile = Gio.File.new_for_path(str(path))
+
+    return file_operations.add(HypFileOperation(FileOperationType.DELETE, gfile))
 
 
 def get_paste_gfile(gfile: Gio.File, number_only: bool = False) -> Gio.File:
@@ -472,28 +454,28 @@ def validate_name(
     return True, None
 
 
-def trash(*gfiles: Gio.File) -> None:
-    """Tries to asynchronously trash `gfiles`."""
+def trash(
+    *gfiles: Gio.File,
+    callback: Optional[Callable[[list[TrashedFile], list[Gio.File]], None]] = None,
+) -> list[TrashedFile]:
+    """
+    Tries to asynchronously trash `gfiles` in batches.
 
-    for gfile in gfiles:
-        gfile.trash_async(GLib.PRIORITY_DEFAULT)
+    Returns a list the files are added to as they are trashed,
+    which can be used to restore them.
+    `callback` is called with the list once all of them are done,
+    along with the files that could not be trashed.
+    """
 
+    trashed = []
 
-def __copy_path(src: PathLike | str, dst: PathLike | str) -> None:
-    src = Path(src)
-    dst = Path(dst)
+    def done(failed: list[Gio.File]) -> None:
+        if callback:
+            callback(trashed, failed)
 
-    if not (parent := dst.parent).is_dir():
-        parent.mkdir(parents=True)
+    trash_files(gfiles, trashed.extend, done)
 
-    try:
-        shutil.copytree(src, dst, symlinks=True)
-    except FileExistsError:
-        logging.error('"Copying "%s" to "%s" failed: Destination exists.', src, dst)
-        return
-    except shutil.Error as error:
-        logging.error('"Copying "%s" to "%s" failed: %s', src, dst, error)
-        return
+    return trashed
 
 
 def __trash_lookup(path: PathLike | str, t: int) -> (Gio.File, Gio.File):
@@ -541,12 +523,7 @@ def __remove_trashinfo(trash_file: Gio.File, orig_path: str) -> None:
         )
         return
 
-    trashinfo = (
-        Path(getenv("HOST_XDG_DATA_HOME", str(Path.home() / ".local" / "share")))
-        / "Trash"
-        / "info"
-        / (trash_path.name + ".trashinfo")
-    )
+    trashinfo = get_trash_path() / "info" / (trash_path.name + ".trashinfo")
 
     try:
         keyfile = GLib.KeyFile.new()
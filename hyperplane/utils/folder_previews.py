@@ -0,0 +1,244 @@
+# folder_previews.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Selection of the children previewed on top of folder icons.
+
+The children of a directory are read in batches until enough of them
+can be previewed, then cached along with the modification time
+of the directory, which changes whenever an entry is added, removed or renamed.
+The cache is shared by every page of every window.
+"""
+import logging
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional
+
+from gi.repository import Gio, GLib
+
+from hyperplane import shared
+
+# The number of children previewed on a folder icon
+PREVIEW_COUNT = 3
+# The number of children read at once to find previews among, in case some are hidden
+PREVIEW_BATCH = 16
+MAX_CACHED_DIRS = 2000
+
+ATTRIBUTES = ",".join(
+    (
+        Gio.FILE_ATTRIBUTE_STANDARD_SYMBOLIC_ICON,
+        Gio.FILE_ATTRIBUTE_STANDARD_CONTENT_TYPE,
+        Gio.FILE_ATTRIBUTE_THUMBNAIL_PATH,
+        Gio.FILE_ATTRIBUTE_STANDARD_NAME,
+        Gio.FILE_ATTRIBUTE_STANDARD_IS_HIDDEN,
+        Gio.FILE_ATTRIBUTE_TIME_MODIFIED,
+    )
+)
+
+
+class FolderPreview(NamedTuple):
+    """A child of a directory that can be previewed on its icon."""
+
+    gfile: Gio.File
+    content_type: str
+    gicon: Gio.Icon
+    thumbnail_path: Optional[str]
+    mtime: Optional[int]
+    hidden: bool
+
+
+Callback = Callable[[Optional[list[FolderPreview]]], None]
+
+
+class FolderPreviews:
+    """Finds the children to preview on folder icons, caching them per directory."""
+
+    cache: OrderedDict[str, tuple[int, tuple[FolderPreview, ...]]]
+    # Callbacks waiting for a directory that is being read, by URI and modification time
+    waiting: dict[tuple[str, int], list[tuple[Callback, Optional[Gio.Cancellable]]]]
+
+    def __init__(self) -> None:
+        self.cache = OrderedDict()
+        self.waiting = {}
+
+    def request(
+        self,
+        gfile: Gio.File,
+        mtime: Optional[int],
+        callback: Callback,
+        cancellable: Optional[Gio.Cancellable] = None,
+    ) -> None:
+        """
+        Gets the children to preview for the directory `gfile` modified at `mtime`.
+
+        `callback` is called on the main thread with at most `PREVIEW_COUNT`
+        previews, skipping hidden children unless they are shown,
+        or None if the directory cannot be read.
+        It is not called if `cancellable` is cancelled by then.
+        """
+        uri = gfile.get_uri()
+        waiting = [(callback, cancellable)]
+
+        # Without a modification time there is no way to tell whether the cache is stale
+        if mtime:
+            if (cached := self.cache.get(uri)) and cached[0] == mtime:
+                self.cache.move_to_end(uri)
+                callback(self.__select(cached[1]))
+                return
+
+            if (key := (uri, mtime)) in self.waiting:
+                self.waiting[key].extend(waiting)
+                return
+
+            # Later requests for the same directory are added to this list
+            self.waiting[key] = waiting
+        else:
+            key = None
+
+        gfile.enumerate_children_async(
+            ATTRIBUTES,
+            Gio.FileQueryInfoFlags.NONE,
+            GLib.PRIORITY_DEFAULT,
+            None,
+            self.__enumerate_cb,
+            key,
+            waiting,
+        )
+
+    def __enumerate_cb(
+        self,
+        gfile: Gio.File,
+        result: Gio.AsyncResult,
+        key: Optional[tuple[str, int]],
+        waiting: list[tuple[Callback, Optional[Gio.Cancellable]]],
+    ) -> None:
+        try:
+            enumerator = gfile.enumerate_children_finish(result)
+        except GLib.Error as error:
+            logging.debug('Cannot preview "%s": %s', gfile.get_uri(), error)
+            self.__deliver(key, waiting, None)
+            return
+
+        # Don't bother reading the children if no one needs them anymore
+        if all(
+            cancellable and cancellable.is_cancelled()
+            for _callback, cancellable in waiting
+        ):
+            self.waiting.pop(key, None)
+            enumerator.close_async(GLib.PRIORITY_DEFAULT, None, None, None)
+            return
+
+        enumerator.next_files_async(
+            PREVIEW_BATCH,
+            GLib.PRIORITY_DEFAULT,
+            None,
+            self.__next_files_cb,
+            gfile,
+            key,
+            waiting,
+            [],
+        )
+
+    def __next_files_cb(
+        self,
+        enumerator: Gio.FileEnumerator,
+        result: Gio.AsyncResult,
+        gfile: Gio.File,
+        key: Optional[tuple[str, int]],
+        waiting: list[tuple[Callback, Optional[Gio.Cancellable]]],
+        previews: list[FolderPreview],
+    ) -> None:
+        try:
+            file_infos = enumerator.next_files_finish(result)
+        except GLib.Error as error:
+            logging.debug('Cannot preview "%s": %s', gfile.get_uri(), error)
+            enumerator.close_async(GLib.PRIORITY_DEFAULT, None, None, None)
+            self.__deliver(key, waiting, None)
+            return
+
+        previews.extend(
+            FolderPreview(
+                gfile.get_child(file_info.get_name()),
+                content_type,
+                file_info.get_symbolic_icon(),
+                file_info.get_attribute_byte_string(Gio.FILE_ATTRIBUTE_THUMBNAIL_PATH),
+                file_info.get_attribute_uint64(Gio.FILE_ATTRIBUTE_TIME_MODIFIED)
+                or None,
+                file_info.get_is_hidden(),
+            )
+            for file_info in file_infos
+            if (content_type := file_info.get_content_type())
+        )
+
+        # Read on until there are enough previews even if hidden ones are not shown
+        if file_infos and (
+            sum(not preview.hidden for preview in previews) < PREVIEW_COUNT
+        ):
+            if all(
+                cancellable and cancellable.is_cancelled()
+                for _callback, cancellable in waiting
+            ):
+                self.waiting.pop(key, None)
+                enumerator.close_async(GLib.PRIORITY_DEFAULT, None, None, None)
+                return
+
+            enumerator.next_files_async(
+                PREVIEW_BATCH,
+                GLib.PRIORITY_DEFAULT,
+                None,
+                self.__next_files_cb,
+                gfile,
+                key,
+                waiting,
+                previews,
+            )
+            return
+
+        enumerator.close_async(GLib.PRIORITY_DEFAULT, None, None, None)
+        previews = tuple(previews)
+
+        if key:
+            self.cache[key[0]] = (key[1], previews)
+            self.cache.move_to_end(key[0])
+
+            while len(self.cache) > MAX_CACHED_DIRS:
+                self.cache.popitem(last=False)
+
+        self.__deliver(key, waiting, previews)
+
+    def __deliver(
+        self,
+        key: Optional[tuple[str, int]],
+        waiting: list[tuple[Callback, Optional[Gio.Cancellable]]],
+        previews: Optional[tuple[FolderPreview, ...]],
+    ) -> None:
+        self.waiting.pop(key, None)
+
+        for callback, cancellable in waiting:
+            if cancellable and cancellable.is_cancelled():
+                continue
+
+            callback(None if previews is None else self.__select(previews))
+
+    def __select(self, previews: tuple[FolderPreview, ...]) -> list[FolderPreview]:
+        return [
+            preview for preview in previews if shared.show_hidden or not preview.hidden
+        ][:PREVIEW_COUNT]
+
+
+folder_previews = FolderPreviews()
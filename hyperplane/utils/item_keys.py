@@ -0,0 +1,191 @@
+# item_keys.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Per-item keys fetched once when items enter a model.
+
+Filtering and sorting look at the same few attributes of every item over and over,
+and each lookup through PyGObject is far slower than reading a Python attribute.
+"""
+from bisect import bisect_right
+from itertools import accumulate, count
+from typing import Any, Iterable, Optional
+
+from gi.repository import Gio, GLib
+
+_serials = count()
+
+
+class ItemKey:
+    """What the filter and the sorter need to know about a `Gio.FileInfo`."""
+
+    __slots__ = (
+        "serial",
+        "name",
+        "hidden",
+        "path",
+        "tags",
+        "tagged",
+        "sort_key",
+        "sort_serial",
+        "natural_key",
+    )
+
+    serial: int
+    name: str
+    hidden: bool
+    path: Optional[str]
+
+    # The set of tags `tagged` was computed for
+    tags: Optional[frozenset[str]]
+    tagged: bool
+
+    # Set by the sorter, `sort_serial` tells which sort order `sort_key` is for
+    sort_key: Any
+    sort_serial: int
+    # Doesn't depend on the sort order so it is kept for the lifetime of the item
+    natural_key: Optional[tuple]
+
+    def __init__(self, file_info: Gio.FileInfo, serial: int = -1) -> None:
+        self.serial = serial
+        self.name = file_info.get_display_name().lower()
+
+        # Always show trashed hidden files
+        try:
+            self.hidden = (
+                file_info.get_is_hidden() and not file_info.get_deletion_date()
+            )
+        except GLib.Error:
+            self.hidden = False
+
+        self.path = (
+            file_info.get_attribute_object("standard::file").get_path()
+            if file_info.get_content_type() == "inode/directory"
+            else None
+        )
+
+        self.tags = None
+        self.tagged = False
+
+        self.sort_key = None
+        self.sort_serial = -1
+        self.natural_key = None
+
+
+class ItemKeyStore:
+    """
+    Mirrors the items of a model as `ItemKey`s.
+
+    Connect the store to the model with `set_model` before any filter model does
+    so keys are ready by the time the items are filtered.
+    """
+
+    model: Optional[Gio.ListModel] = None
+    handler: Optional[int] = None
+
+    infos: list[Gio.FileInfo]
+    keys: dict[Gio.FileInfo, ItemKey]
+
+    # Names of all mirrored items separated by NUL characters, for batched searching
+    __blob: Optional[str] = None
+    __starts: list[int]
+    __blob_keys: list[ItemKey]
+
+    def __init__(self) -> None:
+        self.infos = []
+        self.keys = {}
+        self.__starts = []
+        self.__blob_keys = []
+
+    def set_model(self, model: Optional[Gio.ListModel]) -> None:
+        """Starts mirroring `model`, dropping the keys of the previous one."""
+        if self.model and self.handler:
+            self.model.disconnect(self.handler)
+
+        self.model = model
+        self.handler = None
+        self.infos = []
+        self.keys = {}
+        self.__blob = None
+
+        if not model:
+            return
+
+        self.handler = model.connect("items-changed", self.__items_changed)
+        self.__items_changed(model, 0, 0, model.get_n_items())
+
+    def get(self, file_info: Gio.FileInfo) -> ItemKey:
+        """
+        Gets the key for `file_info`.
+
+        Items not in the model get a fresh key that is not cached.
+        """
+        try:
+            return self.keys[file_info]
+        except KeyError:
+            return ItemKey(file_info)
+
+    def get_serial(self) -> int:
+        """Gets a serial larger than that of any existing key."""
+        return next(_serials)
+
+    def search(
+        self, search: str, candidates: Optional[Iterable[ItemKey]] = None
+    ) -> set[ItemKey]:
+        """
+        Gets the keys whose name contains `search`, which should be lowercase.
+
+        If `candidates` is given, only those are considered.
+        """
+        if candidates is not None:
+            return {key for key in candidates if search in key.name}
+
+        if self.__blob is None:
+            self.__blob_keys = list(self.keys.values())
+            names = [key.name for key in self.__blob_keys]
+            self.__starts = [0, *accumulate(len(name) + 1 for name in names)]
+            self.__blob = "\0".join(names)
+
+        found = set()
+        position = self.__blob.find(search)
+
+        while position != -1:
+            index = bisect_right(self.__starts, position) - 1
+            found.add(self.__blob_keys[index])
+
+            # Skip to the next name so each item is only found once
+            position = self.__blob.find(search, self.__starts[index + 1])
+
+        return found
+
+    def __items_changed(
+        self, model: Gio.ListModel, position: int, removed: int, added: int
+    ) -> Any:
+        for file_info in self.infos[position : position + removed]:
+            self.keys.pop(file_info, None)
+
+        new_infos = [
+            model.get_item(index) for index in range(position, position + added)
+        ]
+
+        for file_info in new_infos:
+            self.keys[file_info] = ItemKey(file_info, next(_serials))
+
+        self.infos[position : position + removed] = new_infos
+        self.__blob = None
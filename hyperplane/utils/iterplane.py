@@ -19,39 +19,96 @@
 
 """Get the existing paths that contain files tagged `filter_tags`."""
 from pathlib import Path
-from typing import Generator, Iterable
+from threading import Lock
+from typing import Callable, Generator, Iterable, Optional
+
+from gi.repository import Gio, GLib
 
 from hyperplane import shared
+from hyperplane.utils.plane_index import plane_index
+from hyperplane.utils.tag_masks import walk_planes, walk_planes_parallel
 
 
 def iterplane(filter_tags: Iterable[str]) -> Generator:
-    """Get the existing paths that contain files tagged `filter_tags`."""
+    """
+    Get the existing paths that contain files tagged `filter_tags`.
+
+    The paths are looked up in the tag index if it is available.
+    Otherwise, `shared.home_path` is walked.
+    """
     if not filter_tags:
         return
 
-    tags = {tag: tag in filter_tags for tag in shared.tags}
+    if (planes := plane_index.lookup(filter_tags)) is not None:
+        yield from planes
+        return
+
+    yield from walk_planes(shared.home_path, shared.tags, filter_tags)
+
+
+def iterplane_async(
+    filter_tags: Iterable[str],
+    callback: Callable[[list[Path]], None],
+    done_callback: Optional[Callable[[], None]] = None,
+    cancellable: Optional[Gio.Cancellable] = None,
+) -> None:
+    """
+    Get the existing paths that contain files tagged `filter_tags` without blocking.
+
+    `callback` is called on the main thread with batches of paths as they are found,
+    then `done_callback` is called once the search is over.
+    Neither is called after `cancellable` is cancelled.
+    """
+
+    def is_cancelled() -> bool:
+        return bool(cancellable and cancellable.is_cancelled())
+
+    def done() -> None:
+        if done_callback and not is_cancelled():
+            done_callback()
+
+    def flush_index(planes: list[Path]) -> None:
+        if planes and not is_cancelled():
+            callback(planes)
+
+        done()
+
+    filter_tags = tuple(filter_tags)
+
+    if filter_tags and (planes := plane_index.lookup(filter_tags)) is not None:
+        GLib.idle_add(flush_index, planes)
+        return
+
+    found = []
+    lock = Lock()
+
+    def flush() -> None:
+        with lock:
+            batch = found.copy()
+            found.clear()
+
+        if batch and not is_cancelled():
+            callback(batch)
 
-    yield from __walk(shared.home_path, tags)
+    def add(planes: list[Path]) -> None:
+        with lock:
+            # Only schedule a flush if there isn't one pending already
+            if not found:
+                GLib.idle_add(flush)
 
+            found.extend(planes)
 
-def __walk(node: Path, tags: dict[str, bool]) -> Generator:
-    if tags.get(node.name):
-        tags.pop(node.name)
+    def walk() -> None:
+        if filter_tags:
+            walk_planes_parallel(
+                shared.home_path,
+                tuple(shared.tags),
+                filter_tags,
+                add,
+                is_cancelled,
+            )
 
-    if not sum(tags.values()):
-        yield node
+        # Runs after the last flush
+        GLib.idle_add(done)
 
-    for child in node.iterdir():
-        if not child.is_dir():
-            continue
-        new_tags = tags.copy()
-        for tag, value in tags.copy().items():
-            if not value:
-                if child.name == tag:
-                    new_tags[tag] = True
-                    yield from __walk(child, new_tags.copy())
-            else:
-                if child.name == tag:
-                    yield from __walk(child, new_tags.copy())
-                else:
-                    break
+    GLib.Thread.new(None, walk)
@@ -0,0 +1,261 @@
+# name_blocks.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Blocks of file names that can be searched for substrings quickly.
+
+Each block holds the names in a few directories as a single lowercase string
+along with a Bloom filter of the trigrams in them.
+A search only scans the blocks whose filter contains every trigram of the query,
+which for most queries is a small fraction of them.
+"""
+from array import array
+from bisect import bisect_right
+from typing import BinaryIO, Iterable, Optional
+
+# About how many names to put in a block
+BLOCK_SIZE = 512
+# The trigrams of the names in a block set about a sixth of these bits
+BLOOM_BITS = 1 << 15
+BLOOM_BYTES = BLOOM_BITS // 8
+
+
+def get_trigram_hashes(text: str) -> set[int]:
+    """Gets the positions in a Bloom filter of the trigrams in `text`."""
+    codes = array("I", text.encode("utf-32-le", "surrogatepass"))
+
+    return {
+        ((a * 0x9E3779B1) ^ (b * 0x85EBCA77) ^ (c * 0xC2B2AE3D)) >> 7 & (BLOOM_BITS - 1)
+        for a, b, c in set(zip(codes, codes[1:], codes[2:]))
+    }
+
+
+class NameBlock:
+    """
+    The names in some directories, with a Bloom filter of their trigrams.
+
+    Directories are relative paths and names can be anything `os.scandir` returns.
+    Blocks are never modified, so they can be shared between threads.
+    """
+
+    dirs: tuple[str, ...]
+    mtimes: tuple[int, ...]
+    # The index of the first name of each directory
+    dir_starts: array
+    # Names separated by NUL characters, and their lowercase version
+    names: str
+    text: str
+    # Where each name starts in `text`
+    starts: array
+    # Whether names start at the same place in `names`, which lowercasing can change
+    same_starts: bool = True
+    bloom: bytes
+
+    def __init__(
+        self,
+        dirs: Iterable[tuple[str, int, Iterable[str]]],
+        bloom: Optional[bytes] = None,
+    ) -> None:
+        """
+        Creates a block for `dirs`, an iterable of relative paths,
+        modification times and the names in them.
+
+        `bloom` can be passed if it is known already, like when loading the block.
+        """
+        paths = []
+        mtimes = []
+        self.dir_starts = array("I")
+        self.starts = array("I")
+
+        all_names = []
+        lowercase = []
+        position = 0
+
+        for path, mtime, names in dirs:
+            paths.append(path)
+            mtimes.append(mtime)
+            self.dir_starts.append(len(all_names))
+
+            for name in names:
+                all_names.append(name)
+                lowercase.append(lower := name.lower())
+
+                if len(lower) != len(name):
+                    self.same_starts = False
+
+                self.starts.append(position)
+                position += len(lower) + 1
+
+        self.dirs = tuple(paths)
+        self.mtimes = tuple(mtimes)
+        self.names = "\0".join(all_names)
+        self.text = "\0".join(lowercase)
+
+        if bloom is None:
+            filter_bits = bytearray(BLOOM_BYTES)
+            for position in get_trigram_hashes(self.text):
+                filter_bits[position >> 3] |= 1 << (position & 7)
+
+            bloom = bytes(filter_bits)
+
+        self.bloom = bloom
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def get_dirs(self) -> list[tuple[str, int, list[str]]]:
+        """Gets the relative paths, modification times and names in the block."""
+        names = self.names.split("\0") if self.starts else []
+        ends = self.dir_starts[1:].tolist() + [len(names)]
+
+        return [
+            (path, mtime, names[start:end])
+            for path, mtime, start, end in zip(
+                self.dirs, self.mtimes, self.dir_starts, ends
+            )
+        ]
+
+    def may_contain(self, hashes: Iterable[int]) -> bool:
+        """Whether any name can contain a query with the trigram `hashes`."""
+        bloom = self.bloom
+
+        for position in hashes:
+            if not bloom[position >> 3] & 1 << (position & 7):
+                return False
+
+        return True
+
+    def search(
+        self, query: str, prefix: str, results: list[tuple[str, str]], limit: int
+    ) -> None:
+        """
+        Appends the directories and names of the names containing `query`
+        to `results` until there are `limit` of them.
+
+        `query` should be lowercase. Only directories that are `prefix`
+        or below it count, unless `prefix` is empty.
+        """
+        if prefix and not any(self.__is_below(path, prefix) for path in self.dirs):
+            return
+
+        text = self.text
+        position = text.find(query)
+
+        while position != -1:
+            index = bisect_right(self.starts, position) - 1
+            path = self.dirs[bisect_right(self.dir_starts, index) - 1]
+
+            if not prefix or self.__is_below(path, prefix):
+                results.append((path, self.__get_name(index)))
+
+                if len(results) >= limit:
+                    return
+
+            # Only count each name once
+            if index + 1 >= len(self.starts):
+                return
+
+            position = text.find(query, self.starts[index + 1])
+
+    def write(self, file: BinaryIO) -> None:
+        """Writes the block to `file`, so it can be read with `read`."""
+        header = "\0".join(
+            str(field)
+            for path, mtime, start in zip(self.dirs, self.mtimes, self.dir_starts)
+            for field in (path, mtime, start)
+        ).encode("utf-8", "surrogateescape")
+        names = self.names.encode("utf-8", "surrogateescape")
+
+        file.write(len(self.dirs).to_bytes(4, "little"))
+        file.write(len(header).to_bytes(4, "little"))
+        file.write(len(names).to_bytes(4, "little"))
+        file.write(header)
+        file.write(names)
+        file.write(self.bloom)
+
+    @classmethod
+    def read(cls, file: BinaryIO) -> Optional["NameBlock"]:
+        """Reads a block written with `write` from `file`, or None at its end."""
+        if not (sizes := file.read(12)):
+            return None
+
+        if len(sizes) != 12:
+            raise ValueError("Truncated block")
+
+        n_dirs = int.from_bytes(sizes[:4], "little")
+        header = file.read(int.from_bytes(sizes[4:8], "little"))
+        names = file.read(int.from_bytes(sizes[8:], "little"))
+
+        if len(bloom := file.read(BLOOM_BYTES)) != BLOOM_BYTES:
+            raise ValueError("Truncated block")
+
+        fields = header.decode("utf-8", "surrogateescape").split("\0")
+        names = names.decode("utf-8", "surrogateescape").split("\0") if names else []
+
+        if len(fields) != n_dirs * 3:
+            raise ValueError("Invalid block header")
+
+        starts = [int(start) for start in fields[2::3]]
+        ends = starts[1:] + [len(names)]
+
+        return cls(
+            (
+                (path, int(mtime), names[start:end])
+                for path, mtime, start, end in zip(
+                    fields[::3], fields[1::3], starts, ends
+                )
+            ),
+            bloom,
+        )
+
+    @staticmethod
+    def __is_below(path: str, prefix: str) -> bool:
+        return path == prefix or path.startswith(prefix + "/")
+
+    def __get_name(self, index: int) -> str:
+        if not self.same_starts:
+            return self.names.split("\0")[index]
+
+        start = self.starts[index]
+        end = self.starts[index + 1] - 1 if index + 1 < len(self.starts) else None
+
+        return self.names[start:end]
+
+
+def search_blocks(
+    blocks: Iterable[NameBlock], query: str, prefix: str, limit: int
+) -> list[tuple[str, str]]:
+    """
+    Gets the directories and names of up to `limit` names containing `query`,
+    ignoring case, in directories that are `prefix` or below it.
+    """
+    query = query.lower()
+    hashes = get_trigram_hashes(query)
+    results = []
+
+    for block in blocks:
+        if not block.may_contain(hashes):
+            continue
+
+        block.search(query, prefix, results, limit)
+
+        if len(results) >= limit:
+            break
+
+    return results
@@ -0,0 +1,493 @@
+# name_index.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""An optional persistent index of the names of the files in `shared.home_path`."""
+import logging
+import os
+from heapq import nsmallest
+from pathlib import Path
+from threading import Lock
+from typing import Any, Iterable, Optional
+
+from gi.repository import Gio, GLib
+
+from hyperplane import shared
+from hyperplane.utils.name_blocks import BLOCK_SIZE, NameBlock, search_blocks
+
+INDEX_VERSION = 1
+# The most paths a search returns
+MAX_RESULTS = 10000
+# Directories closest to `shared.home_path` are monitored, within the limits of inotify
+MAX_MONITORS = 4096
+# Seconds between two comparisons of every directory with the index
+RECONCILE_INTERVAL = 10 * 60
+# Seconds to wait for more changes before updating the index
+UPDATE_DELAY = 2
+SAVE_DELAY = 30
+# Blocks left much smaller than `BLOCK_SIZE` by updates are merged once there are this many
+MAX_SMALL_BLOCKS = 16
+
+
+class NameIndex:
+    """
+    An optional persistent index of the names of the files in `shared.home_path`,
+    so the whole of it can be searched in milliseconds.
+
+    The index is only built if the `name-index` setting is enabled.
+    It is built in the background and stored in the user cache directory.
+    It is kept up to date by file monitors on the directories closest to
+    `shared.home_path` and by comparing the modification times
+    of every indexed directory at startup and then periodically.
+
+    Hidden files and other file systems mounted in `shared.home_path`
+    are not indexed.
+    """
+
+    path: Path
+    blocks: tuple[NameBlock, ...]
+    monitors: dict[str, Gio.FileMonitor]
+    ready: bool
+
+    def __init__(self) -> None:
+        self.path = Path(GLib.get_user_cache_dir(), "hyperplane", "name-index")
+
+        self.blocks = ()
+        self.monitors = {}
+        self.ready = False
+
+        self.__loaded = False
+        self.__generation = 0
+        self.__running = False
+        # Compare every directory next time, not just `__dirty` ones
+        self.__full = True
+        self.__dirty = set()
+        self.__can_monitor = True
+        self.__save_lock = Lock()
+
+        self.__update_source = None
+        self.__reconcile_source = None
+        self.__save_source = None
+
+    def load(self) -> None:
+        """Starts indexing if the `name-index` setting is enabled, now and when it changes."""
+        if self.__loaded:
+            return
+
+        self.__loaded = True
+
+        shared.schema.connect("changed::name-index", self.__setting_changed)
+        self.__setting_changed()
+
+    def search(self, query: str, root: os.PathLike | str) -> Optional[list[Path]]:
+        """
+        Gets the paths of up to `MAX_RESULTS` files and directories below `root`
+        whose name contains `query`, ignoring case.
+
+        Returns None if the index can't tell, because it is disabled or not built yet,
+        hidden files are shown or `root` is not indexed.
+        """
+        if not self.ready or shared.show_hidden:
+            return None
+
+        try:
+            parts = Path(root).relative_to(shared.home_path).parts
+        except ValueError:
+            return None
+
+        if any(part.startswith(".") for part in parts):
+            return None
+
+        return [
+            Path(shared.home_path, path, name)
+            for path, name in search_blocks(
+                self.blocks, query, "/".join(parts), MAX_RESULTS
+            )
+        ]
+
+    def __setting_changed(self, *_args: Any) -> None:
+        if shared.schema.get_boolean("name-index"):
+            if self.__reconcile_source:
+                return
+
+            self.__reconcile_source = GLib.timeout_add_seconds(
+                RECONCILE_INTERVAL, self.__reconcile_all
+            )
+            self.__schedule(full=True, delay=0)
+            return
+
+        # Forget about the index entirely, results of running updates included
+        self.__generation += 1
+        self.__running = False
+        self.__full = True
+        self.__dirty = set()
+        self.blocks = ()
+        self.ready = False
+
+        for source in (
+            self.__update_source,
+            self.__reconcile_source,
+            self.__save_source,
+        ):
+            if source:
+                GLib.source_remove(source)
+
+        self.__update_source = self.__reconcile_source = self.__save_source = None
+
+        for monitor in self.monitors.values():
+            monitor.cancel()
+
+        self.monitors = {}
+
+        GLib.Thread.new(None, self.__remove)
+
+    def __reconcile_all(self) -> bool:
+        self.__schedule(full=True)
+        return True
+
+    def __schedule(self, full: bool = False, delay: int = UPDATE_DELAY) -> None:
+        if full:
+            self.__full = True
+
+        # Running updates schedule another one when they are done
+        if self.__running or self.__update_source:
+            return
+
+        self.__update_source = GLib.timeout_add_seconds(delay, self.__start_update)
+
+    def __start_update(self) -> None:
+        self.__update_source = None
+        self.__running = True
+
+        dirty = None if self.__full else self.__dirty
+        self.__full = False
+        self.__dirty = set()
+
+        GLib.Thread.new(None, self.__reconcile, self.__generation, self.blocks, dirty)
+
+    def __reconcile(
+        self,
+        generation: int,
+        blocks: tuple[NameBlock, ...],
+        dirty: Optional[set[str]],
+    ) -> None:
+        # Blocks are only empty before the index is read
+        if not blocks:
+            blocks = self.__read()
+            dirty = None
+
+        mtimes = {
+            path: mtime
+            for block in blocks
+            for path, mtime in zip(block.dirs, block.mtimes)
+        }
+
+        children = {}
+        for path in mtimes:
+            if path:
+                children.setdefault(path.rpartition("/")[0], []).append(path)
+
+        try:
+            device = shared.home_path.stat().st_dev
+        except OSError as error:
+            logging.error("Cannot index file names: %s", error)
+            GLib.idle_add(self.__apply, generation, None, ())
+            return
+
+        # Directories scanned again, with their modification time and names
+        changed = {}
+        removed = set()
+        existing = set()
+
+        def remove(path: str) -> None:
+            stack = [path]
+
+            while stack:
+                removed.add(parent := stack.pop())
+                stack.extend(children.get(parent, ()))
+
+        # Without `dirty`, everything is compared, otherwise new directories are scanned
+        stack = [""] if dirty is None else [path for path in dirty if path in mtimes]
+
+        while stack:
+            path = stack.pop()
+            full_path = os.path.join(shared.home_path, path)
+
+            try:
+                mtime = os.stat(full_path).st_mtime_ns
+            except OSError:
+                if dirty is not None:
+                    remove(path)
+                continue
+
+            existing.add(path)
+
+            if dirty is None and mtimes.get(path) == mtime:
+                stack.extend(children.get(path, ()))
+                continue
+
+            names, subdirs = self.__scan(full_path, device)
+            changed[path] = (mtime, names)
+
+            subdirs = {f"{path}/{name}" if path else name for name in subdirs}
+
+            for child in children.get(path, ()):
+                if child not in subdirs:
+                    remove(child)
+
+            stack.extend(
+                subdir for subdir in subdirs if dirty is None or subdir not in mtimes
+            )
+
+        if dirty is None:
+            for path in mtimes.keys() - existing:
+                remove(path)
+
+        for path in removed:
+            changed.pop(path, None)
+
+        if changed or removed:
+            blocks = self.__update_blocks(blocks, changed, removed)
+
+        all_paths = (path for block in blocks for path in block.dirs)
+        monitored = nsmallest(
+            MAX_MONITORS, all_paths, key=lambda path: (path.count("/"), bool(path))
+        )
+
+        GLib.idle_add(self.__apply, generation, blocks, monitored)
+
+    def __update_blocks(
+        self,
+        blocks: tuple[NameBlock, ...],
+        changed: dict[str, tuple[int, list[str]]],
+        removed: set[str],
+    ) -> tuple[NameBlock, ...]:
+        affected = changed.keys() | removed
+        kept = []
+        dirs = {}
+
+        for block in blocks:
+            if affected.isdisjoint(block.dirs):
+                kept.append(block)
+                continue
+
+            for path, mtime, names in block.get_dirs():
+                if path not in removed:
+                    dirs[path] = (mtime, names)
+
+        dirs.update(changed)
+
+        # Merge what updates left of blocks to keep their number down
+        small = [block for block in kept if len(block) < BLOCK_SIZE // 4]
+        if len(small) > MAX_SMALL_BLOCKS:
+            kept = [block for block in kept if len(block) >= BLOCK_SIZE // 4]
+
+            for block in small:
+                for path, mtime, names in block.get_dirs():
+                    dirs[path] = (mtime, names)
+
+        # Siblings end up in the same blocks
+        return tuple(kept) + tuple(
+            self.__make_blocks(
+                (path, mtime, names) for path, (mtime, names) in sorted(dirs.items())
+            )
+        )
+
+    def __make_blocks(
+        self, dirs: Iterable[tuple[str, int, list[str]]]
+    ) -> list[NameBlock]:
+        blocks = []
+        batch = []
+        n_names = 0
+
+        for path, mtime, names in dirs:
+            batch.append((path, mtime, names))
+            n_names += len(names)
+
+            if n_names >= BLOCK_SIZE:
+                blocks.append(NameBlock(batch))
+                batch = []
+                n_names = 0
+
+        if batch:
+            blocks.append(NameBlock(batch))
+
+        return blocks
+
+    def __scan(self, path: str, device: int) -> tuple[list[str], list[str]]:
+        names = []
+        subdirs = []
+
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+
+                    names.append(entry.name)
+
+                    try:
+                        if (
+                            entry.is_dir(follow_symlinks=False)
+                            and entry.stat(follow_symlinks=False).st_dev == device
+                        ):
+                            subdirs.append(entry.name)
+                    except OSError:
+                        continue
+        except OSError as error:
+            logging.debug('Cannot index "%s": %s', path, error)
+
+        return names, subdirs
+
+    def __apply(
+        self,
+        generation: int,
+        blocks: Optional[tuple[NameBlock, ...]],
+        monitored: list[str],
+    ) -> None:
+        # The index was disabled in the meantime
+        if generation != self.__generation:
+            return
+
+        self.__running = False
+
+        if blocks is None:
+            return
+
+        if blocks is not self.blocks:
+            self.blocks = blocks
+            self.__schedule_save()
+
+        self.ready = True
+
+        monitored = set(monitored)
+        for path in tuple(self.monitors):
+            if path not in monitored:
+                self.monitors.pop(path).cancel()
+
+        for path in monitored:
+            self.__monitor(path)
+
+        # Changes came in during the update
+        if self.__full or self.__dirty:
+            self.__schedule()
+
+    def __monitor(self, path: str) -> None:
+        if path in self.monitors or not self.__can_monitor:
+            return
+
+        gfile = Gio.File.new_for_path(os.path.join(shared.home_path, path))
+
+        try:
+            monitor = gfile.monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES)
+        except GLib.Error as error:
+            # Changes are still picked up periodically
+            logging.debug(
+                'Cannot monitor "%s" for the name index: %s', gfile.get_uri(), error
+            )
+            self.__can_monitor = False
+            return
+
+        monitor.connect("changed", self.__changed, path)
+        self.monitors[path] = monitor
+
+    def __changed(
+        self,
+        _monitor: Gio.FileMonitor,
+        _gfile: Gio.File,
+        _other_gfile: Optional[Gio.File],
+        event: Gio.FileMonitorEvent,
+        path: str,
+    ) -> None:
+        # Only the names in the directory matter
+        if event not in {
+            Gio.FileMonitorEvent.CREATED,
+            Gio.FileMonitorEvent.DELETED,
+            Gio.FileMonitorEvent.MOVED_IN,
+            Gio.FileMonitorEvent.MOVED_OUT,
+            Gio.FileMonitorEvent.RENAMED,
+        }:
+            return
+
+        self.__dirty.add(path)
+        self.__schedule()
+
+    def __read(self) -> tuple[NameBlock, ...]:
+        blocks = []
+
+        try:
+            with self.path.open("rb") as file:
+                if file.readline() != self.__get_header():
+                    return ()
+
+                while block := NameBlock.read(file):
+                    blocks.append(block)
+        except FileNotFoundError:
+            return ()
+        except (OSError, ValueError) as error:
+            logging.warning("Cannot read file name index: %s", error)
+            return ()
+
+        return tuple(blocks)
+
+    def __schedule_save(self) -> None:
+        if self.__save_source:
+            return
+
+        # Changes often come in bursts
+        self.__save_source = GLib.timeout_add_seconds(SAVE_DELAY, self.__save)
+
+    def __save(self) -> None:
+        self.__save_source = None
+
+        GLib.Thread.new(None, self.__write, self.__generation, self.blocks)
+
+    def __write(self, generation: int, blocks: tuple[NameBlock, ...]) -> None:
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+
+        with self.__save_lock:
+            # The index was disabled in the meantime
+            if generation != self.__generation:
+                return
+
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+
+                with tmp_path.open("wb") as file:
+                    file.write(self.__get_header())
+
+                    for block in blocks:
+                        block.write(file)
+
+                tmp_path.replace(self.path)
+            except OSError as error:
+                logging.error("Cannot save file name index: %s", error)
+
+    def __remove(self) -> None:
+        with self.__save_lock:
+            try:
+                self.path.unlink(missing_ok=True)
+            except OSError as error:
+                logging.error("Cannot remove file name index: %s", error)
+
+    def __get_header(self) -> bytes:
+        # An index of another home is no use
+        return b"%d\0%s\n" % (INDEX_VERSION, os.fsencode(shared.home_path))
+
+
+name_index = NameIndex()
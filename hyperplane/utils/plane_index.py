@@ -0,0 +1,502 @@
+# plane_index.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""A persistent index of the directories that represent tags."""
+import json
+import logging
+from os import PathLike, scandir
+from pathlib import Path
+from stat import S_ISDIR
+from typing import Any, Iterable, Optional
+
+from gi.repository import Gio, GLib, Gtk
+
+from hyperplane import shared
+from hyperplane.utils.tag_masks import (
+    get_initial_masks,
+    get_mask,
+    intern_tags,
+    is_reachable,
+)
+
+INDEX_VERSION = 1
+# Planes closest to `shared.home_path` are monitored, within the limits of inotify
+MAX_MONITORS = 4096
+# Seconds between two comparisons of unmonitored planes with the index
+RECONCILE_INTERVAL = 10 * 60
+
+
+class PlaneIndex:
+    """
+    A persistent index of the directories that represent tags.
+
+    The index is stored next to `~/.hyperplane`. It maps each combination of tags
+    to the existing directories (planes) for it, so `iterplane` does not have to
+    walk `shared.home_path` every time a tag page is opened.
+
+    It is kept up to date by file monitors on up to `MAX_MONITORS` of the planes
+    closest to `shared.home_path` and by the `tag-location-created` signal.
+    Changes to other planes and between sessions are picked up
+    by comparing the modification times of directories.
+    """
+
+    path: Path
+
+    # Parts relative to `shared.home_path` mapped to their modification time.
+    # The empty tuple represents `shared.home_path` itself.
+    planes: dict[tuple[str, ...], int]
+    combinations: dict[frozenset[str], set[tuple[str, ...]]]
+    monitors: dict[tuple[str, ...], Gio.FileMonitor]
+
+    indexed_tags: frozenset[str]
+    ready: bool
+
+    def __init__(self) -> None:
+        self.path = shared.home_path / ".hyperplane-index"
+
+        self.planes = {}
+        self.combinations = {}
+        self.monitors = {}
+
+        self.indexed_tags = frozenset()
+        self.ready = False
+
+        self.__loaded = False
+        self.__monitor_warned = False
+        self.__generation = 0
+        self.__reconcile_source = None
+        self.__save_source = None
+
+    def load(self) -> None:
+        """
+        Loads the index from disk and reconciles it with the file system.
+
+        This is done in a thread. Until it is finished, `lookup()` returns None.
+        """
+        if self.__loaded:
+            return
+
+        self.__loaded = True
+
+        shared.postmaster.connect("tags-changed", self.__tags_changed)
+        shared.postmaster.connect("tag-location-created", self.__tag_location_created)
+
+        self.__refresh()
+
+    def lookup(self, filter_tags: Iterable[str]) -> Optional[list[Path]]:
+        """
+        Gets the existing paths that contain files tagged `filter_tags`.
+
+        Returns None if the index is missing or stale.
+        """
+        if not self.ready:
+            return None
+
+        bits = intern_tags(shared.tags)
+        available, wanted = get_initial_masks(bits, shared.home_path.name, filter_tags)
+
+        planes = []
+        for combination, members in self.combinations.items():
+            # Every plane has to contain all wanted tags and only known ones
+            if (mask := get_mask(bits, combination)) & wanted != wanted:
+                continue
+
+            if mask & available != mask or len(combination) != mask.bit_count():
+                continue
+
+            planes.extend(
+                parts
+                for parts in members
+                if is_reachable(bits, parts, available, wanted)
+            )
+
+        return [Path(shared.home_path, *parts) for parts in sorted(planes)]
+
+    def add(self, path: PathLike | str) -> None:
+        """
+        Adds the directory at `path` and any tag directories below it to the index.
+
+        This is done automatically for changes noticed by file monitors
+        and for `tag-location-created`, so in most cases,
+        calling this should not be necessary.
+        """
+        if not (parts := self.__get_parts(path)):
+            return
+
+        tags = frozenset(shared.tags)
+
+        # Parents may have been created along with the directory
+        for index in range(1, len(parts) + 1):
+            if (prefix := parts[:index]) in self.planes:
+                continue
+
+            if (
+                prefix[-1] not in tags
+                or prefix[-1] in prefix[:-1]
+                or prefix[:-1] not in self.planes
+            ):
+                return
+
+            try:
+                if not S_ISDIR(
+                    (stat := Path(shared.home_path, *prefix).stat()).st_mode
+                ):
+                    return
+            except OSError:
+                return
+
+            added = {prefix: stat.st_mtime_ns}
+            if prefix == parts:
+                self.__scan(Path(shared.home_path, *prefix), prefix, tags, added)
+
+            self.planes.update(added)
+            for new_parts in added:
+                self.combinations.setdefault(frozenset(new_parts), set()).add(new_parts)
+                self.__monitor(new_parts)
+
+        self.__touch(parts[:-1])
+        self.__schedule_save()
+
+    def remove(self, path: PathLike | str) -> None:
+        """
+        Removes the directory at `path` and everything below it from the index.
+
+        This is done automatically for changes noticed by file monitors,
+        so in most cases, calling this should not be necessary.
+        """
+        if not (parts := self.__get_parts(path)):
+            return
+
+        if parts not in self.planes:
+            return
+
+        length = len(parts)
+        for removed in tuple(other for other in self.planes if other[:length] == parts):
+            self.planes.pop(removed)
+
+            if members := self.combinations.get(combination := frozenset(removed)):
+                members.discard(removed)
+                if not members:
+                    self.combinations.pop(combination)
+
+            if monitor := self.monitors.pop(removed, None):
+                monitor.cancel()
+
+        self.__touch(parts[:-1])
+        self.__schedule_save()
+
+    def __refresh(self, rebuild: bool = False, keep_ready: bool = False) -> None:
+        if not keep_ready:
+            self.ready = False
+
+        self.__generation += 1
+
+        GLib.Thread.new(
+            None,
+            self.__reconcile,
+            self.__generation,
+            {} if rebuild else dict(self.planes),
+            frozenset(shared.tags),
+        )
+
+    def __reconcile(
+        self, generation: int, planes: dict[tuple[str, ...], int], tags: frozenset
+    ) -> None:
+        if not planes:
+            planes, indexed_tags = self.__read()
+
+            # The index doesn't know about directories for new tags
+            if not tags <= indexed_tags:
+                planes = {}
+
+        new_planes = {}
+
+        if () not in planes:
+            try:
+                new_planes[()] = shared.home_path.stat().st_mtime_ns
+            except OSError as error:
+                logging.error("Cannot index tags: %s", error)
+                return
+
+            self.__scan(shared.home_path, (), tags, new_planes)
+            GLib.idle_add(self.__apply, generation, new_planes, tags)
+            return
+
+        # Parents come before their children
+        for parts in sorted(planes, key=len):
+            if parts and parts[:-1] not in new_planes:
+                continue
+
+            if not tags.issuperset(parts):
+                continue
+
+            path = Path(shared.home_path, *parts)
+
+            try:
+                if not S_ISDIR((stat := path.stat()).st_mode):
+                    continue
+            except OSError:
+                continue
+
+            new_planes[parts] = stat.st_mtime_ns
+
+            if planes[parts] == stat.st_mtime_ns:
+                continue
+
+            # Something was added to or removed from the directory
+            for child_path, child_parts, child_mtime in self.__get_children(
+                path, parts, tags
+            ):
+                if child_parts in planes:
+                    continue
+
+                new_planes[child_parts] = child_mtime
+                self.__scan(child_path, child_parts, tags, new_planes)
+
+        GLib.idle_add(self.__apply, generation, new_planes, tags)
+
+    def __apply(
+        self, generation: int, planes: dict[tuple[str, ...], int], tags: frozenset
+    ) -> None:
+        # A newer refresh was started in the meantime
+        if generation != self.__generation:
+            return
+
+        self.planes = planes
+        self.indexed_tags = tags
+
+        self.combinations = {}
+        for parts in planes:
+            self.combinations.setdefault(frozenset(parts), set()).add(parts)
+
+        monitored = set(
+            sorted(planes, key=lambda parts: (len(parts), parts))[:MAX_MONITORS]
+        )
+
+        for parts in tuple(self.monitors):
+            if parts not in monitored:
+                self.monitors.pop(parts).cancel()
+
+        for parts in monitored:
+            self.__monitor(parts)
+
+        if len(self.monitors) < len(planes):
+            self.__schedule_reconcile()
+        elif self.__reconcile_source:
+            # Every plane is monitored again
+            GLib.source_remove(self.__reconcile_source)
+            self.__reconcile_source = None
+
+        self.ready = True
+        self.__schedule_save()
+
+    def __schedule_reconcile(self) -> None:
+        # Planes without a monitor are compared with the index periodically instead
+        if self.__reconcile_source:
+            return
+
+        self.__reconcile_source = GLib.timeout_add_seconds(
+            RECONCILE_INTERVAL, self.__reconcile_unmonitored
+        )
+
+    def __reconcile_unmonitored(self) -> bool:
+        # Lookups keep using the index until it is reconciled
+        self.__refresh(keep_ready=True)
+        return True
+
+    def __scan(
+        self,
+        path: Path,
+        parts: tuple[str, ...],
+        tags: frozenset,
+        planes: dict[tuple[str, ...], int],
+    ) -> None:
+        for child_path, child_parts, child_mtime in self.__get_children(
+            path, parts, tags
+        ):
+            planes[child_parts] = child_mtime
+            self.__scan(child_path, child_parts, tags, planes)
+
+    def __get_children(
+        self, path: Path, parts: tuple[str, ...], tags: frozenset
+    ) -> list[tuple[Path, tuple[str, ...], int]]:
+        children = []
+
+        try:
+            with scandir(path) as entries:
+                for entry in entries:
+                    if entry.name not in tags or entry.name in parts:
+                        continue
+
+                    try:
+                        if not entry.is_dir():
+                            continue
+
+                        children.append(
+                            (
+                                Path(entry.path),
+                                parts + (entry.name,),
+                                entry.stat().st_mtime_ns,
+                            )
+                        )
+                    except OSError:
+                        continue
+        except OSError as error:
+            logging.debug('Cannot index "%s": %s', path, error)
+
+        return children
+
+    def __monitor(self, parts: tuple[str, ...]) -> None:
+        if parts in self.monitors:
+            return
+
+        if len(self.monitors) >= MAX_MONITORS:
+            self.__schedule_reconcile()
+            return
+
+        gfile = Gio.File.new_for_path(str(Path(shared.home_path, *parts)))
+
+        try:
+            monitor = gfile.monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES)
+        except GLib.Error as error:
+            if not self.__monitor_warned:
+                logging.warning(
+                    'Cannot monitor "%s", some tags will be updated late: %s',
+                    gfile.get_uri(),
+                    error,
+                )
+
+            self.__monitor_warned = True
+            self.__schedule_reconcile()
+            return
+
+        monitor.connect("changed", self.__changed, parts)
+        self.monitors[parts] = monitor
+
+    def __changed(
+        self,
+        _monitor: Gio.FileMonitor,
+        gfile: Gio.File,
+        other_gfile: Optional[Gio.File],
+        event: Gio.FileMonitorEvent,
+        parts: tuple[str, ...],
+    ) -> None:
+        match event:
+            case Gio.FileMonitorEvent.CREATED | Gio.FileMonitorEvent.MOVED_IN:
+                if path := gfile.get_path():
+                    self.add(path)
+
+            case Gio.FileMonitorEvent.DELETED | Gio.FileMonitorEvent.MOVED_OUT:
+                if path := gfile.get_path():
+                    self.remove(path)
+
+            case Gio.FileMonitorEvent.RENAMED:
+                if path := gfile.get_path():
+                    self.remove(path)
+
+                if other_gfile and (other_path := other_gfile.get_path()):
+                    self.add(other_path)
+
+            case _:
+                return
+
+        # Keep the modification time in sync so the next session doesn't rescan
+        self.__touch(parts)
+
+    def __touch(self, parts: tuple[str, ...]) -> None:
+        if parts not in self.planes:
+            return
+
+        try:
+            self.planes[parts] = Path(shared.home_path, *parts).stat().st_mtime_ns
+        except OSError:
+            return
+
+        self.__schedule_save()
+
+    def __tags_changed(self, *_args: Any) -> None:
+        if frozenset(shared.tags) <= self.indexed_tags:
+            return
+
+        self.__refresh(rebuild=True)
+
+    def __tag_location_created(
+        self, _obj: Any, _string_list: Gtk.StringList, new_location: Gio.File
+    ) -> None:
+        if path := new_location.get_path():
+            self.add(path)
+
+    def __get_parts(self, path: PathLike | str) -> Optional[tuple[str, ...]]:
+        try:
+            return Path(path).relative_to(shared.home_path).parts
+        except ValueError:
+            return None
+
+    def __read(self) -> tuple[dict[tuple[str, ...], int], frozenset]:
+        try:
+            index = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}, frozenset()
+        except (OSError, ValueError) as error:
+            logging.warning("Cannot read tag index: %s", error)
+            return {}, frozenset()
+
+        try:
+            if index["version"] != INDEX_VERSION:
+                return {}, frozenset()
+
+            return (
+                {tuple(parts): mtime for parts, mtime in index["planes"]},
+                frozenset(index["tags"]),
+            )
+        except (KeyError, TypeError, ValueError) as error:
+            logging.warning("Cannot read tag index: %s", error)
+            return {}, frozenset()
+
+    def __schedule_save(self) -> None:
+        if self.__save_source:
+            return
+
+        # Changes often come in bursts
+        self.__save_source = GLib.timeout_add_seconds(2, self.__save)
+
+    def __save(self) -> None:
+        self.__save_source = None
+
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+
+        try:
+            tmp_path.write_text(
+                json.dumps(
+                    {
+                        "version": INDEX_VERSION,
+                        "tags": sorted(self.indexed_tags),
+                        "planes": [
+                            [parts, mtime] for parts, mtime in self.planes.items()
+                        ],
+                    }
+                ),
+                encoding="utf-8",
+            )
+            tmp_path.replace(self.path)
+        except OSError as error:
+            logging.error("Cannot save tag index: %s", error)
+
+
+plane_index = PlaneIndex()
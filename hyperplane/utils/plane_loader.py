@@ -0,0 +1,141 @@
+# plane_loader.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Admission of the directory lists of tag planes into a list store.
+
+Every `Gtk.DirectoryList` enumerates its directory as soon as it is created,
+so planes are queued and only a limited number of them are allowed
+to load at once across all pages, with visible pages going first.
+"""
+from collections import deque
+from typing import Callable, Optional
+
+from gi.repository import Gio, Gtk
+
+# The maximum number of directory lists loading at the same time in the whole app
+MAX_LOADING = 8
+
+
+class PlaneLoader:
+    """Admits directory lists for planes into `list_store` a few at a time."""
+
+    list_store: Gio.ListStore
+    attributes: str
+    callback: Callable[[], None]
+    cancellable: Gio.Cancellable
+
+    pending: deque[Gio.File]
+    loading: set[Gtk.DirectoryList]
+    visible: bool = True
+
+    def __init__(
+        self,
+        list_store: Gio.ListStore,
+        attributes: str,
+        callback: Callable[[], None],
+        cancellable: Optional[Gio.Cancellable] = None,
+    ) -> None:
+        self.list_store = list_store
+        self.attributes = attributes
+        self.callback = callback
+        self.cancellable = cancellable or Gio.Cancellable.new()
+
+        self.pending = deque()
+        self.loading = set()
+
+    def add(self, gfiles: list[Gio.File]) -> None:
+        """Queues the directories in `gfiles` to be loaded."""
+        if self.cancellable.is_cancelled():
+            return
+
+        self.pending.extend(gfiles)
+
+        if self not in _loaders:
+            _loaders.append(self)
+
+        _admit()
+
+    def set_visible(self, visible: bool) -> None:
+        """Sets whether the page of the loader is visible, prioritizing it if so."""
+        self.visible = visible
+        _admit()
+
+    def is_loading(self) -> bool:
+        """Whether any planes are still queued or loading."""
+        return bool(self.pending or self.loading)
+
+    def admit(self, count: int) -> int:
+        """Starts loading up to `count` queued planes. Returns how many were started."""
+        batch = []
+        while self.pending and len(batch) < count:
+            dir_list = Gtk.DirectoryList.new(self.attributes, self.pending.popleft())
+            dir_list.connect("notify::loading", self.__loading_changed)
+
+            self.loading.add(dir_list)
+            batch.append(dir_list)
+
+        # Emit a single `items-changed` for the whole batch
+        if batch:
+            self.list_store.splice(self.list_store.get_n_items(), 0, batch)
+
+        return len(batch)
+
+    def __loading_changed(self, dir_list: Gtk.DirectoryList, *_args) -> None:
+        if dir_list.is_loading() or (dir_list not in self.loading):
+            return
+
+        self.loading.discard(dir_list)
+
+        if not self.is_loading():
+            _loaders.remove(self)
+
+        _admit()
+
+        self.callback()
+
+    def cancel(self) -> None:
+        """Cancels `cancellable` and stops loading the planes of the loader."""
+        self.cancellable.cancel()
+        self.pending.clear()
+
+        if self in _loaders:
+            _loaders.remove(self)
+
+        loading = self.loading
+        self.loading = set()
+
+        # Stop enumerating, the lists are dropped anyway
+        for dir_list in loading:
+            dir_list.set_file(None)
+
+        _admit()
+
+
+_loaders: list[PlaneLoader] = []
+
+
+def _admit() -> None:
+    free = MAX_LOADING - sum(len(loader.loading) for loader in _loaders)
+
+    for loader in sorted(_loaders, key=lambda loader: not loader.visible):
+        if free <= 0:
+            return
+
+        free -= loader.admit(free)
@@ -0,0 +1,259 @@
+# recursive_search.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Search for files whose name contains a query anywhere under some directories,
+or in the planes of some tags.
+
+Directories are read in parallel on a pool of threads, roughly breadth first,
+so matches close to the top are usually found first.
+Matches are queried for their attributes on the same threads
+and reach the main thread in batches, the first one as soon as it is found.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from os import PathLike, fspath, scandir
+from threading import Lock
+from typing import Callable, Iterable, Optional
+
+from gi.repository import Gio, GLib
+
+from hyperplane.utils.iterplane import iterplane_async
+from hyperplane.utils.tag_masks import MAX_WORKERS
+from hyperplane.utils.tags import path_represents_tags
+
+# Matches passed to `add_matches` queried by each thread at once
+MATCHES_BATCH = 64
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+class RecursiveSearch:
+    """
+    Searches the trees under the directories passed to `add`
+    for files and directories whose name contains `query`, ignoring case.
+
+    `callback` is called on the main thread with batches of `Gio.FileInfo`s
+    of matches with `attributes`, then `done_callback` once every tree is searched
+    and `close` was called. Neither is called after the search is cancelled.
+
+    Unless `recursive`, only the files directly in the directories are searched
+    and directories representing tags are skipped, like on tag pages.
+    """
+
+    query: str
+    attributes: str
+    callback: Callable[[list[Gio.FileInfo]], None]
+    done_callback: Optional[Callable[[], None]]
+    hidden: bool
+    recursive: bool
+    cancellable: Gio.Cancellable
+
+    lock: Lock
+    found: list[Gio.FileInfo]
+    visited: set[str]
+    # Directories queued or being read, plus one until `close` is called
+    pending: int = 1
+
+    def __init__(
+        self,
+        query: str,
+        attributes: str,
+        callback: Callable[[list[Gio.FileInfo]], None],
+        done_callback: Optional[Callable[[], None]] = None,
+        hidden: bool = False,
+        recursive: bool = True,
+    ) -> None:
+        self.query = query.lower()
+        self.attributes = attributes
+        self.callback = callback
+        self.done_callback = done_callback
+        self.hidden = hidden
+        self.recursive = recursive
+        self.cancellable = Gio.Cancellable.new()
+
+        self.lock = Lock()
+        self.found = []
+        self.visited = set()
+
+    def add(self, roots: Iterable[PathLike | str]) -> None:
+        """Starts searching the trees under `roots`, skipping ones already searched."""
+        for root in roots:
+            self.__submit(fspath(root))
+
+    def add_matches(self, paths: Iterable[PathLike | str]) -> None:
+        """
+        Adds `paths` as matches without searching for them,
+        like ones already found in an index.
+        """
+        global _executor  # pylint: disable=global-statement
+
+        if not _executor:
+            _executor = ThreadPoolExecutor(MAX_WORKERS, "hyperplane-search")
+
+        paths = [fspath(path) for path in paths]
+
+        for index in range(0, len(paths), MATCHES_BATCH):
+            with self.lock:
+                self.pending += 1
+
+            _executor.submit(self.__visit_matches, paths[index : index + MATCHES_BATCH])
+
+    def close(self) -> None:
+        """Signals that no more roots are going to be added."""
+        self.__release()
+
+    def cancel(self) -> None:
+        """Stops the search as soon as possible."""
+        self.cancellable.cancel()
+
+    def is_cancelled(self) -> bool:
+        """Whether the search was cancelled."""
+        return self.cancellable.is_cancelled()
+
+    def __submit(self, directory: str) -> None:
+        global _executor  # pylint: disable=global-statement
+
+        if self.is_cancelled():
+            return
+
+        if not _executor:
+            _executor = ThreadPoolExecutor(MAX_WORKERS, "hyperplane-search")
+
+        with self.lock:
+            # Roots can be nested in each other, like the planes of a tag
+            if directory in self.visited:
+                return
+
+            self.visited.add(directory)
+            self.pending += 1
+
+        _executor.submit(self.__visit, directory)
+
+    def __visit(self, directory: str) -> None:
+        try:
+            if not self.is_cancelled():
+                self.__search(directory)
+        finally:
+            self.__release()
+
+    def __visit_matches(self, paths: list[str]) -> None:
+        try:
+            if not self.is_cancelled():
+                self.__query_matches(paths)
+        finally:
+            self.__release()
+
+    def __search(self, directory: str) -> None:
+        matches = []
+
+        try:
+            with scandir(directory) as entries:
+                for entry in entries:
+                    if not self.hidden and entry.name.startswith("."):
+                        continue
+
+                    # d_type makes `is_dir()` free on most file systems
+                    is_dir = entry.is_dir(follow_symlinks=False)
+
+                    if self.recursive:
+                        if is_dir:
+                            self.__submit(entry.path)
+                    elif is_dir and path_represents_tags(entry.path):
+                        continue
+
+                    if self.query in entry.name.lower():
+                        matches.append(entry.path)
+        except OSError as error:
+            logging.debug('Cannot search "%s": %s', directory, error)
+
+        self.__query_matches(matches)
+
+    def __query_matches(self, matches: list[str]) -> None:
+        file_infos = []
+
+        for path in matches:
+            gfile = Gio.File.new_for_path(path)
+
+            try:
+                file_info = gfile.query_info(
+                    self.attributes, Gio.FileQueryInfoFlags.NONE, self.cancellable
+                )
+            except GLib.Error as error:
+                logging.debug('Cannot query search result "%s": %s', path, error)
+                continue
+
+            # Set by `Gtk.DirectoryList` as well, items rely on it
+            file_info.set_attribute_object("standard::file", gfile)
+            file_infos.append(file_info)
+
+        if not file_infos:
+            return
+
+        with self.lock:
+            # Only schedule a flush if there isn't one pending already
+            if not self.found:
+                GLib.idle_add(self.__flush)
+
+            self.found.extend(file_infos)
+
+    def __flush(self) -> None:
+        with self.lock:
+            batch = self.found
+            self.found = []
+
+        if batch and not self.is_cancelled():
+            self.callback(batch)
+
+    def __release(self) -> None:
+        with self.lock:
+            self.pending -= 1
+            done = not self.pending
+
+        # Runs after the last flush
+        if done:
+            GLib.idle_add(self.__done)
+
+    def __done(self) -> None:
+        if self.done_callback and not self.is_cancelled():
+            self.done_callback()
+
+
+def search_tags(
+    tags: Iterable[str],
+    query: str,
+    attributes: str,
+    callback: Callable[[list[Gio.FileInfo]], None],
+    done_callback: Optional[Callable[[], None]] = None,
+    hidden: bool = False,
+    recursive: bool = False,
+) -> RecursiveSearch:
+    """
+    Searches the planes of `tags` for files whose name contains `query`
+    without loading them, the same as `RecursiveSearch` otherwise.
+
+    Planes are searched in parallel as soon as they are found.
+    Cancel the returned search to stop it.
+    """
+    search = RecursiveSearch(
+        query, attributes, callback, done_callback, hidden, recursive
+    )
+    iterplane_async(tags, search.add, search.close, search.cancellable)
+
+    return search
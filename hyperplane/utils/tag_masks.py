@@ -0,0 +1,196 @@
+# tag_masks.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Matching of tag directories using integer bitsets.
+
+Each tag is interned to a bit according to its position in the list of tags,
+so the state of a walk is just two integers instead of a dictionary of tags.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from os import PathLike, cpu_count, scandir
+from pathlib import Path
+from threading import Condition
+from typing import Callable, Generator, Iterable, Optional, Sequence
+
+# Walking is mostly waiting for the file system (especially over the network),
+# so there can be more workers than CPUs
+MAX_WORKERS = min(16, (cpu_count() or 1) * 2)
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def intern_tags(tags: Sequence[str]) -> dict[str, int]:
+    """Maps each tag in `tags` to its own bit, in order."""
+    return {tag: 1 << index for index, tag in enumerate(tags)}
+
+
+def get_mask(bits: dict[str, int], tags: Iterable[str]) -> int:
+    """Gets the mask representing `tags`. Unknown tags are ignored."""
+    mask = 0
+    for tag in tags:
+        mask |= bits.get(tag, 0)
+
+    return mask
+
+
+def get_allowed(available: int, wanted: int) -> int:
+    """
+    Gets the mask of tags a child directory can be named after.
+
+    `available` is the mask of tags not yet in the path,
+    `wanted` is the mask of filter tags not yet in the path.
+
+    Tags that are not wanted can only come before the next wanted tag
+    and wanted tags have to follow each other in the order of the list of tags.
+    """
+    if not wanted:
+        return available
+
+    # All bits up to and including the lowest wanted one
+    return available & (((wanted & -wanted) << 1) - 1)
+
+
+def get_initial_masks(
+    bits: dict[str, int], root_name: str, filter_tags: Iterable[str]
+) -> tuple[int, int]:
+    """Gets the `available` and `wanted` masks for the root of a walk."""
+    available = (1 << len(bits)) - 1
+    wanted = get_mask(bits, filter_tags)
+
+    # If the root itself is named after a filter tag, it is consumed
+    if (bit := bits.get(root_name, 0)) & wanted:
+        available &= ~bit
+        wanted &= ~bit
+
+    return available, wanted
+
+
+def is_reachable(
+    bits: dict[str, int], parts: Iterable[str], available: int, wanted: int
+) -> bool:
+    """
+    Checks whether a walk starting with the `available` and `wanted` masks
+    would yield the directory at `parts` relative to its root.
+    """
+    for part in parts:
+        if not (bit := bits.get(part, 0)) & get_allowed(available, wanted):
+            return False
+
+        available &= ~bit
+        wanted &= ~bit
+
+    return not wanted
+
+
+def walk_planes(
+    root: PathLike | str, tags: Sequence[str], filter_tags: Iterable[str]
+) -> Generator:
+    """Walks `root` for the directories that contain files tagged `filter_tags`."""
+    root = Path(root)
+    bits = intern_tags(tags)
+
+    yield from __walk(root, bits, *get_initial_masks(bits, root.name, filter_tags))
+
+
+def walk_planes_parallel(
+    root: PathLike | str,
+    tags: Sequence[str],
+    filter_tags: Iterable[str],
+    callback: Callable[[list[Path]], None],
+    is_cancelled: Callable[[], bool] = lambda: False,
+) -> None:
+    """
+    Walks `root` for the directories that contain files tagged `filter_tags`
+    on a shared pool of at most `MAX_WORKERS` threads.
+
+    Directories are passed to `callback` from the worker threads as they are found,
+    in no particular order. Blocks until the walk is done or `is_cancelled` returns true.
+    """
+    global _executor  # pylint: disable=global-statement
+
+    if not _executor:
+        _executor = ThreadPoolExecutor(MAX_WORKERS, "hyperplane-walk")
+
+    root = Path(root)
+    bits = intern_tags(tags)
+
+    pending = 1
+    condition = Condition()
+
+    def visit(node: Path, available: int, wanted: int) -> None:
+        nonlocal pending
+
+        children = []
+
+        try:
+            if not is_cancelled():
+                planes, children = __visit(node, bits, available, wanted)
+
+                if planes:
+                    callback(planes)
+        finally:
+            with condition:
+                pending += len(children) - 1
+
+                if not pending:
+                    condition.notify_all()
+
+        for child in children:
+            _executor.submit(visit, *child)
+
+    _executor.submit(visit, root, *get_initial_masks(bits, root.name, filter_tags))
+
+    with condition:
+        condition.wait_for(lambda: not pending)
+
+
+def __walk(node: Path, bits: dict[str, int], available: int, wanted: int) -> Generator:
+    planes, children = __visit(node, bits, available, wanted)
+
+    yield from planes
+
+    for child, child_available, child_wanted in children:
+        yield from __walk(child, bits, child_available, child_wanted)
+
+
+def __visit(
+    node: Path, bits: dict[str, int], available: int, wanted: int
+) -> tuple[list[Path], list[tuple[Path, int, int]]]:
+    planes = [] if wanted else [node]
+
+    if not (allowed := get_allowed(available, wanted)):
+        return planes, []
+
+    try:
+        with scandir(node) as entries:
+            # d_type makes `is_dir()` free on most file systems
+            names = [
+                entry.name
+                for entry in entries
+                if bits.get(entry.name, 0) & allowed and entry.is_dir()
+            ]
+    except OSError as error:
+        logging.debug('Cannot walk "%s": %s', node, error)
+        return planes, []
+
+    return planes, [
+        (node / name, available & ~bits[name], wanted & ~bits[name]) for name in names
+    ]
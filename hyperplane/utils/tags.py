@@ -18,14 +18,57 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 """Miscellaneous utilities for working with tags."""
-from os import PathLike
+from functools import lru_cache
+from os import PathLike, fspath
 from pathlib import Path
+from typing import Optional
 
 from gi.repository import Gtk
 
 from hyperplane import shared
 
 
+class TagRegistry:
+    """
+    Caches `shared.tags` for fast lookups.
+
+    Call `invalidate` whenever `shared.tags` changes.
+    """
+
+    __tags: Optional[frozenset[str]] = None
+
+    def __init__(self) -> None:
+        # Enough for a few very large directories
+        self.represents_tags = lru_cache(maxsize=1 << 16)(self.__represents_tags)
+
+    @property
+    def tags(self) -> frozenset[str]:
+        """The set of all tags."""
+        if self.__tags is None:
+            self.__tags = frozenset(shared.tags)
+
+        return self.__tags
+
+    def invalidate(self) -> None:
+        """Drops everything cached about the previous list of tags."""
+        self.__tags = None
+        self.represents_tags.cache_clear()
+
+    def __represents_tags(self, path: str) -> bool:
+        parts = Path(path).parts
+        home_parts = shared.home_path.parts
+
+        # Only paths inside of, but not equal to the home directory can be tags
+        if len(parts) <= len(home_parts) or parts[: len(home_parts)] != home_parts:
+            return False
+
+        tags = self.tags
+        return all(part in tags for part in parts[len(home_parts) :])
+
+
+tag_registry = TagRegistry()
+
+
 def update_tags(change: Gtk.FilterChange = Gtk.FilterChange.DIFFERENT) -> None:
     """
     Writes the list of tags from `shared.tags` to disk and notifies widgets.
@@ -37,20 +80,15 @@ def update_tags(change: Gtk.FilterChange = Gtk.FilterChange.DIFFERENT) -> None:
         "\n".join(shared.tags), encoding="utf-8"
     )
 
+    # Before anything gets notified so no one sees stale results
+    tag_registry.invalidate()
+
     shared.postmaster.emit("tags-changed", change)
 
 
 def path_represents_tags(path: PathLike | str) -> bool:
     """Checks whether a given `path` represents tags or not."""
-    path = Path(path)
-
-    if path == shared.home_path:
-        return False
-
-    if not path.is_relative_to(shared.home_path):
-        return False
-
-    return all(part in shared.tags for part in path.relative_to(shared.home_path).parts)
+    return tag_registry.represents_tags(fspath(path))
 
 
 def add_tags(*tags: str) -> None:
@@ -19,38 +19,269 @@
 
 """Utilities for working with thumbnails."""
 import logging
-from typing import Any, Callable
+from collections import OrderedDict
+from heapq import heappop, heappush
+from itertools import count
+from os import cpu_count
+from pathlib import Path
+from threading import Condition, Lock
+from typing import Any, Callable, Hashable, Optional
 
 from gi.repository import Gdk, GdkPixbuf, Gio, GLib, GnomeDesktop
 
 from hyperplane.utils.files import get_gfile_path
 
+# Thumbnailing is heavy on both CPU and disk so don't use too many threads
+MAX_WORKERS = min(4, cpu_count() or 1)
+# The memory decoded thumbnails can take up
+MAX_CACHE_BYTES = 128 * 1024 * 1024
+# The number of failures remembered across sessions
+MAX_FAILURES = 100000
+# Seconds new failures are collected for before writing them at once
+FAILURES_FLUSH_INTERVAL = 5
+# Sizes textures are decoded at, so items of similar sizes can share them
+TEXTURE_SIZES = (64, 128, 256, 512)
+
+_factories: dict[
+    GnomeDesktop.DesktopThumbnailSize, GnomeDesktop.DesktopThumbnailFactory
+] = {}
+_factories_lock = Lock()
+
+
+class TextureCache:
+    """A least recently used cache of textures, bounded by their size in memory."""
+
+    textures: OrderedDict[Hashable, Gdk.Texture]
+    n_bytes: int = 0
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.textures = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key: Hashable) -> Optional[Gdk.Texture]:
+        """Gets the texture for `key` if it is cached."""
+        with self.lock:
+            if (texture := self.textures.get(key)) is not None:
+                self.textures.move_to_end(key)
+
+            return texture
+
+    def add(self, key: Hashable, texture: Gdk.Texture) -> None:
+        """Caches `texture` under `key`, evicting the least recently used ones."""
+        with self.lock:
+            if (old := self.textures.pop(key, None)) is not None:
+                self.n_bytes -= self.__get_n_bytes(old)
+
+            self.textures[key] = texture
+            self.n_bytes += self.__get_n_bytes(texture)
+
+            while self.n_bytes > self.max_bytes and len(self.textures) > 1:
+                self.n_bytes -= self.__get_n_bytes(self.textures.popitem(last=False)[1])
+
+    def __get_n_bytes(self, texture: Gdk.Texture) -> int:
+        return texture.get_width() * texture.get_height() * 4
+
+
+texture_cache = TextureCache(MAX_CACHE_BYTES)
+
+
+class ThumbnailFailures:
+    """
+    Remembers files that could not be thumbnailed across sessions.
+
+    Failures are keyed by the URI, modification time and content type of the file,
+    so they no longer apply once the file changes.
+    New failures are written every `FAILURES_FLUSH_INTERVAL` seconds.
+    """
+
+    path: Path
+    failures: Optional[set[tuple[str, int, str]]] = None
+    # Lines not written yet
+    pending: list[str]
+
+    def __init__(self) -> None:
+        self.path = Path(GLib.get_user_cache_dir(), "hyperplane", "thumbnail-failures")
+        self.lock = Lock()
+        self.pending = []
+
+        self.__flush_source = None
+
+    def is_known(self, uri: str, mtime: int, content_type: str) -> bool:
+        """Whether thumbnailing the file already failed."""
+        with self.lock:
+            return (uri, mtime, content_type) in self.__get_failures()
+
+    def add(self, uri: str, mtime: int, content_type: str) -> None:
+        """Records that thumbnailing the file failed."""
+        with self.lock:
+            if (key := (uri, mtime, content_type)) in (
+                failures := self.__get_failures()
+            ):
+                return
+
+            failures.add(key)
+            self.pending.append(f"{uri}\t{mtime}\t{content_type}\n")
+
+            if not self.__flush_source:
+                self.__flush_source = GLib.timeout_add_seconds(
+                    FAILURES_FLUSH_INTERVAL, self.__flush_timeout
+                )
+
+    def flush(self) -> None:
+        """Writes failures that were not written yet."""
+        with self.lock:
+            if self.__flush_source:
+                GLib.source_remove(self.__flush_source)
+                self.__flush_source = None
+
+            pending, self.pending = self.pending, []
+
+        if not pending:
+            return
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as file:
+                file.write("".join(pending))
+        except OSError as error:
+            logging.debug('Cannot write "%s": %s', self.path, error)
+
+    def __flush_timeout(self) -> bool:
+        with self.lock:
+            self.__flush_source = None
+
+        self.flush()
+        return False
+
+    def __get_failures(self) -> set[tuple[str, int, str]]:
+        if self.failures is not None:
+            return self.failures
+
+        self.failures = set()
+
+        try:
+            lines = self.path.read_text(encoding="utf-8").splitlines()
+        except FileNotFoundError:
+            return self.failures
+        except (OSError, UnicodeDecodeError) as error:
+            logging.debug('Cannot read "%s": %s', self.path, error)
+            return self.failures
+
+        # Old failures are most likely for files that changed or no longer exist
+        if len(lines) > MAX_FAILURES:
+            lines = lines[-(MAX_FAILURES // 2) :]
+
+            try:
+                self.path.write_text(
+                    "".join(f"{line}\n" for line in lines), encoding="utf-8"
+                )
+            except OSError as error:
+                logging.debug('Cannot write "%s": %s', self.path, error)
+
+        for line in lines:
+            try:
+                uri, mtime, content_type = line.split("\t")
+                self.failures.add((uri, int(mtime), content_type))
+            except ValueError:
+                continue
+
+        return self.failures
+
+
+thumbnail_failures = ThumbnailFailures()
+
+
+def get_thumbnail_factory(
+    size: GnomeDesktop.DesktopThumbnailSize = GnomeDesktop.DesktopThumbnailSize.LARGE,
+) -> GnomeDesktop.DesktopThumbnailFactory:
+    """Gets the thumbnail factory for `size`, shared by the whole app."""
+    with _factories_lock:
+        if not (factory := _factories.get(size)):
+            factory = _factories[size] = GnomeDesktop.DesktopThumbnailFactory.new(size)
+
+        return factory
+
+
+def get_texture_size(pixels: int) -> int:
+    """Gets the size to decode textures at for display at `pixels` device pixels."""
+    return next((size for size in TEXTURE_SIZES if size >= pixels), TEXTURE_SIZES[-1])
+
+
+def load_thumbnail(
+    path: str, uri: str, mtime: Optional[int] = None, size: Optional[int] = None
+) -> Optional[Gdk.Texture]:
+    """
+    Loads the thumbnail at `path` for the file at `uri` modified at `mtime`.
+
+    If `size` is given, larger thumbnails are scaled down to fit in it while decoding.
+    Decoded thumbnails are kept in `texture_cache`.
+    """
+    if texture := texture_cache.get((uri, mtime, size)):
+        return texture
+
+    try:
+        if size and max(GdkPixbuf.Pixbuf.get_file_info(path)[1:]) > size:
+            texture = Gdk.Texture.new_for_pixbuf(
+                GdkPixbuf.Pixbuf.new_from_file_at_size(path, size, size)
+            )
+        else:
+            texture = Gdk.Texture.new_from_filename(path)
+    except (GLib.Error, TypeError):
+        return None
+
+    texture_cache.add((uri, mtime, size), texture)
+    return texture
+
 
 def generate_thumbnail(
-    gfile: Gio.File, content_type: str, callback: Callable, *args: Any
+    gfile: Gio.File,
+    content_type: str,
+    callback: Callable,
+    *args: Any,
+    mtime: Optional[int] = None,
+    size: Optional[int] = None,
 ) -> None:
     """
     Generates a thumbnail and passes it to `callback` as a `Gdk.Texture` with any additional args.
 
     If the thumbnail generation fails, `callback` is called with None and *args.
+    Pass `mtime` if the modification time of `gfile` is already known
+    and `size` to scale the texture down to fit in it.
     """
-    factory = GnomeDesktop.DesktopThumbnailFactory.new(
-        GnomeDesktop.DesktopThumbnailSize.LARGE
-    )
+    factory = get_thumbnail_factory()
     uri = gfile.get_uri()
 
-    try:
-        mtime = (
-            gfile.query_info(
-                Gio.FILE_ATTRIBUTE_TIME_MODIFIED, Gio.FileQueryInfoFlags.NONE
+    if mtime is None:
+        try:
+            mtime = (
+                gfile.query_info(
+                    Gio.FILE_ATTRIBUTE_TIME_MODIFIED, Gio.FileQueryInfoFlags.NONE
+                )
+                .get_modification_date_time()
+                .to_unix()
             )
-            .get_modification_date_time()
-            .to_unix()
-        )
-    except (GLib.Error, AttributeError):
+        except (GLib.Error, AttributeError):
+            callback(None, *args)
+            return
+
+    # It may have been generated for another request in the meantime
+    if texture := texture_cache.get((uri, mtime, size)):
+        callback(texture, *args)
+        return
+
+    # Or for another size
+    if (path := factory.lookup(uri, mtime)) and (
+        texture := load_thumbnail(path, uri, mtime, size)
+    ):
+        callback(texture, *args)
+        return
+
+    if thumbnail_failures.is_known(uri, mtime, content_type):
         callback(None, *args)
         return
 
+    # This is cheap, so only actual failures to generate thumbnails are recorded
     if not factory.can_thumbnail(uri, content_type, mtime):
         callback(None, *args)
         return
@@ -80,6 +311,7 @@ def generate_thumbnail(
                 ):
                     factory.create_failed_thumbnail(uri, mtime)
                     factory.create_failed_thumbnail(target_uri, mtime)
+                    thumbnail_failures.add(uri, mtime, content_type)
                 return
 
         try:
@@ -91,11 +323,111 @@ def generate_thumbnail(
             logging.debug("Cannot thumbnail: %s", error)
             callback(None, *args)
             factory.create_failed_thumbnail(uri, mtime)
+            thumbnail_failures.add(uri, mtime, content_type)
             return
 
     if not thumbnail:
+        thumbnail_failures.add(uri, mtime, content_type)
         callback(None, *args)
         return
 
     factory.save_thumbnail(thumbnail, uri, mtime)
-    callback(Gdk.Texture.new_for_pixbuf(thumbnail), *args)
+
+    if size and (longest := max(thumbnail.get_width(), thumbnail.get_height())) > size:
+        thumbnail = thumbnail.scale_simple(
+            max(1, thumbnail.get_width() * size // longest),
+            max(1, thumbnail.get_height() * size // longest),
+            GdkPixbuf.InterpType.BILINEAR,
+        )
+
+    texture = Gdk.Texture.new_for_pixbuf(thumbnail)
+    texture_cache.add((uri, mtime, size), texture)
+    callback(texture, *args)
+
+
+class ThumbnailScheduler:
+    """
+    Generates thumbnails on a fixed number of threads.
+
+    Among requests of the same priority, the most recent ones are handled first
+    since those are for the items that were scrolled into view last.
+    """
+
+    queue: list[tuple[int, int, tuple]]
+    n_workers: int = 0
+
+    def __init__(self) -> None:
+        self.queue = []
+        self.condition = Condition()
+        self.serials = count()
+
+    def request(
+        self,
+        gfile: Gio.File,
+        content_type: str,
+        callback: Callable,
+        *args: Any,
+        cancellable: Optional[Gio.Cancellable] = None,
+        priority: int = GLib.PRIORITY_DEFAULT,
+        mtime: Optional[int] = None,
+        size: Optional[int] = None,
+    ) -> None:
+        """
+        Queues a thumbnail to be generated like with `generate_thumbnail`.
+
+        `callback` is called on the main thread, unless `cancellable` is cancelled
+        before that, in which case the thumbnail may not be generated at all.
+        Lower values of `priority` are handled first.
+        """
+        with self.condition:
+            heappush(
+                self.queue,
+                (
+                    priority,
+                    -next(self.serials),
+                    (gfile, content_type, callback, args, cancellable, mtime, size),
+                ),
+            )
+
+            if self.n_workers < MAX_WORKERS:
+                self.n_workers += 1
+                GLib.Thread.new(None, self.__work)
+
+            self.condition.notify()
+
+    def __work(self) -> None:
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.queue)
+                *_order, job = heappop(self.queue)
+
+            gfile, content_type, callback, args, cancellable, mtime, size = job
+
+            if cancellable and cancellable.is_cancelled():
+                continue
+
+            generate_thumbnail(
+                gfile,
+                content_type,
+                lambda texture: GLib.idle_add(
+                    self.__deliver, texture, callback, args, cancellable
+                ),
+                mtime=mtime,
+                size=size,
+            )
+
+    def __deliver(
+        self,
+        texture: Optional[Gdk.Texture],
+        callback: Callable,
+        args: tuple,
+        cancellable: Optional[Gio.Cancellable],
+    ) -> None:
+        # Items are recycled, so the result must not reach one that was rebound since
+        if cancellable and cancellable.is_cancelled():
+            return
+
+        callback(texture, *args)
+
+
+thumbnail_scheduler = ThumbnailScheduler()
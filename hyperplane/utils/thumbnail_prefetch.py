@@ -0,0 +1,233 @@
+# thumbnail_prefetch.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Generation of thumbnails for items that are about to be scrolled into view.
+
+The position of the items on screen is estimated from the scroll adjustment,
+so this works the same for grids and lists without knowing their layout.
+Generated thumbnails end up in `texture_cache`, where items find them once bound.
+"""
+from collections import deque
+from math import ceil
+from time import monotonic
+from typing import Any, Optional
+
+from gi.repository import Gio, GLib, Gtk
+
+from hyperplane import shared
+from hyperplane.utils.detail_loader import PENDING_DETAILS
+from hyperplane.utils.thumbnail import (
+    MAX_CACHE_BYTES,
+    texture_cache,
+    thumbnail_scheduler,
+)
+
+# Milliseconds between two looks at the scroll position
+UPDATE_INTERVAL = 100
+# How far ahead to look, in seconds of scrolling at the current speed
+LOOKAHEAD = 1.0
+# The most screens to look ahead, however fast the scrolling
+MAX_SCREENS = 4
+# The size of a large thumbnail in memory
+THUMBNAIL_BYTES = 256 * 256 * 4
+
+
+class ThumbnailPrefetcher:
+    """
+    Queues thumbnails for the items of `model` about to be scrolled into view
+    in `scrolled_window` at a low priority.
+
+    How many thumbnails are generated ahead is bound by the `thumbnail-prefetch-memory`
+    setting in MiB, and how many are generated at once by `thumbnail-prefetch-jobs`.
+    """
+
+    scrolled_window: Gtk.ScrolledWindow
+    model: Gio.ListModel
+    cancellable: Gio.Cancellable
+
+    active: bool = False
+    source: Optional[int] = None
+    # The size items currently decode thumbnails at
+    texture_size: Optional[int] = None
+
+    pending: deque[Gio.FileInfo]
+    in_flight: int = 0
+    # The range of positions the current queue was built for
+    queued: tuple[int, int] = (0, 0)
+
+    last_value: float = 0
+    last_time: float = 0
+    velocity: float = 0
+
+    def __init__(self, scrolled_window: Gtk.ScrolledWindow, model: Gio.ListModel):
+        self.scrolled_window = scrolled_window
+        self.model = model
+        self.cancellable = Gio.Cancellable.new()
+        self.pending = deque()
+
+        adjustment = scrolled_window.get_vadjustment()
+        adjustment.connect("value-changed", self.__schedule)
+        adjustment.connect("changed", self.__schedule)
+        model.connect("items-changed", self.__items_changed)
+
+    def set_active(self, active: bool) -> None:
+        """Sets whether to prefetch, which should only be done while visible."""
+        if active == self.active:
+            return
+
+        self.active = active
+
+        if active:
+            self.__schedule()
+            return
+
+        # Stop queued and running jobs
+        self.cancellable.cancel()
+        self.cancellable = Gio.Cancellable.new()
+        self.pending.clear()
+        self.in_flight = 0
+        self.queued = (0, 0)
+
+        if self.source:
+            GLib.source_remove(self.source)
+            self.source = None
+
+    def __items_changed(self, *_args: Any) -> None:
+        # Positions now point to other items
+        self.queued = (0, 0)
+        self.__schedule()
+
+    def __schedule(self, *_args: Any) -> None:
+        if self.active and not self.source:
+            self.source = GLib.timeout_add(UPDATE_INTERVAL, self.__update)
+
+    def __update(self) -> None:
+        self.source = None
+
+        adjustment = self.scrolled_window.get_vadjustment()
+        value = adjustment.get_value()
+        now = monotonic()
+
+        if self.last_time:
+            self.velocity = (value - self.last_value) / (now - self.last_time)
+
+        self.last_value = value
+        self.last_time = now
+
+        if not (
+            (n_items := self.model.get_n_items())
+            and (upper := adjustment.get_upper()) > 0
+            and (page_size := adjustment.get_page_size()) > 0
+        ):
+            return
+
+        # Leave room in the cache for the thumbnails on screen
+        if not (
+            max_items := min(
+                shared.schema.get_uint("thumbnail-prefetch-memory") * 1024 * 1024,
+                MAX_CACHE_BYTES // 2,
+            )
+            // THUMBNAIL_BYTES
+        ):
+            return
+
+        # The items per pixel are assumed to be the same all the way down
+        first = int(value / upper * n_items)
+        visible = max(1, ceil(page_size / upper * n_items))
+
+        screens = min(MAX_SCREENS, 1 + abs(self.velocity) * LOOKAHEAD / page_size)
+        count = min(max_items, int(visible * screens))
+
+        if self.velocity < 0:
+            start, end = max(0, first - count), first
+        else:
+            start, end = first + visible, min(n_items, first + visible + count)
+
+        # Still within what was queued last time
+        if self.queued[0] <= start and end <= self.queued[1]:
+            return
+
+        self.queued = (start, end)
+
+        positions = range(start, end)
+        if self.velocity < 0:
+            # Closest to the screen first
+            positions = reversed(positions)
+
+        self.pending = deque(
+            file_info
+            for position in positions
+            if (file_info := self.model.get_item(position))
+            and self.__needs_thumbnail(file_info)
+        )
+
+        self.__feed()
+
+    def __feed(self) -> None:
+        jobs = shared.schema.get_uint("thumbnail-prefetch-jobs")
+
+        while self.pending and self.in_flight < jobs:
+            file_info = self.pending.popleft()
+
+            self.in_flight += 1
+            thumbnail_scheduler.request(
+                file_info.get_attribute_object("standard::file"),
+                file_info.get_content_type(),
+                self.__done,
+                cancellable=self.cancellable,
+                priority=GLib.PRIORITY_LOW,
+                mtime=file_info.get_attribute_uint64(Gio.FILE_ATTRIBUTE_TIME_MODIFIED)
+                or None,
+                size=self.texture_size,
+            )
+
+    def __done(self, *_args: Any) -> None:
+        # Not called for jobs from before prefetching was stopped
+        self.in_flight -= 1
+        self.__feed()
+
+    def __needs_thumbnail(self, file_info: Gio.FileInfo) -> bool:
+        # Details of items on network shares are not loaded yet
+        if file_info.get_attribute_boolean(PENDING_DETAILS):
+            return False
+
+        if (
+            not (content_type := file_info.get_content_type())
+        ) or content_type == "inode/directory":
+            return False
+
+        # Items load thumbnails that already exist themselves
+        if file_info.get_attribute_byte_string(Gio.FILE_ATTRIBUTE_THUMBNAIL_PATH):
+            return False
+
+        if (
+            file_info.get_attribute_uint32(Gio.FILE_ATTRIBUTE_FILESYSTEM_USE_PREVIEW)
+            == Gio.FilesystemPreviewType.NEVER
+        ):
+            return False
+
+        return not texture_cache.get(
+            (
+                file_info.get_attribute_object("standard::file").get_uri(),
+                file_info.get_attribute_uint64(Gio.FILE_ATTRIBUTE_TIME_MODIFIED)
+                or None,
+                self.texture_size,
+            )
+        )
@@ -0,0 +1,284 @@
+# trash.py
+#
+# Copyright 2023-2024 kramo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Trashing files and finding them in the trash again,
+following the FreeDesktop.org trash specification.
+
+Local files on the same file system as the home trash are trashed
+by writing their .trashinfo file and renaming them into the trash ourselves,
+so the name they get there is known and they can be restored directly.
+Other files are trashed through Gio. Those in the home trash are found again
+with an index built in a single pass over its .trashinfo files.
+"""
+import logging
+import os
+from datetime import datetime
+from itertools import count
+from os import PathLike, fspath, getenv
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Callable, Iterable, NamedTuple, Optional
+from urllib.parse import quote, unquote
+
+from gi.repository import Gio, GLib
+
+# Files trashed between two updates on the main thread
+TRASH_BATCH = 256
+# Seconds the deletion date written by Gio can be off from when it was recorded
+MAX_TIME_DIFFERENCE = 2
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+class TrashedFile(NamedTuple):
+    """A file moved to the trash from `orig_path` at `deletion_time`."""
+
+    orig_path: Path
+    deletion_time: int
+    # The name of the file in the home trash if it is known
+    name: Optional[str]
+
+
+def get_trash_path() -> Path:
+    """Gets the path of the home trash."""
+    return (
+        Path(getenv("HOST_XDG_DATA_HOME", str(Path.home() / ".local" / "share")))
+        / "Trash"
+    )
+
+
+def trash_files(
+    gfiles: Iterable[Gio.File],
+    callback: Callable[[list[TrashedFile]], None],
+    done: Optional[Callable[[list[Gio.File]], None]] = None,
+) -> None:
+    """
+    Trashes `gfiles` on a separate thread.
+
+    `callback` is called on the main thread with each batch of files
+    that were trashed successfully, and `done` after the last one
+    with the files that could not be trashed.
+    Files without a path are trashed but not passed to `callback`.
+    """
+    gfiles = tuple(gfiles)
+
+    def run() -> None:
+        trash_path = get_trash_path()
+
+        try:
+            for child in ("files", "info"):
+                (trash_path / child).mkdir(mode=0o700, parents=True, exist_ok=True)
+
+            device = os.stat(trash_path).st_dev
+        except OSError as error:
+            logging.debug('Cannot use trash "%s": %s', trash_path, error)
+            device = None
+
+        batch = []
+        failed = []
+        for gfile in gfiles:
+            try:
+                if trashed := __trash_file(gfile, trash_path, device):
+                    batch.append(trashed)
+            except (GLib.Error, OSError) as error:
+                logging.error('Cannot trash "%s": %s', gfile.get_uri(), error)
+                failed.append(gfile)
+
+            if len(batch) >= TRASH_BATCH:
+                GLib.idle_add(callback, batch)
+                batch = []
+
+        if batch:
+            GLib.idle_add(callback, batch)
+
+        if done:
+            GLib.idle_add(done, failed)
+
+    GLib.Thread.new(None, run)
+
+
+def find_trashed(
+    orig_path: PathLike | str, deletion_time: int, name: Optional[str] = None
+) -> Optional[str]:
+    """
+    Gets the name in the home trash of the file trashed from `orig_path`
+    at `deletion_time`, or None if it is not there.
+
+    `name` is checked first if it is known.
+    """
+    orig_path = fspath(orig_path)
+
+    if name:
+        if (
+            info := trash_index.read_trashinfo(
+                get_trash_path() / "info" / f"{name}.trashinfo"
+            )
+        ) and info[0] == orig_path:
+            return name
+
+        logging.debug('Trashed file "%s" was not found by its name', orig_path)
+
+    return trash_index.lookup(orig_path, deletion_time)
+
+
+class TrashIndex:
+    """
+    The files in the home trash by their original path,
+    read from their .trashinfo files.
+
+    It is read again on lookups whenever the files in the trash changed since.
+    """
+
+    lock: Lock
+    mtime: Optional[int] = None
+    entries: dict[str, list[tuple[float, str]]]
+
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.entries = {}
+
+    def lookup(self, orig_path: PathLike | str, deletion_time: int) -> Optional[str]:
+        """
+        Gets the name of the file trashed from `orig_path` closest to `deletion_time`,
+        or None if there is none.
+        """
+        with self.lock:
+            self.__update()
+            candidates = self.entries.get(fspath(orig_path), ())
+
+        difference, name = min(
+            ((abs(t - deletion_time), name) for t, name in candidates),
+            default=(None, None),
+        )
+
+        if difference is None or difference > MAX_TIME_DIFFERENCE:
+            return None
+
+        return name
+
+    def read_trashinfo(self, path: PathLike | str) -> Optional[tuple[str, float]]:
+        """Reads the original path and deletion time from the .trashinfo file at `path`."""
+        orig_path = deletion_time = None
+
+        try:
+            with open(path, "r", encoding="utf-8") as trashinfo:
+                for line in trashinfo:
+                    key, _sep, value = line.rstrip("\n").partition("=")
+
+                    match key:
+                        case "Path":
+                            orig_path = unquote(value)
+                        case "DeletionDate":
+                            deletion_time = datetime.fromisoformat(value).timestamp()
+        except (OSError, ValueError) as error:
+            logging.debug('Cannot read trashinfo "%s": %s', path, error)
+            return None
+
+        if orig_path is None or deletion_time is None:
+            return None
+
+        return orig_path, deletion_time
+
+    def __update(self) -> None:
+        info_path = get_trash_path() / "info"
+
+        # Entries are only added or removed, which changes the time
+        try:
+            mtime = os.stat(info_path).st_mtime_ns
+        except OSError:
+            self.entries = {}
+            self.mtime = None
+            return
+
+        if mtime == self.mtime:
+            return
+
+        entries = {}
+
+        with os.scandir(info_path) as infos:
+            for entry in infos:
+                if not entry.name.endswith(".trashinfo"):
+                    continue
+
+                if not (info := self.read_trashinfo(entry.path)):
+                    continue
+
+                entries.setdefault(info[0], []).append(
+                    (info[1], entry.name.removesuffix(".trashinfo"))
+                )
+
+        self.entries = entries
+        self.mtime = mtime
+
+
+trash_index = TrashIndex()
+
+
+def __trash_file(
+    gfile: Gio.File, trash_path: Path, device: Optional[int]
+) -> Optional[TrashedFile]:
+    path = gfile.get_path()
+
+    try:
+        if path and device is not None and os.lstat(path).st_dev == device:
+            return __move_to_trash(Path(os.path.abspath(path)), trash_path)
+    except OSError as error:
+        # Renaming can still fail, like across bind mounts of the same device
+        logging.debug('Cannot move "%s" to trash, trying Gio: %s', path, error)
+
+    deletion_time = int(time())
+    gfile.trash()
+
+    return TrashedFile(Path(path), deletion_time, None) if path else None
+
+
+def __move_to_trash(path: Path, trash_path: Path) -> TrashedFile:
+    deletion_time = int(time())
+    contents = (
+        "[Trash Info]\n"
+        f"Path={quote(str(path))}\n"
+        f"DeletionDate={datetime.fromtimestamp(deletion_time).strftime(DATE_FORMAT)}\n"
+    )
+
+    for n in count(1):
+        name = path.name if n == 1 else f"{path.stem}.{n}{path.suffix}"
+        info_path = trash_path / "info" / f"{name}.trashinfo"
+        files_path = trash_path / "files" / name
+
+        # Claim the name by creating the .trashinfo file, as Gio does
+        try:
+            info_fd = os.open(info_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            continue
+
+        try:
+            with os.fdopen(info_fd, "w", encoding="utf-8") as trashinfo:
+                trashinfo.write(contents)
+
+            if os.path.lexists(files_path):
+                os.unlink(info_path)
+                continue
+
+            os.rename(path, files_path)
+        except BaseException:
+            os.unlink(info_path)
+            raise
+
+        return TrashedFile(path, deletion_time, name)
@@ -65,7 +65,9 @@ def undo(obj: Any, *_args: Any) -> None:
 
         case "trash":
             for trash_item in item[1]:
-                restore(*trash_item)
+                restore(
+                    trash_item.orig_path, trash_item.deletion_time, name=trash_item.name
+                )
 
     if isinstance(index, Adw.Toast):
         index.dismiss()
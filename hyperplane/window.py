@@ -30,6 +30,7 @@ from hyperplane.editable_row import HypEditableRow
 from hyperplane.file_properties import SpecialUris
 from hyperplane.items_page import HypItemsPage
 from hyperplane.navigation_bin import HypNavigationBin
+from hyperplane.operations_button import HypOperationsButton
 from hyperplane.path_bar import HypPathBar
 from hyperplane.path_entry import HypPathEntry
 from hyperplane.properties import HypPropertiesDialog
@@ -47,9 +48,16 @@ from hyperplane.utils.files import (
     validate_name,
 )
 from hyperplane.utils.tags import add_tags, move_tag, remove_tags
+from hyperplane.utils.trash import TrashedFile
 from hyperplane.utils.undo import undo
 from hyperplane.volumes_box import HypVolumesBox
 
+# Milliseconds to wait after typing before searching, the same as GTK's default
+SEARCH_DELAY = 150
+# Filtering a large folder takes long enough to be worth waiting out bursts of typing
+LARGE_SEARCH_DELAY = 300
+LARGE_FOLDER_ITEMS = 10000
+
 
 @Gtk.Template(resource_path=shared.PREFIX + "/gtk/window.ui")
 class HypWindow(Adw.ApplicationWindow):
@@ -84,6 +92,7 @@ class HypWindow(Adw.ApplicationWindow):
     search_entry_clamp: Adw.Clamp = Gtk.Template.Child()
     search_entry: Gtk.SearchEntry = Gtk.Template.Child()
     search_button: Gtk.ToggleButton = Gtk.Template.Child()
+    operations_button: HypOperationsButton = Gtk.Template.Child()
     header_bar_view_button: Gtk.Button = Gtk.Template.Child()
     action_bar_view_button: Gtk.Button = Gtk.Template.Child()
 
@@ -119,6 +128,7 @@ class HypWindow(Adw.ApplicationWindow):
 
         self.tab_view.connect("page-attached", self.__page_attached)
         self.tab_view.connect("close-page", self.__close_page)
+        self.connect("close-request", self.__close_request)
         self.closed_tabs = []
 
         # Set up animations
@@ -165,6 +175,9 @@ class HypWindow(Adw.ApplicationWindow):
         self.create_action("close", self.__close, ("<primary>w",))
         self.create_action("reopen-tab", self.__reopen_tab, ("<primary><shift>t",))
         self.create_action("search", self.__toggle_search_entry, ("<primary>f",))
+        self.create_action(
+            "search-subfolders", self.__search_subfolders, ("<primary><shift>f",)
+        )
 
         self.create_action("back", self.__back)
         self.lookup_action("back").set_enabled(False)
@@ -536,7 +549,7 @@ class HypWindow(Adw.ApplicationWindow):
 
     def __navigation_changed(self, view: Adw.NavigationView, *_args: Any) -> None:
         self.__hide_search_entry()
-        view.get_visible_page().item_filter.changed(Gtk.FilterChange.LESS_STRICT)
+        view.get_visible_page().item_filter.set_search(shared.search)
 
         title = view.get_visible_page().get_title()
 
@@ -558,6 +571,7 @@ class HypWindow(Adw.ApplicationWindow):
         # Regardless, this still works since the default handler does what I want anyway
         child = page.get_child()
         child.unparent()
+        child.close()
         self.closed_tabs.append((child, page.get_title()))
 
     def __reopen_tab(self, *_args: Any) -> None:
@@ -565,8 +579,16 @@ class HypWindow(Adw.ApplicationWindow):
             page, title = self.closed_tabs.pop()
         except IndexError:
             return
+        page.reopen()
         self.tab_view.append(page).set_title(title)
 
+    def __close_request(self, *_args: Any) -> bool:
+        # Closed tabs released theirs already
+        for index in range(self.tab_view.get_n_pages()):
+            self.tab_view.get_nth_page(index).get_child().close()
+
+        return False
+
     def __title_stack_set_child(self, new: Gtk.Widget) -> None:
         old = self.title_stack.get_visible_child()
         if old == new:
@@ -579,7 +601,7 @@ class HypWindow(Adw.ApplicationWindow):
                 self.search_button.set_active(False)
                 self.search_entry.set_text("")
                 shared.search = ""
-                self.searched_page.item_filter.changed(Gtk.FilterChange.LESS_STRICT)
+                self.searched_page.item_filter.set_search("")
             case self.path_entry_clamp:
                 if self.path_entry_connection:
                     self.path_entry.disconnect(self.path_entry_connection)
@@ -590,6 +612,13 @@ class HypWindow(Adw.ApplicationWindow):
                 self.search_button.set_active(True)
                 self.searched_page = self.get_visible_page()
 
+                # Wait for bursts of typing to end in large folders
+                self.search_entry.set_search_delay(
+                    LARGE_SEARCH_DELAY
+                    if self.searched_page.dir_list.get_n_items() > LARGE_FOLDER_ITEMS
+                    else SEARCH_DELAY
+                )
+
                 self.set_focus(self.search_entry)
             case self.path_entry_clamp:
                 page = self.get_visible_page()
@@ -622,9 +651,26 @@ class HypWindow(Adw.ApplicationWindow):
     def __search_activate(self, *_args: Any) -> None:
         self.get_visible_page().activate(None, 0)
 
+    def __search_subfolders(self, *_args: Any) -> None:
+        # Type what to search for first
+        if not (search := self.search_entry.get_text().strip()):
+            self.__show_search_entry()
+            return
+
+        page = self.get_visible_page()
+        self.new_page(gfile=page.gfile, tags=page.tags, search=search)
+
     def __search_changed(self, entry: Gtk.SearchEntry) -> None:
-        shared.search = entry.get_text().strip()
-        self.searched_page.item_filter.changed(Gtk.FilterChange.DIFFERENT)
+        shared.search = search = entry.get_text().strip()
+
+        # Search pages search again, cancelling the previous search
+        if self.searched_page.search and search:
+            if search.lower() != self.searched_page.search.lower():
+                self.searched_page.set_search(search)
+
+            return
+
+        self.searched_page.item_filter.set_search(search)
 
     def __hide_path_entry(self, *_args: Any) -> None:
         if self.title_stack.get_visible_child() != self.path_entry_clamp:
@@ -953,36 +999,56 @@ class HypWindow(Adw.ApplicationWindow):
     def trash_pretty(self, *gfiles: Gio.File) -> None:
         """Trashes `gfiles` with the trash animation and a toast."""
 
-        gfiles = list(gfiles)
-
-        files = []
-        n = 0
-        for gfile in gfiles.copy():
+        paths = []
+        for gfile in gfiles:
             try:
-                files.append((get_gfile_path(gfile), int(time())))
+                paths.append(get_gfile_path(gfile))
             except FileNotFoundError:
                 logging.debug(
                     'Should not trash "%s": File has no path.', gfile.get_uri()
                 )
-                gfiles.remove(gfile)
                 continue
 
-        if not gfiles:
+        if not paths:
             return
 
-        trash(*gfiles)
+        # Trash the files themselves, not their representation in locations like recent://
+        gfiles = [Gio.File.new_for_path(str(path)) for path in paths]
 
-        n = len(gfiles)
-        if n > 1:
-            message = _("{} files moved to trash").format(n)
-        else:
-            message = _("{} moved to trash").format(
-                f"“{get_gfile_display_name(gfiles[0])}”"
-            )
+        # The file will be gone by the time it is needed
+        display_name = get_gfile_display_name(gfiles[0]) if len(gfiles) == 1 else None
+
+        # Only offer to undo once every file is done to restore all of them
+        def trashed(files: list[TrashedFile], failed: list[Gio.File]) -> None:
+            if n := len(gfiles) - len(failed):
+                if n > 1:
+                    message = _("{} files moved to trash").format(n)
+                else:
+                    message = _("{} moved to trash").format(
+                        f"“{display_name or files[0].orig_path.name}”"
+                    )
+
+                toast = self.send_toast(message, do_undo=bool(files))
+
+                if files:
+                    shared.undo_queue[toast] = ("trash", files)
+                    toast.connect("button-clicked", undo)
+
+            if not failed:
+                return
+
+            if len(failed) > 1:
+                self.send_toast(
+                    _("{} files could not be moved to trash").format(len(failed))
+                )
+            else:
+                self.send_toast(
+                    _("{} could not be moved to trash").format(
+                        f"“{get_gfile_display_name(failed[0])}”"
+                    )
+                )
 
-        toast = self.send_toast(message, do_undo=True)
-        shared.undo_queue[toast] = ("trash", files)
-        toast.connect("button-clicked", undo)
+        trash(*gfiles, callback=trashed)
 
         self.trash_animation.play()
 